@@ -23,4 +23,4 @@ Contains modules for stand-up and execution of a PGE application.
 
 from .base_pge import PgeExecutor
 from .dswx_pge import DSWxExecutor
-from .runconfig import RunConfig
+from .runconfig import FrozenRunConfig, RunConfig
@@ -22,6 +22,8 @@ Module defining the Base PGE interfaces from which all other PGEs are derived.
 
 """
 
+import asyncio
+import functools
 import os
 import yaml
 
@@ -31,9 +33,23 @@ from yamale import YamaleError
 
 from .runconfig import RunConfig
 from opera.util.error_codes import ErrorCode
+from opera.util.log_sink import DEFAULT_FLUSH_INTERVAL
 from opera.util.logger import PgeLogger
+from opera.util.metrics import timed_stage
+from opera.util.result_cache import changed_files
+from opera.util.result_cache import snapshot_directory
 from opera.util.run_utils import create_sas_command_line
+from opera.util.run_utils import create_sas_environment
 from opera.util.run_utils import time_and_execute
+from opera.util.run_utils import time_and_execute_async
+from opera.util.trace import trace_span
+
+# Use the libyaml-based (C) dumper when PyYAML has been built with libyaml, as
+# it is considerably faster when writing the isolated SAS RunConfig.
+try:
+    from yaml import CSafeDumper as YamlDumper
+except ImportError:  # PyYAML was built without libyaml
+    from yaml import SafeDumper as YamlDumper
 
 
 class PreProcessorMixin:
@@ -57,7 +73,9 @@ class PreProcessorMixin:
         self.logger = None
         self.name = None
         self.runconfig_path = None
+        self.runconfig = None
 
+    @timed_stage()
     def _initialize_logger(self):
         """
         Creates the logger object used by the PGE.
@@ -74,19 +92,31 @@ class PreProcessorMixin:
             self.logger.info(self.name, ErrorCode.LOG_FILE_CREATED,
                              f'Log file passed from pge_main: {self.logger.get_file_name()}')
 
+    @timed_stage()
     def _load_runconfig(self):
         """
         Loads the RunConfig file provided to the PGE into an in-memory
         representation.
         """
+        # The RunConfig may have already been loaded by the caller (pge_main),
+        # in which case it is reused rather than parsed again
+        if self.runconfig is not None:
+            self.logger.info(self.name, ErrorCode.LOADING_RUN_CONFIG_FILE,
+                             f'Using RunConfig file {self.runconfig.filename} '
+                             f'loaded by the caller')
+            return
+
         self.logger.info(self.name, ErrorCode.LOADING_RUN_CONFIG_FILE,
                          f'Loading RunConfig file {self.runconfig_path}')
 
         self.runconfig = RunConfig(self.runconfig_path)
 
+    @timed_stage()
     def _validate_runconfig(self):
         """
-        Validates the parsed RunConfig against the appropriate schema(s).
+        Validates the parsed RunConfig against the appropriate schema(s), then
+        replaces it with a frozen snapshot (see RunConfig.freeze()), so each
+        field of the RunConfig is looked up only once.
 
         Raises
         ------
@@ -107,6 +137,16 @@ class PreProcessorMixin:
                 self.name, ErrorCode.RUN_CONFIG_VALIDATION_FAILED, error_msg
             )
 
+        try:
+            self.runconfig = self.runconfig.freeze()
+        except RuntimeError as error:
+            self.logger.critical(
+                self.name, ErrorCode.RUN_CONFIG_VALIDATION_FAILED,
+                f'Validation of RunConfig file {self.runconfig.filename} failed, '
+                f'reason: {str(error)}'
+            )
+
+    @timed_stage()
     def _setup_directories(self):
         """
         Creates the output/scratch directory locations referenced by the
@@ -137,6 +177,7 @@ class PreProcessorMixin:
                 self.name, ErrorCode.DIRECTORY_CREATION_FAILED, error_msg
             )
 
+    @timed_stage()
     def _configure_logger(self):
         """
         Configures the logger used by the PGE using information from the
@@ -146,6 +187,22 @@ class PreProcessorMixin:
 
         self.logger.workflow = f'{self.runconfig.pge_name}::{basename(__file__)}'
 
+        # Debug messages are discarded, unformatted, unless requested
+        self.logger.level = 'Debug' if self.runconfig.debug_switch else 'Info'
+
+        # Should the log grow beyond the configured in-memory size, spill it
+        # to the scratch directory rather than the system temp directory
+        self.logger.spill_dir = abspath(self.runconfig.scratch_path)
+
+        if self.runconfig.log_max_memory_size is not None:
+            self.logger.max_memory_size = self.runconfig.log_max_memory_size
+
+        if self.runconfig.log_location_mode is not None:
+            self.logger.location_mode = self.runconfig.log_location_mode
+
+        if self.runconfig.log_compression is not None:
+            self.logger.compression = self.runconfig.log_compression
+
         # TODO: perform the log rename step here (if possible) once file-name convention is defined
         output_product_path = abspath(self.runconfig.output_product_path)
         log_file_destination = join(output_product_path, self.logger.get_file_name())
@@ -154,6 +211,18 @@ class PreProcessorMixin:
                          f'Moving log file to {log_file_destination}')
         self.logger.move(log_file_destination)
 
+        # Mirror the log to a journal alongside its final destination, so it
+        # survives should the PGE be killed before the log is finalized
+        if self.runconfig.log_write_behind:
+            flush_interval = self.runconfig.log_journal_flush_interval
+
+            self.logger.enable_write_behind(
+                flush_interval=flush_interval if flush_interval is not None else DEFAULT_FLUSH_INTERVAL
+            )
+
+        if self.runconfig.log_json_lines:
+            self.logger.enable_json_lines()
+
         self.logger.info(self.name, ErrorCode.LOG_FILE_INIT_COMPLETE,
                          f'Log file configuration complete')
 
@@ -201,18 +270,22 @@ class PostProcessorMixin:
         self.name = None
         self.logger = None
 
+    @timed_stage()
     def _run_sas_qa_executable(self):
         # TODO
         pass
 
+    @timed_stage()
     def _create_catalog_metadata(self):
         # TODO
         pass
 
+    @timed_stage()
     def _create_iso_metadata(self):
         # TODO
         pass
 
+    @timed_stage()
     def _stage_output_files(self):
         # TODO
         pass
@@ -285,6 +358,20 @@ class PgeExecutor(PreProcessorMixin, PostProcessorMixin):
             supported kwargs include:
                 - logger : An existing instance of PgeLogger for this PgeExecutor
                            to use, rather than creating its own.
+                - warm_worker : If True, SAS programs which are Python modules
+                                are run in a child forked from the current
+                                process, rather than a new interpreter. See
+                                opera.util.run_utils.time_and_execute().
+                - result_cache : An instance of SasResultCache used to restore
+                                 the outputs of a previous, identical SAS
+                                 execution in place of running the SAS. If not
+                                 provided, the SAS is always executed.
+                - trace : An instance of TraceRecorder to record spans of each
+                          phase and step of the PGE, and of the SAS subprocess,
+                          into. If not provided, no trace is recorded.
+                - runconfig : An instance of RunConfig already loaded from
+                              runconfig_path, such as by pge_main, to use
+                              rather than parsing the RunConfig file again.
 
         """
 
@@ -293,8 +380,11 @@ class PgeExecutor(PreProcessorMixin, PostProcessorMixin):
         self.name = self.NAME
         self.pge_name = pge_name
         self.runconfig_path = runconfig_path
-        self.runconfig = None
+        self.runconfig = kwargs.get('runconfig')
         self.logger = kwargs.get('logger')
+        self.warm_worker = kwargs.get('warm_worker', False)
+        self.result_cache = kwargs.get('result_cache')
+        self.trace = kwargs.get('trace')
 
     def _isolate_sas_runconfig(self):
         """
@@ -313,7 +403,7 @@ class PgeExecutor(PreProcessorMixin, PostProcessorMixin):
 
         try:
             with open(sas_runconfig_filepath, 'w') as outfile:
-                yaml.safe_dump(sas_config, outfile, sort_keys=False)
+                yaml.dump(sas_config, outfile, Dumper=YamlDumper, sort_keys=False)
         except OSError as err:
             self.logger.critical(self.name, ErrorCode.SAS_CONFIG_CREATION_FAILED,
                                  f'Failed to create SAS config file {sas_runconfig_filepath}, '
@@ -324,17 +414,194 @@ class PgeExecutor(PreProcessorMixin, PostProcessorMixin):
 
         return sas_runconfig_filepath
 
-    def run_sas_executable(self, **kwargs):
+    def _configure_sas_placement(self):
         """
-        Kicks off a SAS executable as defined by the RunConfig provided to
-        the PGE.
+        Determines the thread count and CPU affinity to execute the SAS with,
+        based on the ProcessingResourcesGroup of the RunConfig, and logs the
+        chosen placement.
+
+        If only a CPU affinity is requested, the thread count defaults to the
+        number of CPUs the SAS is restricted to. Any requested CPUs that are
+        not available to the current process are dropped with a warning.
+
+        Returns
+        -------
+        env : dict
+            The environment variables to execute the SAS with.
+        cpu_affinity : set of int or None
+            The set of CPUs to restrict the SAS to, or None if the SAS should
+            inherit the affinity of the current process.
 
-        Execution time for the SAS is collected and logged by this method.
+        """
+        num_threads = self.runconfig.sas_num_threads
+        cpu_affinity = self.runconfig.sas_cpu_affinity
+
+        if cpu_affinity:
+            available_cpus = os.sched_getaffinity(0)
+            unavailable_cpus = sorted(set(cpu_affinity) - available_cpus)
+
+            if unavailable_cpus:
+                self.logger.warning(self.name, ErrorCode.CPU_AFFINITY_UNAVAILABLE,
+                                    f'Requested CPU(s) {unavailable_cpus} are not available '
+                                    f'to this process and will not be used by the SAS')
+
+            cpu_affinity = set(cpu_affinity) & available_cpus
+
+            if not cpu_affinity:
+                self.logger.critical(self.name, ErrorCode.INVALID_CPU_AFFINITY,
+                                     f'None of the requested CPU(s) {self.runconfig.sas_cpu_affinity} '
+                                     f'are available to this process (available: {sorted(available_cpus)})')
+
+            num_threads = num_threads or len(cpu_affinity)
+
+        self.logger.info(self.name, ErrorCode.SAS_PROCESS_PLACEMENT,
+                         f'SAS placement: threads={num_threads if num_threads else "default"}, '
+                         f'cpus={sorted(cpu_affinity) if cpu_affinity else "inherited"}')
+
+        return create_sas_environment(num_threads), cpu_affinity or None
+
+    def _compute_result_cache_key(self, sas_runconfig_filepath):
+        """
+        Computes the key identifying the current SAS execution within the
+        result cache, from the contents of the input and ancillary files, the
+        isolated SAS RunConfig, and the identity of the SAS program.
 
         Parameters
         ----------
-        kwargs : dict
-            Any keyword arguments needed for SAS execution.
+        sas_runconfig_filepath : str
+            Path to the isolated SAS RunConfig.
+
+        Returns
+        -------
+        cache_key : str or None
+            The result cache key, or None if no result cache is in use, or the
+            key could not be computed.
+
+        """
+        if not self.result_cache:
+            return None
+
+        input_paths = self.runconfig.input_files + self.runconfig.get_ancillary_filenames()
+
+        try:
+            return self.result_cache.compute_key(
+                input_paths, sas_runconfig_filepath,
+                self.runconfig.sas_program_path, self.runconfig.sas_program_options
+            )
+        except OSError as err:
+            self.logger.warning(self.name, ErrorCode.SAS_RESULT_CACHE_FAILED,
+                                f'Could not compute SAS result cache key, the result '
+                                f'cache will not be used, reason: {str(err)}')
+            return None
+
+    def _restore_cached_sas_results(self, cache_key):
+        """
+        Restores the SAS outputs cached for the provided key, if any, into the
+        output product directory.
+
+        Parameters
+        ----------
+        cache_key : str or None
+            The result cache key of the current SAS execution.
+
+        Returns
+        -------
+        restored : bool
+            True if cached outputs were restored, in which case the SAS does
+            not need to be executed, False otherwise.
+
+        """
+        if not cache_key:
+            return False
+
+        output_product_path = abspath(self.runconfig.output_product_path)
+
+        try:
+            restored_files = self.result_cache.restore(cache_key, output_product_path)
+        except (OSError, ValueError, KeyError) as err:
+            self.logger.warning(self.name, ErrorCode.SAS_RESULT_CACHE_FAILED,
+                                f'Could not restore cached SAS results for key {cache_key}, '
+                                f'reason: {str(err)}')
+            restored_files = None
+
+        if restored_files is None:
+            self.logger.log_one_metric(self.name, 'sas.result_cache.hit', 0)
+            self.logger.metrics.counter('sas.result_cache.misses').increment()
+            return False
+
+        self.logger.info(self.name, ErrorCode.SAS_RESULT_CACHE_HIT,
+                         f'Restored {len(restored_files)} cached SAS output file(s) to '
+                         f'{output_product_path} for key {cache_key}, skipping SAS execution')
+        self.logger.log_one_metric(self.name, 'sas.result_cache.hit', 1)
+        self.logger.metrics.counter('sas.result_cache.hits').increment()
+        self.logger.metrics.counter('sas.result_cache.restored_files').increment(len(restored_files))
+
+        return True
+
+    def _store_sas_results(self, cache_key, output_snapshot):
+        """
+        Stores the files written to the output product directory by the SAS
+        as the result cache entry for the provided key.
+
+        Parameters
+        ----------
+        cache_key : str or None
+            The result cache key of the current SAS execution.
+        output_snapshot : dict or None
+            Snapshot of the output product directory taken prior to SAS
+            execution, see opera.util.result_cache.snapshot_directory().
+
+        """
+        if not cache_key:
+            return
+
+        output_product_path = abspath(self.runconfig.output_product_path)
+
+        # Exclude files written by the PGE itself, such as resource samples,
+        # which are named after the (unique) log file
+        log_file_base = splitext(basename(self.logger.get_file_name()))[0]
+
+        try:
+            sas_output_files = [filename
+                                for filename in changed_files(output_product_path, output_snapshot)
+                                if not basename(filename).startswith(log_file_base)]
+
+            size_bytes = self.result_cache.store(cache_key, output_product_path, sas_output_files)
+        except (OSError, ValueError) as err:
+            self.logger.warning(self.name, ErrorCode.SAS_RESULT_CACHE_FAILED,
+                                f'Could not store SAS results for key {cache_key}, '
+                                f'reason: {str(err)}')
+            return
+
+        if size_bytes is None:
+            self.logger.debug(self.name, ErrorCode.PROCESSING_DETAILS,
+                              f'SAS output files for key {cache_key} exceed the size '
+                              f'budget of the result cache, and were not stored')
+            return
+
+        self.logger.metrics.counter('sas.result_cache.stored_bytes').increment(size_bytes)
+
+        self.logger.info(self.name, ErrorCode.SAS_RESULT_CACHE_STORED,
+                         f'Stored {len(sas_output_files)} SAS output file(s) '
+                         f'({size_bytes} bytes) in result cache for key {cache_key}')
+
+    def _prepare_sas_execution(self):
+        """
+        Performs the steps common to synchronous and asynchronous execution of
+        the SAS prior to its launch: isolation of the SAS RunConfig, creation
+        of the command line, configuration of the SAS placement, and
+        computation of the result cache key.
+
+        Returns
+        -------
+        command_line : list of str
+            The command line to execute the SAS with.
+        execution_kwargs : dict
+            Keyword arguments for time_and_execute()/time_and_execute_async()
+            derived from the RunConfig.
+        cache_key : str or None
+            The result cache key of the SAS execution, or None if no result
+            cache is in use.
 
         """
         sas_program_path = self.runconfig.sas_program_path
@@ -346,13 +613,57 @@ class PgeExecutor(PreProcessorMixin, PostProcessorMixin):
         )
 
         self.logger.debug(self.name, ErrorCode.SAS_EXE_COMMAND_LINE,
-                          f'SAS EXE command line: {" ".join(command_line)}')
+                          lambda: f'SAS EXE command line: {" ".join(command_line)}')
+
+        env, cpu_affinity = self._configure_sas_placement()
+
+        execution_kwargs = {
+            'execute_via_shell': self.runconfig.execute_via_shell,
+            'env': env,
+            'cpu_affinity': cpu_affinity,
+            'sample_interval': self.runconfig.resource_sampling_interval,
+            'timeout': self.runconfig.sas_timeout
+        }
+
+        if self.runconfig.sas_timeout_grace_period is not None:
+            execution_kwargs['grace_period'] = self.runconfig.sas_timeout_grace_period
+
+        cache_key = self._compute_result_cache_key(sas_runconfig_filepath)
+
+        return command_line, execution_kwargs, cache_key
+
+    def run_sas_executable(self, **kwargs):
+        """
+        Kicks off a SAS executable as defined by the RunConfig provided to
+        the PGE.
+
+        Execution time for the SAS is collected and logged by this method.
+
+        If a result cache is in use, and holds the outputs of an identical SAS
+        execution, those outputs are restored in place of executing the SAS.
+        Otherwise, the outputs of the SAS are added to the cache once it
+        completes successfully.
+
+        Parameters
+        ----------
+        kwargs : dict
+            Any keyword arguments needed for SAS execution.
+
+        """
+        with self.logger.metrics.timer('sas.preparation_seconds'):
+            command_line, execution_kwargs, cache_key = self._prepare_sas_execution()
+
+        if self._restore_cached_sas_results(cache_key):
+            return
+
+        output_snapshot = snapshot_directory(abspath(self.runconfig.output_product_path)) if cache_key else None
 
         self.logger.info(self.name, ErrorCode.SAS_PROGRAM_STARTING,
                          'Starting SAS executable')
 
         elapsed_time = time_and_execute(
-            command_line, self.logger, self.runconfig.execute_via_shell
+            command_line, self.logger, warm_worker=self.warm_worker, trace=self.trace,
+            **execution_kwargs
         )
 
         self.logger.info(self.name, ErrorCode.SAS_PROGRAM_COMPLETED,
@@ -360,6 +671,57 @@ class PgeExecutor(PreProcessorMixin, PostProcessorMixin):
 
         self.logger.log_one_metric(self.name, 'sas.elapsed_seconds', elapsed_time)
 
+        self._store_sas_results(cache_key, output_snapshot)
+
+    async def run_sas_executable_async(self, **kwargs):
+        """
+        Coroutine version of run_sas_executable(), which executes the SAS via
+        an asyncio subprocess, reading its output from the running event loop.
+        The blocking steps surrounding SAS execution, such as the hashing of
+        inputs for the result cache, are run from the default executor of the
+        event loop.
+
+        Parameters
+        ----------
+        kwargs : dict
+            Any keyword arguments needed for SAS execution.
+
+        """
+        loop = asyncio.get_running_loop()
+
+        # Preparation hashes the contents of every input file, and restoring,
+        # snapshotting and storing outputs all copy or walk the output
+        # directory, so each is run from the default executor to avoid
+        # blocking the event loop
+        with self.logger.metrics.timer('sas.preparation_seconds'):
+            command_line, execution_kwargs, cache_key = await loop.run_in_executor(
+                None, self._prepare_sas_execution
+            )
+
+        if await loop.run_in_executor(None, self._restore_cached_sas_results, cache_key):
+            return
+
+        output_snapshot = None
+
+        if cache_key:
+            output_snapshot = await loop.run_in_executor(
+                None, snapshot_directory, abspath(self.runconfig.output_product_path)
+            )
+
+        self.logger.info(self.name, ErrorCode.SAS_PROGRAM_STARTING,
+                         'Starting SAS executable')
+
+        elapsed_time = await time_and_execute_async(
+            command_line, self.logger, trace=self.trace, **execution_kwargs
+        )
+
+        self.logger.info(self.name, ErrorCode.SAS_PROGRAM_COMPLETED,
+                         'SAS executable complete')
+
+        self.logger.log_one_metric(self.name, 'sas.elapsed_seconds', elapsed_time)
+
+        await loop.run_in_executor(None, self._store_sas_results, cache_key, output_snapshot)
+
     def run(self, **kwargs):
         """
         Main entry point for PGE execution.
@@ -369,9 +731,41 @@ class PgeExecutor(PreProcessorMixin, PostProcessorMixin):
         the job.
 
         """
-        self.run_preprocessor(**kwargs)
+        with trace_span(self.trace, 'run', pge_name=self.pge_name,
+                        runconfig=basename(self.runconfig_path)):
+            with trace_span(self.trace, 'run_preprocessor'):
+                self.run_preprocessor(**kwargs)
+
+            print(f'Starting SAS execution for {self.__class__.__name__}')
+
+            with trace_span(self.trace, 'run_sas_executable'):
+                self.run_sas_executable(**kwargs)
+
+            with trace_span(self.trace, 'run_postprocessor'):
+                self.run_postprocessor(**kwargs)
+
+    async def run_async(self, **kwargs):
+        """
+        Coroutine version of run(), allowing a single asyncio event loop to
+        drive many concurrent PGE jobs.
+
+        The pre- and post-processing stages are comparatively short and
+        blocking, so they are awaited from the default executor of the event
+        loop, while the SAS itself is executed natively via an asyncio
+        subprocess (see run_sas_executable_async()).
+
+        """
+        loop = asyncio.get_running_loop()
+
+        with trace_span(self.trace, 'run_async', pge_name=self.pge_name,
+                        runconfig=basename(self.runconfig_path)):
+            with trace_span(self.trace, 'run_preprocessor'):
+                await loop.run_in_executor(None, functools.partial(self.run_preprocessor, **kwargs))
+
+            print(f'Starting SAS execution for {self.__class__.__name__}')
 
-        print(f'Starting SAS execution for {self.__class__.__name__}')
-        self.run_sas_executable(**kwargs)
+            with trace_span(self.trace, 'run_sas_executable'):
+                await self.run_sas_executable_async(**kwargs)
 
-        self.run_postprocessor(**kwargs)
+            with trace_span(self.trace, 'run_postprocessor'):
+                await loop.run_in_executor(None, functools.partial(self.run_postprocessor, **kwargs))
@@ -27,6 +27,7 @@ import os.path
 from os.path import abspath, exists, isdir, join
 
 from opera.util.error_codes import ErrorCode
+from opera.util.metrics import timed_stage
 
 from .base_pge import PgeExecutor
 from .base_pge import PostProcessorMixin
@@ -47,6 +48,7 @@ class DSWxPreProcessorMixin(PreProcessorMixin):
 
     _pre_mixin_name = "DSWxPreProcessorMixin"
 
+    @timed_stage()
     def _validate_inputs(self):
         """
         Evaluates the list of inputs from the RunConfig to ensure they are valid.
@@ -68,12 +70,16 @@ class DSWxPreProcessorMixin(PreProcessorMixin):
                     error_msg = f"Input directory {input_file_path} does not contain any tif files"
 
                     self.logger.critical(self.name, ErrorCode.INPUT_NOT_FOUND, error_msg)
+
+                self.logger.metrics.counter('input.tif_files').increment(len(list_of_input_tifs))
             else:
                 if not input_file_path.endswith(".tif"):
                     error_msg = f"Input file {input_file_path} does not have .tif extension"
 
                     self.logger.critical(self.name, ErrorCode.INVALID_INPUT, error_msg)
 
+                self.logger.metrics.counter('input.tif_files').increment()
+
     def run_preprocessor(self, **kwargs):
         """
         Executes the pre-processing steps for DSWx PGE initialization.
@@ -107,6 +113,7 @@ class DSWxPostProcessorMixin(PostProcessorMixin):
 
     _post_mixin_name = "DSWxPostProcessorMixin"
 
+    @timed_stage()
     def _validate_output(self):
         """
         Evaluates the output file generated from SAS execution to ensure its
@@ -122,11 +129,15 @@ class DSWxPostProcessorMixin(PostProcessorMixin):
 
             self.logger.critical(self.name, ErrorCode.OUTPUT_NOT_FOUND, error_msg)
 
-        if os.path.getsize(output_path) == 0:
+        output_size = os.path.getsize(output_path)
+
+        if output_size == 0:
             error_msg = f"SAS output file {output_path} was created but is empty"
 
             self.logger.critical(self.name, ErrorCode.INVALID_OUTPUT, error_msg)
 
+        self.logger.metrics.histogram('output.file_bytes').observe(output_size)
+
     def run_postprocessor(self, **kwargs):
         """
         Executes the post-processing steps for DSWx PGE job completion.
@@ -25,12 +25,26 @@ Original Author: David White
 Adapted By: Scott Collins
 
 """
+import functools
 import os
 
 import yaml
 
 import yamale
 from pkg_resources import resource_filename
+from yamale import YamaleError
+from yamale.schema.validationresults import ValidationResult
+
+from opera.util.schema_cache import get_schema
+from opera.util.schema_cache import get_validator
+
+# Use the libyaml-based (C) loader when PyYAML has been built with libyaml, as
+# it is considerably faster on large RunConfigs than its pure-Python
+# equivalent. This matches the loader used by Yamale itself.
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:  # PyYAML was built without libyaml
+    from yaml import SafeLoader as YamlLoader
 
 BASE_PGE_SCHEMA = resource_filename('opera', 'schema/base_pge_schema.yaml')
 """Path to the Yamale schema applicable to the PGE portion of each RunConfig"""
@@ -44,12 +58,18 @@ class RunConfig:
     sections for both the PGE and SAS executables. Schema-based validation is
     performed via the Yamale library (https://github.com/23andMe/Yamale).
 
+    Each field is looked up within the parsed RunConfig on every access. Once
+    validated, a RunConfig should be converted to a FrozenRunConfig via
+    freeze(), which looks up every field once, up front.
+
     Attributes
     ----------
     _filename : str
         Name of the file parsed to create the RunConfig
+    _document : dict
+        Parsed contents of the provided RunConfig file, retained for validation
     _run_config : dict
-        Parsed contents of the provided RunConfig file
+        Short-cut to the top-level RunConfig entry of the parsed document
     _pge_config : dict
         Short-cut to the PGE-specific section of the parsed RunConfig
     _sas_config : dict
@@ -57,10 +77,15 @@ class RunConfig:
 
     """
 
+    __slots__ = ('_filename', '_document', '_run_config', '_pge_config', '_sas_config')
+
     def __init__(self, filename):
         self._filename = filename
 
-        self._run_config = self._parse_run_config_file(filename)
+        # The file is parsed exactly once, the parsed document is reused for
+        # validation rather than having Yamale re-parse the file
+        self._document = self._parse_run_config_file(filename)
+        self._run_config = self._document['RunConfig']
         self._pge_config = self._run_config['Groups']['PGE']
 
         # SAS section may not always be present, during testing for example
@@ -70,7 +95,7 @@ class RunConfig:
     def _parse_run_config_file(yaml_filename):
         """
         Loads a run configuration YAML file.
-        Returns the loaded data as a Python object.
+        Returns the loaded document as a Python object.
 
         Parameters
         ----------
@@ -79,8 +104,9 @@ class RunConfig:
 
         Returns
         -------
-        run_config : dict
-            All contents of the parsed
+        document : dict
+            All contents of the parsed file, including the top-level
+            "RunConfig" entry.
 
         Raises
         ------
@@ -89,20 +115,27 @@ class RunConfig:
 
         """
         with open(yaml_filename, 'r') as stream:
-            dictionary = yaml.safe_load(stream)
+            dictionary = yaml.load(stream, Loader=YamlLoader)
 
-        try:
-            return dictionary['RunConfig']
-        except KeyError:
+        if not isinstance(dictionary, dict) or 'RunConfig' not in dictionary:
             raise RuntimeError(
                 f'Unable to parse {yaml_filename}, expected top-level RunConfig entry'
             )
 
+        return dictionary
+
     def validate(self, pge_schema_file=BASE_PGE_SCHEMA, strict_mode=True):
         """
         Validates the RunConfig using a combination of the base PGE schema,
         and the specific SAS schema defined by the RunConfig itself.
 
+        Validation is performed by a validator generated from the combined
+        schema (see opera.util.schema_compiler), which reports the same errors
+        as Yamale itself. Yamale is used directly for any schema the validator
+        cannot be generated for. Either way, the combined schema is only
+        compiled the first time a combination of schema files is used, see
+        opera.util.schema_cache.
+
         Parameters
         ----------
         pge_schema_file : str, optional
@@ -123,9 +156,7 @@ class RunConfig:
             schema.
 
         """
-        # Load the schema for the PGE portion of the RunConfig, which should
-        # be fixed across all PGE-SAS combinations
-        pge_schema = yamale.make_schema(pge_schema_file)
+        sas_schema_filepath = None
 
         # If there was a SAS section included with the parsed config, pull
         # in its schema before validating. Otherwise, only the base PGE schema
@@ -135,25 +166,36 @@ class RunConfig:
             sas_schema_filename = self.sas_schema_path
             sas_schema_filepath = resource_filename('opera', f'schema/{sas_schema_filename}')
 
-            if os.path.isfile(sas_schema_filepath):
-                # TODO: better error handling for missing sas schema,
-                #       support for absolute paths as fallback when resource_filename fails?
-                sas_schema = yamale.make_schema(sas_schema_filepath)
-
-                # Link the SAS schema to the PGE as an "include"
-                # Note that the key name "sas_configuration" must match the include
-                # reference in the base PGE schema.
-                pge_schema.includes['sas_configuration'] = sas_schema
-            else:
+            # TODO: better error handling for missing sas schema,
+            #       support for absolute paths as fallback when resource_filename fails?
+            if not os.path.isfile(sas_schema_filepath):
                 raise RuntimeError(
                     f'Can not validate RunConfig {self.name} as the associated SAS '
                     f'schema ({sas_schema_filename}) cannot be located within the '
                     f'schemas directory.'
                 )
 
-        # Yamale expects its own formatting of the parsed config, hence the need
-        # to call "make_data()" here.
-        runconfig_data = yamale.make_data(self.filename)
+        validator = get_validator(pge_schema_file, sas_schema_filepath)
+
+        if validator is not None:
+            errors = validator(self._document, strict_mode)
+
+            if errors:
+                # Report the errors exactly as Yamale would, for a schema
+                # named by the path to its file
+                raise YamaleError([ValidationResult(self.filename, pge_schema_file, errors)])
+
+            return
+
+        # Load the schema for the PGE portion of the RunConfig, which should
+        # be fixed across all PGE-SAS combinations, with the SAS schema linked
+        # in as an "include"
+        pge_schema = get_schema(pge_schema_file, sas_schema_filepath)
+
+        # Yamale expects its own formatting of the parsed config, a list of
+        # (document, path) tuples as returned by "make_data()". The document
+        # parsed on construction is reused here, rather than re-parsing the file.
+        runconfig_data = [(self._document, self.filename)]
 
         # Finally, validate the RunConfig against the combined PGE/SAS schema
         yamale.validate(pge_schema, runconfig_data, strict=strict_mode)
@@ -209,7 +251,7 @@ class RunConfig:
     # ProductPathGroup
     @property
     def product_counter(self) -> int:
-        return self._pge_config['ProductPathGroup']['ProductCounter']
+        return self._pge_config['ProductPathGroup'].get('ProductCounter')
 
     @property
     def output_product_path(self) -> str:
@@ -226,7 +268,7 @@ class RunConfig:
     # PrimaryExecutable
     @property
     def product_identifier(self) -> str:
-        return self._pge_config['PrimaryExecutable']['ProductIdentifier']
+        return self._pge_config['PrimaryExecutable'].get('ProductIdentifier')
 
     @property
     def sas_program_path(self) -> str:
@@ -234,7 +276,7 @@ class RunConfig:
 
     @property
     def sas_program_options(self) -> str:
-        return self._pge_config['PrimaryExecutable']['ProgramOptions']
+        return self._pge_config['PrimaryExecutable'].get('ProgramOptions')
 
     @property
     def error_code_base(self) -> int:
@@ -246,7 +288,19 @@ class RunConfig:
 
     @property
     def iso_template_path(self) -> str:
-        return self._pge_config['PrimaryExecutable']['IsoTemplatePath']
+        return self._pge_config['PrimaryExecutable'].get('IsoTemplatePath')
+
+    @property
+    def resource_sampling_interval(self) -> float:
+        return self._pge_config['PrimaryExecutable'].get('ResourceSamplingInterval')
+
+    @property
+    def sas_timeout(self) -> float:
+        return self._pge_config['PrimaryExecutable'].get('Timeout')
+
+    @property
+    def sas_timeout_grace_period(self) -> float:
+        return self._pge_config['PrimaryExecutable'].get('TimeoutGracePeriod')
 
     # QAExecutable
     @property
@@ -255,15 +309,50 @@ class RunConfig:
 
     @property
     def qa_program_path(self) -> str:
-        return self._pge_config['QAExecutable']['ProgramPath']
+        return self._pge_config['QAExecutable'].get('ProgramPath')
 
     @property
     def qa_program_options(self) -> str:
-        return self._pge_config['QAExecutable']['ProgramOptions']
+        return self._pge_config['QAExecutable'].get('ProgramOptions')
+
+    # ProcessingResourcesGroup
+    @property
+    def sas_num_threads(self) -> int:
+        return (self._pge_config.get('ProcessingResourcesGroup') or {}).get('NumThreads')
+
+    @property
+    def sas_cpu_affinity(self) -> list:
+        return (self._pge_config.get('ProcessingResourcesGroup') or {}).get('CpuAffinity')
+
+    # LoggingGroup
+    @property
+    def log_max_memory_size(self) -> int:
+        return (self._pge_config.get('LoggingGroup') or {}).get('MaxInMemoryLogSize')
+
+    @property
+    def log_location_mode(self) -> str:
+        return (self._pge_config.get('LoggingGroup') or {}).get('CallerLocationMode')
+
+    @property
+    def log_write_behind(self) -> bool:
+        return bool((self._pge_config.get('LoggingGroup') or {}).get('WriteBehindJournal', False))
+
+    @property
+    def log_journal_flush_interval(self) -> float:
+        return (self._pge_config.get('LoggingGroup') or {}).get('JournalFlushInterval')
 
+    @property
+    def log_json_lines(self) -> bool:
+        return bool((self._pge_config.get('LoggingGroup') or {}).get('JsonLinesLog', False))
+
+    @property
+    def log_compression(self) -> str:
+        return (self._pge_config.get('LoggingGroup') or {}).get('Compression')
+
+    # DebugLevelGroup
     @property
     def debug_switch(self) -> bool:
-        return bool(self._pge_config['DebugLevelGroup']['DebugSwitch'])
+        return bool(self._pge_config['DebugLevelGroup'].get('DebugSwitch', False))
 
     @property
     def execute_via_shell(self) -> bool:
@@ -273,6 +362,31 @@ class RunConfig:
     def sas_config(self) -> dict:
         return self._sas_config
 
+    def freeze(self):
+        """
+        Returns an immutable snapshot of the RunConfig, with every field
+        looked up once, up front. This should only be called once the
+        RunConfig has been validated.
+
+        For an instance of a subclass of RunConfig, the snapshot is an
+        instance of a FrozenRunConfig subclass derived from that subclass (see
+        frozen_class()), so any fields it adds or overrides are preserved.
+
+        Returns
+        -------
+        frozen_runconfig : FrozenRunConfig
+            The snapshot of the RunConfig.
+
+        Raises
+        ------
+        RuntimeError
+            If any expected field is missing from the RunConfig.
+        TypeError
+            If no frozen class may be derived from the class of the RunConfig.
+
+        """
+        return frozen_class(type(self))(self)
+
     def get_ancillary_filenames(self):
         """
         Returns a list of all ancillary filenames listed in the
@@ -291,3 +405,134 @@ class RunConfig:
         )
 
         return result
+
+
+class FrozenRunConfig(RunConfig):
+    """
+    Immutable snapshot of a validated RunConfig, as returned by
+    RunConfig.freeze().
+
+    Every field defined as a property by RunConfig is looked up once when the
+    snapshot is created, and stored in a slot of the same name, so accessing
+    a field is a plain attribute read. Any field missing from the RunConfig is
+    therefore reported when the snapshot is created, rather than when the
+    field is first accessed.
+
+    Fields which are optional per the base PGE schema are None when absent
+    from the RunConfig, so only missing required fields are reported.
+
+    Attributes of the snapshot may not be assigned, however the parsed
+    lists and dictionaries it holds (such as input_files) are shared with the
+    original RunConfig, and should not be modified.
+
+    """
+
+    __slots__ = tuple(name for name, member in vars(RunConfig).items()
+                      if isinstance(member, property))
+
+    _field_names = __slots__
+    """Names of every field looked up when a snapshot is created, including those of any subclass"""
+
+    # Fields are read from slots directly, bypassing the error handling of
+    # RunConfig.__getattribute__(), which is no longer required
+    __getattribute__ = object.__getattribute__
+
+    def __init__(self, runconfig):  # pylint: disable=super-init-not-called
+        """
+        Creates a new instance of FrozenRunConfig
+
+        Parameters
+        ----------
+        runconfig : RunConfig
+            The (validated) RunConfig to create a snapshot of.
+
+        Raises
+        ------
+        RuntimeError
+            If any expected field is missing from the RunConfig.
+
+        """
+        # RunConfig.__init__() is intentionally not called, as the snapshot
+        # copies the state of an already parsed RunConfig, rather than
+        # re-parsing its file
+        for cls in type(runconfig).__mro__:
+            for name in vars(cls).get('__slots__', ()):
+                object.__setattr__(self, name, object.__getattribute__(runconfig, name))
+
+        # Copy any attributes set by a subclass without slots of its own
+        for name, value in getattr(runconfig, '__dict__', {}).items():
+            object.__setattr__(self, name, value)
+
+        # Look up each field via the property of the provided RunConfig, which
+        # raises a RuntimeError for any missing field
+        for name in self._field_names:
+            object.__setattr__(self, name, getattr(runconfig, name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'RunConfig {self.filename} is frozen, cannot assign to "{name}"')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'RunConfig {self.filename} is frozen, cannot delete "{name}"')
+
+    def freeze(self):
+        """Returns this instance, as it is already frozen."""
+        return self
+
+
+@functools.lru_cache(maxsize=None)
+def frozen_class(runconfig_class):
+    """
+    Returns the class of the snapshots created by freeze() for instances of
+    the provided RunConfig class.
+
+    For RunConfig itself this is FrozenRunConfig. For a subclass of RunConfig,
+    a subclass of both FrozenRunConfig and the provided class is derived (once
+    per class), with a slot for every field defined as a property anywhere
+    within the provided class hierarchy. Fields added or overridden by the
+    subclass are therefore looked up via the subclass, and its methods remain
+    available on the snapshot.
+
+    Parameters
+    ----------
+    runconfig_class : type
+        RunConfig, or a subclass of it.
+
+    Returns
+    -------
+    frozen_runconfig_class : type
+        FrozenRunConfig, or the subclass of it derived for the provided class.
+
+    Raises
+    ------
+    TypeError
+        If the provided class defines slots of its own, which prevents
+        deriving a frozen class from it. Such a class must override freeze().
+
+    """
+    if issubclass(runconfig_class, FrozenRunConfig):
+        return runconfig_class
+
+    if runconfig_class is RunConfig:
+        return FrozenRunConfig
+
+    field_names = []
+
+    for cls in reversed(runconfig_class.__mro__):
+        for name, member in vars(cls).items():
+            if isinstance(member, property) and name not in field_names:
+                field_names.append(name)
+
+    try:
+        return type(
+            f'Frozen{runconfig_class.__name__}', (FrozenRunConfig, runconfig_class),
+            {
+                '__slots__': tuple(name for name in field_names if name not in FrozenRunConfig.__slots__),
+                '__module__': runconfig_class.__module__,
+                '_field_names': tuple(field_names)
+            }
+        )
+    except TypeError as err:
+        raise TypeError(
+            f'Cannot derive a frozen class from {runconfig_class.__name__}, '
+            f'which must override freeze(): {str(err)}'
+        ) from err
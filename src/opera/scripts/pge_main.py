@@ -27,13 +27,27 @@ The PGE type instantiated is determined from the provided RunConfig.
 """
 
 import argparse
+import contextlib
+import glob
+import multiprocessing
 import os
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from os.path import splitext
 
 from opera.pge.base_pge import PgeExecutor
 from opera.pge.dswx_pge import DSWxExecutor
 from opera.pge.runconfig import RunConfig
+from opera.util.log_aggregator import LogAggregator
 from opera.util.logger import PgeLogger
+from opera.util.logger import default_log_file_name
 from opera.util.error_codes import ErrorCode
+from opera.util.result_cache import SasResultCache
+from opera.util.warm_worker import preload_sas_modules
+from opera.util.schema_cache import SCHEMA_CACHE_DIR_ENV
+from opera.util.trace import TraceRecorder
+from opera.util.trace import trace_span
 
 PGE_NAME_MAP = {
     'DSWX_HLS_PGE': DSWxExecutor,
@@ -41,6 +55,9 @@ PGE_NAME_MAP = {
 }
 """Mapping of PGE names specified by a RunConfig to the PGE class type to instantiate"""
 
+_worker_context = types.SimpleNamespace(log_queue=None)
+"""State retained by a batch worker process, such as the queue its jobs forward their logs to, if any"""
+
 
 def get_pge_class(pge_name, logger):
     """
@@ -72,11 +89,17 @@ def get_pge_class(pge_name, logger):
     return pge_class
 
 
-def open_log_file():
+def open_log_file(log_filename=None):
     """
     Opens a log file using an initial filename and path that
     does not rely on anything read from the run config file
 
+    Parameters
+    ----------
+    log_filename : str, optional
+        Initial filename to assign to the log. Defaults to the value provided
+        by default_log_file_name().
+
     Returns
     -------
     logger : PgeLogger
@@ -84,7 +107,8 @@ def open_log_file():
 
     """
 
-    logger = PgeLogger('PGE::' + os.path.basename(__file__), PgeLogger.LOGGER_CODE_BASE)
+    logger = PgeLogger('PGE::' + os.path.basename(__file__), PgeLogger.LOGGER_CODE_BASE,
+                       log_filename=log_filename)
 
     logger.info("pge_main", ErrorCode.LOG_FILE_CREATED,
                 f'Log file initialized to {logger.get_file_name()}')
@@ -129,7 +153,8 @@ def load_run_config_file(logger, run_config_filename):
     return run_config
 
 
-def pge_start(run_config_filename):
+def pge_start(run_config_filename, log_filename=None, warm_worker=False,
+              result_cache=None, trace=None, log_queue=None):
     """
     Opens a log file, loads the yaml run config file, then instantiates and runs
     the PGE.
@@ -138,10 +163,27 @@ def pge_start(run_config_filename):
     ----------
     run_config_filename : str
         Path and filename to run config yaml file.
+    log_filename : str, optional
+        Initial filename to assign to the log of the PGE. Defaults to the value
+        provided by default_log_file_name().
+    warm_worker : bool, optional
+        If True, a SAS program which is a Python module is run in a child
+        forked from the current process rather than a new interpreter.
+    result_cache : SasResultCache, optional
+        Cache of SAS results to restore the outputs of identical, previously
+        executed jobs from, rather than re-running the SAS.
+    trace : TraceRecorder, optional
+        Trace to record the timeline of the PGE run into.
+    log_queue : multiprocessing.Queue, optional
+        Queue to forward the log of the PGE to as it is written, such as that
+        of a LogAggregator.
 
     """
 
-    logger = open_log_file()
+    logger = open_log_file(log_filename)
+
+    if log_queue is not None:
+        logger.enable_forwarding(log_queue)
 
     # Load the yaml run config file
     run_config = load_run_config_file(logger, run_config_filename)
@@ -149,14 +191,286 @@ def pge_start(run_config_filename):
     # Get the appropriate PGE class type based on the name in the RunConfig
     pge_class = get_pge_class(run_config.pge_name, logger)
 
-    # Instantiate and run the pge.
+    # Instantiate and run the pge, handing over the already parsed RunConfig
+    # so the file is not parsed again
     pge = pge_class(
-        pge_name=run_config.pge_name, runconfig_path=run_config_filename, logger=logger
+        pge_name=run_config.pge_name, runconfig_path=run_config_filename, logger=logger,
+        warm_worker=warm_worker, result_cache=result_cache, trace=trace,
+        runconfig=run_config
     )
 
     pge.run()
 
 
+def get_run_config_filenames(file_args=None, manifest_filename=None):
+    """
+    Resolves the full list of RunConfig files to process from the paths and/or
+    glob patterns provided on the command line, and an optional manifest file.
+
+    Parameters
+    ----------
+    file_args : list of str, optional
+        Paths to RunConfig files. Any entries containing glob patterns are
+        expanded to the (sorted) list of matching files.
+    manifest_filename : str, optional
+        Path to a manifest file listing one RunConfig path or glob pattern per
+        line. Blank lines, and lines starting with "#", are ignored. Relative
+        paths are resolved against the directory containing the manifest.
+
+    Returns
+    -------
+    run_config_filenames : list of str
+        Absolute paths to the RunConfig files to process, in the order
+        provided, with any duplicates removed.
+
+    Raises
+    ------
+    FileNotFoundError
+        If the manifest, any of the listed RunConfig files, or any files
+        matching a glob pattern, cannot be found.
+
+    """
+    patterns = list(file_args or [])
+
+    if manifest_filename:
+        if not os.path.exists(manifest_filename):
+            raise FileNotFoundError(f"Could not find manifest file: {manifest_filename}")
+
+        manifest_dir = os.path.dirname(os.path.abspath(manifest_filename))
+
+        with open(manifest_filename, 'r', encoding='utf-8') as infile:
+            for line in infile:
+                line = line.strip()
+
+                if line and not line.startswith('#'):
+                    patterns.append(os.path.join(manifest_dir, line))
+
+    run_config_filenames = []
+
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern))
+
+            if not matches:
+                raise FileNotFoundError(f"No config files match pattern: {pattern}")
+        else:
+            matches = [pattern]
+
+        for match in matches:
+            run_config_filename = os.path.abspath(match)
+
+            if not os.path.exists(run_config_filename):
+                raise FileNotFoundError(f"Could not find config file: {run_config_filename}")
+
+            if run_config_filename not in run_config_filenames:
+                run_config_filenames.append(run_config_filename)
+
+    return run_config_filenames
+
+
+def _initialize_batch_worker(preload_modules, log_queue):
+    """
+    Initializes a worker process of pge_batch(), preloading any requested
+    modules, and retaining the queue to forward the logs of its jobs to.
+
+    Parameters
+    ----------
+    preload_modules : list of str or None
+        Names of Python modules to import, see preload_sas_modules().
+    log_queue : multiprocessing.Queue or None
+        Queue of the LogAggregator of the batch, if logs are aggregated.
+
+    """
+    _worker_context.log_queue = log_queue
+
+    preload_sas_modules(preload_modules)
+
+
+def _run_batch_job(run_config_filename, log_filename, warm_worker, result_cache,
+                   enable_trace=False):
+    """
+    Runs a single PGE job on behalf of pge_batch() within a worker process.
+
+    Parameters
+    ----------
+    run_config_filename : str
+        Path to the RunConfig of the job.
+    log_filename : str
+        Initial filename to assign to the log of the job.
+    warm_worker : bool
+        Whether to run Python module SAS programs in warm-worker mode.
+    result_cache : SasResultCache or None
+        Cache of SAS results shared by the jobs of the batch.
+    enable_trace : bool, optional
+        Whether to record a trace of the job.
+
+    Returns
+    -------
+    elapsed_time : float
+        The time elapsed while running the job, in seconds.
+    error_msg : str or None
+        Description of the error which caused the job to fail, or None if the
+        job was successful.
+    trace_events : list of dict or None
+        The trace events recorded for the job, for merging into the trace of
+        the batch, or None if tracing was not enabled.
+
+    """
+    start_time = time.monotonic()
+    error_msg = None
+    trace = TraceRecorder(process_name='pge_batch worker') if enable_trace else None
+
+    try:
+        pge_start(run_config_filename, log_filename, warm_worker, result_cache, trace,
+                  _worker_context.log_queue)
+    except Exception as err:
+        error_msg = f'{type(err).__name__}: {str(err)}'
+
+    return time.monotonic() - start_time, error_msg, trace.events if trace else None
+
+
+def pge_batch(run_config_filenames, max_workers=None, warm_worker=False,
+              preload_modules=None, result_cache=None, trace_filename=None,
+              aggregate_logs=False):
+    """
+    Runs a batch of PGE jobs, one per provided RunConfig, using a bounded pool
+    of worker processes.
+
+    Each job is run via pge_start() within a worker process, and as such,
+    is assigned its own PgeLogger. A separate batch log records the outcome of
+    each job, followed by a summary of the throughput and failure count of the
+    batch as a whole.
+
+    Parameters
+    ----------
+    run_config_filenames : list of str
+        Paths to the RunConfig files to process.
+    max_workers : int, optional
+        Maximum number of jobs to run concurrently. Defaults to the number of
+        CPUs on the machine.
+    warm_worker : bool, optional
+        If True, a SAS program which is a Python module is run in a child
+        forked from the worker process running the job, rather than a new
+        interpreter. Since worker processes are reused across jobs, this
+        avoids paying interpreter start-up and import costs for every job.
+    preload_modules : list of str, optional
+        Names of Python modules for each worker process to import once, at
+        start-up, such as the SAS program module and its heavy dependencies.
+    result_cache : SasResultCache, optional
+        Cache of SAS results shared by all jobs of the batch, used to skip
+        re-running the SAS for jobs identical to those previously executed.
+    trace_filename : str, optional
+        If provided, a trace of the timeline of every job in the batch is
+        written to this file, with the jobs run by each worker process grouped
+        within the track of that process.
+    aggregate_logs : bool, optional
+        If True, the logs of every job are additionally forwarded to a
+        LogAggregator, which merges them into a single, time-ordered node log
+        written alongside the batch log, along with rolling metrics across all
+        jobs (see opera.util.log_aggregator). Worker processes are then started
+        via a fork server, as the aggregator runs a thread within this process.
+
+    Returns
+    -------
+    summary : dict
+        Dictionary containing the summary metrics of the batch run.
+
+    """
+    module_name = "pge_main"
+
+    log_basename = splitext(default_log_file_name())[0]
+
+    logger = PgeLogger('PGE::' + os.path.basename(__file__), PgeLogger.LOGGER_CODE_BASE,
+                       log_filename=f'{log_basename}_batch.log')
+
+    max_workers = max_workers or os.cpu_count()
+
+    logger.info(module_name, ErrorCode.BATCH_STARTING,
+                f'Starting batch of {len(run_config_filenames)} job(s) '
+                f'using {max_workers} worker(s)')
+
+    start_time = time.monotonic()
+    job_elapsed_times = []
+    num_failed = 0
+
+    trace = TraceRecorder(process_name='pge_batch') if trace_filename else None
+
+    # The listener thread of the aggregator runs for the lifetime of the pool,
+    # so worker processes are started via a fork server, rather than forked
+    # from this (then multi-threaded) process
+    mp_context = multiprocessing.get_context('forkserver') if aggregate_logs else None
+
+    aggregator = LogAggregator(f'{log_basename}_node.log', mp_context=mp_context) if aggregate_logs else None
+    log_queue = aggregator.queue if aggregator else None
+
+    # The aggregator is stopped only once the pool has shut down, by which
+    # point every worker has flushed its forwarded logs to the queue
+    with trace_span(trace, 'pge_batch', num_jobs=len(run_config_filenames)), \
+            aggregator or contextlib.nullcontext(), \
+            ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context,
+                                initializer=_initialize_batch_worker,
+                                initargs=(preload_modules, log_queue)) as executor:
+        futures = {
+            executor.submit(_run_batch_job, run_config_filename,
+                            f'{log_basename}_{index:05d}.log', warm_worker,
+                            result_cache, bool(trace)): run_config_filename
+            for index, run_config_filename in enumerate(run_config_filenames)
+        }
+
+        for future in as_completed(futures):
+            run_config_filename = futures[future]
+
+            try:
+                elapsed_time, error_msg, trace_events = future.result()
+            except Exception as err:
+                # The worker process itself failed, such as when it is killed
+                # by the OS due to memory exhaustion
+                elapsed_time, error_msg, trace_events = None, f'{type(err).__name__}: {str(err)}', None
+
+            if trace and trace_events:
+                trace.add_events(trace_events)
+
+            if error_msg:
+                num_failed += 1
+                logger.warning(module_name, ErrorCode.BATCH_JOB_FAILED,
+                               f'Job for RunConfig {run_config_filename} failed, '
+                               f'reason: {error_msg}')
+            else:
+                job_elapsed_times.append(elapsed_time)
+                logger.info(module_name, ErrorCode.BATCH_JOB_COMPLETED,
+                            f'Job for RunConfig {run_config_filename} completed '
+                            f'in {elapsed_time:.3f} second(s)')
+
+    elapsed_time = time.monotonic() - start_time
+    num_jobs = len(run_config_filenames)
+
+    summary = {
+        'batch.jobs.total': num_jobs,
+        'batch.jobs.succeeded': num_jobs - num_failed,
+        'batch.jobs.failed': num_failed,
+        'batch.max_workers': max_workers,
+        'batch.elapsed_seconds': elapsed_time,
+        'batch.throughput.jobs_per_hour': (num_jobs - num_failed) * 3600.0 / elapsed_time,
+    }
+
+    if job_elapsed_times:
+        summary['batch.job_elapsed_seconds.mean'] = sum(job_elapsed_times) / len(job_elapsed_times)
+        summary['batch.job_elapsed_seconds.max'] = max(job_elapsed_times)
+
+    for metric_name, value in summary.items():
+        logger.log_one_metric(module_name, metric_name, value)
+
+    logger.close_log_stream()
+
+    if trace:
+        trace.write(trace_filename)
+
+    print(f'Batch complete: {num_jobs - num_failed} of {num_jobs} job(s) succeeded '
+          f'in {elapsed_time:.3f} second(s), see {logger.get_file_name()} for details')
+
+    return summary
+
+
 def pge_main():
     """
     The main entry point for OPERA PGEs.
@@ -164,6 +478,10 @@ def pge_main():
     Reads the PGEName from the specified run config file to determine the
     specific PGE, then runs that specific PGE.
 
+    If more than one run config file is specified (either directly, via glob
+    pattern, or via manifest file), each is run as a separate job within a
+    bounded pool of worker processes.
+
     """
 
     parser = argparse.ArgumentParser(
@@ -171,17 +489,89 @@ def pge_main():
         formatter_class=argparse.RawDescriptionHelpFormatter
     )
 
-    parser.add_argument('-f', '--file', required=True, type=str,
-                        help='Path to the run configuration yaml file.')
+    input_group = parser.add_mutually_exclusive_group(required=True)
+
+    input_group.add_argument('-f', '--file', nargs='+', type=str,
+                             help='Path(s) to the run configuration yaml file(s). '
+                                  'Glob patterns are expanded. Providing more than '
+                                  'one file enables batch mode.')
+    input_group.add_argument('-m', '--manifest', type=str,
+                             help='Path to a manifest file listing one run '
+                                  'configuration yaml file path (or glob pattern) '
+                                  'per line to process in batch mode.')
+
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Maximum number of jobs to run concurrently in batch '
+                             'mode. Defaults to the number of CPUs.')
+    parser.add_argument('--warm-worker', action='store_true',
+                        help='Run SAS programs which are Python modules in a '
+                             'child forked from a long-lived, pre-imported worker '
+                             'process, rather than a new interpreter per job. '
+                             'Not used while the worker runs other threads, such as '
+                             'those enabled by write-behind or log aggregation.')
+    parser.add_argument('--preload', nargs='+', type=str, default=None, metavar='MODULE',
+                        help='Python module(s) to import once per worker process, '
+                             'for use with --warm-worker.')
+    parser.add_argument('--result-cache', type=str, default=None, metavar='DIR',
+                        help='Directory of a local SAS result cache. When provided, '
+                             'jobs with input files, SAS configuration and SAS '
+                             'program identical to a previously cached job restore '
+                             'the cached outputs rather than re-running the SAS.')
+    parser.add_argument('--result-cache-size', type=float, default=10.0, metavar='GB',
+                        help='Size budget of the SAS result cache in gigabytes, '
+                             'beyond which the least recently used results are '
+                             'evicted. Defaults to 10.')
+    parser.add_argument('--trace', type=str, default=None, metavar='FILE',
+                        help='Write a timeline of the run to FILE as Chrome trace '
+                             'events, viewable with chrome://tracing or '
+                             'https://ui.perfetto.dev.')
+    parser.add_argument('--schema-cache', type=str, default=None, metavar='DIR',
+                        help='Directory of an on-disk cache of compiled RunConfig '
+                             'schemas, shared by every job and subsequent runs. '
+                             'Equivalent to setting the OPERA_SCHEMA_CACHE_DIR '
+                             'environment variable. Cached schemas are loaded as '
+                             'code, so the directory must be writable only by the '
+                             'user running the PGE; entries are ignored unless the '
+                             'directory and entry are owned by that user and are '
+                             'not group or world writable.')
+    parser.add_argument('--aggregate-logs', action='store_true',
+                        help='In batch mode, additionally merge the logs of all '
+                             'jobs into a single, time-ordered node log with '
+                             'rolling metrics across jobs.')
 
     args = parser.parse_args()
 
-    run_config_filename = os.path.abspath(args.file)
+    # Set via the environment, so the setting is inherited by any batch workers
+    if args.schema_cache:
+        os.environ[SCHEMA_CACHE_DIR_ENV] = os.path.abspath(args.schema_cache)
+
+    result_cache = None
+
+    if args.result_cache:
+        result_cache = SasResultCache(args.result_cache, int(args.result_cache_size * 1024 ** 3))
+
+    run_config_filenames = get_run_config_filenames(args.file, args.manifest)
+
+    if len(run_config_filenames) == 1 and not args.manifest:
+        preload_sas_modules(args.preload)
+
+        trace = TraceRecorder(process_name='pge_main') if args.trace else None
 
-    if not os.path.exists(run_config_filename):
-        raise FileNotFoundError(f"Could not find config file: {run_config_filename}")
+        try:
+            pge_start(run_config_filenames[0], warm_worker=args.warm_worker,
+                      result_cache=result_cache, trace=trace)
+        finally:
+            if trace:
+                trace.write(args.trace)
+    else:
+        summary = pge_batch(run_config_filenames, args.jobs, args.warm_worker, args.preload,
+                            result_cache, args.trace, args.aggregate_logs)
 
-    pge_start(run_config_filename)
+        if summary['batch.jobs.failed']:
+            raise RuntimeError(
+                f"{summary['batch.jobs.failed']} of {summary['batch.jobs.total']} "
+                f"batch job(s) failed"
+            )
 
 
 if __name__ == '__main__':
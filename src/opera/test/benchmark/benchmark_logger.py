@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021, by the California Institute of Technology.
+# ALL RIGHTS RESERVED.
+# United States Government sponsorship acknowledged.
+# Any commercial use must be negotiated with the Office of Technology Transfer
+# at the California Institute of Technology.
+# This software may be subject to U.S. export control laws and regulations.
+# By accepting this document, the user agrees to comply with all applicable
+# U.S. export laws and regulations. User has the responsibility to obtain
+# export licenses, or other export authority as may be required, before
+# exporting such information to foreign countries or providing access to
+# foreign persons.
+#
+
+"""
+===================
+benchmark_logger.py
+===================
+
+Micro-benchmark of the per-message cost of PgeLogger.
+
+Reports the throughput, in messages per second, of logging through each of
+the available caller location modes, both via PgeLogger.write() directly and
+via the severity-specific helpers (which add a back frame).
+
+Usage:
+    python -m opera.test.benchmark.benchmark_logger [--messages N] [--repeat N]
+
+"""
+
+import argparse
+import time
+
+from opera.util.error_codes import ErrorCode
+from opera.util.logger import LOCATION_MODES, PgeLogger
+
+
+def benchmark_location_mode(location_mode, num_messages, use_helper):
+    """
+    Times the logging of a number of messages with a fresh logger.
+
+    Parameters
+    ----------
+    location_mode : str
+        The caller location mode to benchmark.
+    num_messages : int
+        Number of messages to log.
+    use_helper : bool
+        If True, messages are logged via PgeLogger.info(), otherwise via
+        PgeLogger.write().
+
+    Returns
+    -------
+    messages_per_second : float
+        The measured logging throughput.
+
+    """
+    logger = PgeLogger(location_mode=location_mode)
+
+    start_time = time.perf_counter()
+
+    if use_helper:
+        for _ in range(num_messages):
+            logger.info('benchmark', ErrorCode.PROCESSING_INPUT_FILE, 'Benchmark message')
+    else:
+        for _ in range(num_messages):
+            logger.write('Info', 'benchmark', ErrorCode.PROCESSING_INPUT_FILE, 'Benchmark message')
+
+    elapsed_time = time.perf_counter() - start_time
+
+    return num_messages / elapsed_time
+
+
+def main():
+    """Runs the benchmark and prints a table of the results"""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=100000,
+                        help='Number of messages to log per measurement.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of measurements per mode, the best of which is reported.')
+
+    args = parser.parse_args()
+
+    print(f'{"location mode":<16}{"method":<10}{"messages/sec":>16}{"speedup":>10}')
+
+    for use_helper in (False, True):
+        method = 'info()' if use_helper else 'write()'
+        results = {location_mode: 0.0 for location_mode in LOCATION_MODES}
+
+        # Interleave the modes within each repetition, so any drift in machine
+        # load affects every mode alike
+        for _ in range(args.repeat):
+            for location_mode in LOCATION_MODES:
+                results[location_mode] = max(
+                    results[location_mode],
+                    benchmark_location_mode(location_mode, args.messages, use_helper)
+                )
+
+        baseline = results[LOCATION_MODES[0]]
+
+        for location_mode, messages_per_second in results.items():
+            print(f'{location_mode:<16}{method:<10}{messages_per_second:>16,.0f}'
+                  f'{messages_per_second / baseline:>9.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021, by the California Institute of Technology.
+# ALL RIGHTS RESERVED.
+# United States Government sponsorship acknowledged.
+# Any commercial use must be negotiated with the Office of Technology Transfer
+# at the California Institute of Technology.
+# This software may be subject to U.S. export control laws and regulations.
+# By accepting this document, the user agrees to comply with all applicable
+# U.S. export laws and regulations. User has the responsibility to obtain
+# export licenses, or other export authority as may be required, before
+# exporting such information to foreign countries or providing access to
+# foreign persons.
+#
+
+"""
+======================
+benchmark_runconfig.py
+======================
+
+Micro-benchmark of the latency of parsing a large RunConfig.
+
+A RunConfig listing a configurable number of input files is generated from
+the sample RunConfig used by the unit tests, then parsed with the pure-Python
+and (if PyYAML was built with libyaml) the C-accelerated YAML loaders, as
+well as via RunConfig itself, both with and without validation. Validation is
+measured with both the generated validator used by RunConfig.validate(), and
+Yamale itself.
+
+Usage:
+    python -m opera.test.benchmark.benchmark_runconfig [--input-files N] [--repeat N]
+
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import yaml
+import yamale
+from pkg_resources import resource_filename
+
+from opera.pge.runconfig import BASE_PGE_SCHEMA
+from opera.pge.runconfig import RunConfig
+from opera.pge.runconfig import YamlLoader
+from opera.util.schema_cache import get_schema
+
+
+def generate_runconfig(filename, num_input_files):
+    """
+    Writes a copy of the sample RunConfig listing the requested number of
+    input files.
+
+    Parameters
+    ----------
+    filename : str
+        Path to write the generated RunConfig to.
+    num_input_files : int
+        Number of input files to list within the InputFilesGroup.
+
+    """
+    sample_runconfig = resource_filename('opera', 'test/pge/data/valid_runconfig_full.yaml')
+
+    with open(sample_runconfig, 'r') as infile:
+        runconfig = yaml.safe_load(infile)
+
+    runconfig['RunConfig']['Groups']['PGE']['InputFilesGroup']['InputFilePaths'] = [
+        f'input/input_file{index:06d}.h5' for index in range(num_input_files)
+    ]
+
+    with open(filename, 'w') as outfile:
+        yaml.safe_dump(runconfig, outfile, sort_keys=False)
+
+
+def benchmark_loader(filename, loader):
+    """Returns the time, in seconds, to parse a YAML file with the provided loader class."""
+    start_time = time.perf_counter()
+
+    with open(filename, 'r') as infile:
+        yaml.load(infile, Loader=loader)
+
+    return time.perf_counter() - start_time
+
+
+def benchmark_runconfig(filename, validate):
+    """Returns the time, in seconds, to create (and optionally validate) a RunConfig."""
+    start_time = time.perf_counter()
+
+    runconfig = RunConfig(filename)
+
+    if validate:
+        runconfig.validate()
+
+    return time.perf_counter() - start_time
+
+
+def benchmark_yamale_validation(filename):
+    """Returns the time, in seconds, to create a RunConfig and validate it via Yamale itself."""
+    start_time = time.perf_counter()
+
+    runconfig = RunConfig(filename)
+
+    sas_schema_file = resource_filename('opera', f'schema/{runconfig.sas_schema_path}')
+    yamale.validate(get_schema(BASE_PGE_SCHEMA, sas_schema_file),
+                    [(runconfig._document, runconfig.filename)])
+
+    return time.perf_counter() - start_time
+
+
+def main():
+    """Runs the benchmark and prints a table of the results"""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--input-files', type=int, default=10000,
+                        help='Number of input files listed by the generated RunConfig.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of measurements per method, the best of which is reported.')
+
+    args = parser.parse_args()
+
+    methods = {'yaml.SafeLoader': lambda filename: benchmark_loader(filename, yaml.SafeLoader)}
+
+    if hasattr(yaml, 'CSafeLoader'):
+        methods['yaml.CSafeLoader'] = lambda filename: benchmark_loader(filename, yaml.CSafeLoader)
+    else:
+        print('PyYAML was built without libyaml, the C-accelerated loader is unavailable\n')
+
+    methods[f'RunConfig ({YamlLoader.__name__})'] = lambda filename: benchmark_runconfig(filename, False)
+    methods['RunConfig + validate()'] = lambda filename: benchmark_runconfig(filename, True)
+    methods['RunConfig + yamale.validate()'] = benchmark_yamale_validation
+
+    with tempfile.TemporaryDirectory(prefix='benchmark_runconfig_') as temp_dir:
+        filename = os.path.join(temp_dir, 'benchmark_runconfig.yaml')
+        generate_runconfig(filename, args.input_files)
+
+        print(f'RunConfig with {args.input_files:,} input files '
+              f'({os.path.getsize(filename):,} bytes)\n')
+        print(f'{"method":<32}{"milliseconds":>14}{"speedup":>10}')
+
+        results = {method: float('inf') for method in methods}
+
+        # Interleave the methods within each repetition, so any drift in
+        # machine load affects every method alike
+        for _ in range(args.repeat):
+            for method, benchmark in methods.items():
+                results[method] = min(results[method], benchmark(filename))
+
+    baseline = results['yaml.SafeLoader']
+
+    for method, elapsed_time in results.items():
+        print(f'{method:<32}{elapsed_time * 1000:>14,.1f}{baseline / elapsed_time:>9.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -20,16 +20,21 @@ test_base_pge.py
 
 Unit tests for the pge/base_pge.py module.
 """
+import asyncio
+import json
 import os
 import tempfile
 import unittest
 from io import StringIO
-from os.path import abspath, join
+from os.path import abspath, exists, join
 
+import yaml
 from pkg_resources import resource_filename
 
 from opera.pge import PgeExecutor, RunConfig
 from opera.util import PgeLogger
+from opera.util.error_codes import ErrorCode
+from opera.util.result_cache import SasResultCache
 
 
 class BasePgeTestCase(unittest.TestCase):
@@ -62,6 +67,30 @@ class BasePgeTestCase(unittest.TestCase):
         """Return to starting directory"""
         os.chdir(self.test_dir)
 
+    def _write_runconfig(self, test_name, configure):
+        """
+        Writes a copy of the test RunConfig to the working directory, with
+        output and scratch paths specific to the named test, after applying
+        the provided function to the PGE section of the copy.
+
+        Returns the path to the written RunConfig.
+        """
+        with open(join(self.data_dir, 'test_base_pge_config.yaml'), 'r') as infile:
+            runconfig_dict = yaml.safe_load(infile)
+
+        pge_config = runconfig_dict['RunConfig']['Groups']['PGE']
+        pge_config['ProductPathGroup']['OutputProductPath'] = f'{test_name}/outputs/'
+        pge_config['ProductPathGroup']['ScratchPath'] = f'{test_name}/scratch/'
+
+        configure(pge_config)
+
+        runconfig_path = f'test_base_pge_{test_name}_config.yaml'
+
+        with open(runconfig_path, 'w') as outfile:
+            yaml.safe_dump(runconfig_dict, outfile, sort_keys=False)
+
+        return runconfig_path
+
     def test_base_pge_execution(self):
         """
         Test execution of the PgeExecutor class and its associated mixins using
@@ -105,12 +134,242 @@ class BasePgeTestCase(unittest.TestCase):
         expected_log_file = join(pge.runconfig.output_product_path, pge.logger.get_file_name())
         self.assertTrue(os.path.exists(expected_log_file))
 
+        # The structured version of the log should only be written when requested
+        self.assertFalse(os.path.exists(expected_log_file.replace('.log', '.jsonl')))
+
         # Open the log file, and check that "SAS" output was captured
         with open(expected_log_file, 'r') as infile:
             log_contents = infile.read()
 
         self.assertIn('hello world', log_contents)
 
+        # Without a requested placement, the SAS should inherit our own
+        self.assertIn('SAS placement: threads=default, cpus=inherited', log_contents)
+
+        # Resource usage of the "SAS" should only be sampled when requested
+        self.assertNotIn('sas.process_tree', log_contents)
+        self.assertFalse(os.path.exists(expected_log_file.replace('.log', '_sas_resources.csv')))
+
+        # Check that the metrics accumulated over the job were summarized in
+        # the log, and written to JSON alongside it
+        self.assertIn('sas.preparation_seconds.count: 1', log_contents)
+
+        expected_metrics_file = expected_log_file.replace('.log', '_metrics.json')
+        self.assertTrue(os.path.exists(expected_metrics_file))
+
+        with open(expected_metrics_file, 'r') as infile:
+            metrics = json.load(infile)
+
+        self.assertGreater(metrics['counters']['sas.output_bytes'], 0)
+        self.assertEqual(metrics['histograms']['stage.load_runconfig.elapsed_seconds']['count'], 1)
+        self.assertIn('overall.elapsed_seconds', metrics['summary'])
+
+    def test_base_pge_execution_async(self):
+        """
+        Test concurrent execution of several PgeExecutor instances from a
+        single event loop via run_async(), including one whose SAS fails.
+        """
+        runconfig_path = join(self.data_dir, 'test_base_pge_config.yaml')
+        failing_runconfig_path = join(self.data_dir, 'test_sas_error_config.yaml')
+
+        pges = [
+            PgeExecutor(pge_name='AsyncPgeTest', runconfig_path=runconfig_path,
+                        logger=PgeLogger(log_filename=f'async_pge_test_{index}.log'))
+            for index in range(3)
+        ]
+
+        failing_pge = PgeExecutor(pge_name='AsyncFailedSasPgeTest', runconfig_path=failing_runconfig_path,
+                                  logger=PgeLogger(log_filename='async_pge_test_failed.log'))
+
+        async def run_all():
+            return await asyncio.gather(*[pge.run_async() for pge in pges + [failing_pge]],
+                                        return_exceptions=True)
+
+        results = asyncio.run(run_all())
+
+        self.assertListEqual(results[:-1], [None] * len(pges))
+        self.assertIsInstance(results[-1], RuntimeError)
+
+        for pge in pges:
+            expected_log_file = join(pge.runconfig.output_product_path, pge.logger.get_file_name())
+            self.assertTrue(os.path.exists(expected_log_file))
+
+            with open(expected_log_file, 'r') as infile:
+                log_contents = infile.read()
+
+            self.assertIn('hello world', log_contents)
+            self.assertIn('sas.elapsed_seconds', log_contents)
+
+        with open(failing_pge.logger.get_file_name(), 'r') as infile:
+            self.assertIn('failed with exit code 123', infile.read())
+
+    def test_base_pge_execution_result_cache(self):
+        """
+        Test that a repeated PgeExecutor job restores the outputs of the first
+        job from the result cache, rather than re-running the SAS.
+        """
+        def configure(pge_config):
+            # The "SAS" records each time it is run, and writes a single product
+            pge_config['PrimaryExecutable']['ProgramPath'] = 'bash'
+            pge_config['PrimaryExecutable']['ProgramOptions'] = [
+                '-c', 'echo run >> result_cache_test/sas_runs.txt; '
+                      'echo product > result_cache_test/outputs/product.txt'
+            ]
+
+        runconfig_path = self._write_runconfig('result_cache_test', configure)
+
+        result_cache = SasResultCache('result_cache_test/cache')
+
+        pge = PgeExecutor(pge_name='ResultCachePgeTest', runconfig_path=runconfig_path,
+                          logger=PgeLogger(log_filename='result_cache_test_first.log'),
+                          result_cache=result_cache)
+        pge.run()
+
+        with open(join(pge.runconfig.output_product_path, 'result_cache_test_first.log'), 'r') as infile:
+            log_contents = infile.read()
+
+        self.assertIn('sas.result_cache.hit: 0', log_contents)
+        self.assertIn('Stored 1 SAS output file(s)', log_contents)
+
+        os.remove('result_cache_test/outputs/product.txt')
+
+        pge = PgeExecutor(pge_name='ResultCachePgeTest', runconfig_path=runconfig_path,
+                          logger=PgeLogger(log_filename='result_cache_test_second.log'),
+                          result_cache=result_cache)
+        pge.run()
+
+        with open(join(pge.runconfig.output_product_path, 'result_cache_test_second.log'), 'r') as infile:
+            log_contents = infile.read()
+
+        self.assertIn('sas.result_cache.hit: 1', log_contents)
+        self.assertNotIn('Starting SAS executable', log_contents)
+
+        # The product should have been restored, with the SAS only run once
+        self.assertTrue(exists('result_cache_test/outputs/product.txt'))
+
+        with open('result_cache_test/sas_runs.txt', 'r') as infile:
+            self.assertEqual(infile.read(), 'run\n')
+
+    def test_base_pge_execution_resource_sampling(self):
+        """
+        Test that the resource usage of the SAS is sampled when requested by
+        the RunConfig.
+        """
+        def configure(pge_config):
+            # The "SAS" runs for long enough to be sampled a few times
+            pge_config['PrimaryExecutable']['ProgramPath'] = 'bash'
+            pge_config['PrimaryExecutable']['ProgramOptions'] = ['-c', 'sleep 0.3']
+            pge_config['PrimaryExecutable']['ResourceSamplingInterval'] = 0.1
+
+        runconfig_path = self._write_runconfig('resource_sampling_test', configure)
+
+        pge = PgeExecutor(pge_name='ResourceSamplingPgeTest', runconfig_path=runconfig_path,
+                          logger=PgeLogger(log_filename='resource_sampling_test.log'))
+        pge.run()
+
+        expected_log_file = join(pge.runconfig.output_product_path, 'resource_sampling_test.log')
+
+        with open(expected_log_file, 'r') as infile:
+            log_contents = infile.read()
+
+        self.assertIn('sas.process_tree.rss_kb.peak', log_contents)
+        self.assertIn('sas.process_tree.cpu_seconds.total', log_contents)
+
+        expected_series_file = expected_log_file.replace('.log', '_sas_resources.csv')
+        self.assertTrue(os.path.exists(expected_series_file))
+
+    def test_base_pge_execution_write_behind(self):
+        """
+        Test that the log is mirrored to a write-behind journal over the
+        course of the job when requested by the RunConfig, and that the
+        journal is removed once the log is finalized.
+        """
+        def configure(pge_config):
+            # The "SAS" checks the journal, which sits alongside the final
+            # destination of the log, once its own start has been flushed to it
+            pge_config['PrimaryExecutable']['ProgramPath'] = 'bash'
+            pge_config['PrimaryExecutable']['ProgramOptions'] = [
+                '-c', 'sleep 0.5; '
+                      'grep -q "Starting SAS executable" write_behind_test/outputs/write_behind_test.log.partial '
+                      '&& echo "SAS start found in journal"'
+            ]
+            pge_config['LoggingGroup'] = {'WriteBehindJournal': True, 'JournalFlushInterval': 0.1}
+
+        runconfig_path = self._write_runconfig('write_behind_test', configure)
+
+        pge = PgeExecutor(pge_name='WriteBehindPgeTest', runconfig_path=runconfig_path,
+                          logger=PgeLogger(log_filename='write_behind_test.log'))
+        pge.run()
+
+        expected_log_file = join(pge.runconfig.output_product_path, 'write_behind_test.log')
+
+        with open(expected_log_file, 'r') as infile:
+            log_contents = infile.read()
+
+        self.assertIn('SAS start found in journal', log_contents)
+
+        self.assertFalse(os.path.exists(expected_log_file + '.partial'))
+
+    def test_base_pge_execution_json_lines(self):
+        """
+        Test that a structured version of the log, covering the entire job, is
+        written alongside the log when requested by the RunConfig.
+        """
+        def configure(pge_config):
+            pge_config['LoggingGroup'] = {'JsonLinesLog': True}
+
+        runconfig_path = self._write_runconfig('json_lines_test', configure)
+
+        pge = PgeExecutor(pge_name='JsonLinesPgeTest', runconfig_path=runconfig_path,
+                          logger=PgeLogger(log_filename='json_lines_test.log'))
+        pge.run()
+
+        expected_json_lines_file = join(pge.runconfig.output_product_path, 'json_lines_test.jsonl')
+        self.assertTrue(os.path.exists(expected_json_lines_file))
+
+        with open(expected_json_lines_file, 'r') as infile:
+            records = [json.loads(line) for line in infile]
+
+        # Messages logged before the RunConfig requested structured output
+        # (and so before its error code base applied) should be recorded too
+        error_codes = [record.get('error_code') for record in records]
+
+        self.assertIn(PgeLogger.LOGGER_CODE_BASE + ErrorCode.LOADING_RUN_CONFIG_FILE, error_codes)
+        self.assertIn(PgeLogger.LOGGER_CODE_BASE + ErrorCode.VALIDATING_RUN_CONFIG_FILE, error_codes)
+        self.assertTrue(any(record['description'].startswith('hello world') for record in records))
+
+        sas_elapsed_seconds = [record['value'] for record in records
+                               if record.get('metric') == 'sas.elapsed_seconds']
+        self.assertEqual(len(sas_elapsed_seconds), 1)
+        self.assertIsInstance(sas_elapsed_seconds[0], float)
+
+    def test_base_pge_execution_placement(self):
+        """
+        Test that the SAS is executed with the thread count and CPU affinity
+        requested by the RunConfig.
+        """
+        cpu = min(os.sched_getaffinity(0))
+
+        def configure(pge_config):
+            pge_config['PrimaryExecutable']['ProgramPath'] = 'bash'
+            pge_config['PrimaryExecutable']['ProgramOptions'] = [
+                '-c', 'echo "threads=$OMP_NUM_THREADS"; grep Cpus_allowed_list /proc/self/status'
+            ]
+            pge_config['ProcessingResourcesGroup'] = {'NumThreads': 2, 'CpuAffinity': [cpu]}
+
+        runconfig_path = self._write_runconfig('placement_test', configure)
+
+        pge = PgeExecutor(pge_name='PlacementPgeTest', runconfig_path=runconfig_path,
+                          logger=PgeLogger(log_filename='placement_test.log'))
+        pge.run()
+
+        with open(join(pge.runconfig.output_product_path, 'placement_test.log'), 'r') as infile:
+            log_contents = infile.read()
+
+        self.assertIn(f'SAS placement: threads=2, cpus=[{cpu}]', log_contents)
+        self.assertIn('threads=2', log_contents)
+        self.assertRegex(log_contents, rf'Cpus_allowed_list:\s+{cpu}\n')
+
     def test_base_pge_w_invalid_runconfig(self):
         """
         Test execution of the PgeExecutor using a RunConfig that will fail
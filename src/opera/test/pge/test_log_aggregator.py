@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021, by the California Institute of Technology.
+# ALL RIGHTS RESERVED.
+# United States Government sponsorship acknowledged.
+# Any commercial use must be negotiated with the Office of Technology Transfer
+# at the California Institute of Technology.
+# This software may be subject to U.S. export control laws and regulations.
+# By accepting this document, the user agrees to comply with all applicable
+# U.S. export laws and regulations. User has the responsibility to obtain
+# export licenses, or other export authority as may be required, before
+# exporting such information to foreign countries or providing access to
+# foreign persons.
+#
+
+"""
+======================
+test_log_aggregator.py
+======================
+
+Unit tests for the util/log_aggregator.py module.
+"""
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+from os.path import abspath
+
+from pkg_resources import resource_filename
+
+from opera.util.log_aggregator import LogAggregator
+from opera.util.log_sink import QueueLogSink
+from opera.util.logger import PgeLogger
+
+
+def _run_forwarding_job(log_queue, job_index):
+    """Logs a few messages from a child process, forwarding them to the queue"""
+    logger = PgeLogger(log_filename=f'test_job_{job_index}.log')
+    logger.enable_forwarding(log_queue, source=f'job_{job_index}')
+
+    logger.info('opera_pge', 0, f'Message from job {job_index}')
+    logger.append_text(f'SAS output from job {job_index}\n')
+
+    try:
+        if job_index == 1:
+            logger.critical('opera_pge', 0, f'Job {job_index} failed')
+    except RuntimeError:
+        return
+
+    logger.close_log_stream()
+
+
+class LogAggregatorTestCase(unittest.TestCase):
+    """Base test class using unittest"""
+
+    starting_dir = None
+    working_dir = None
+    test_dir = None
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """Set up directories for testing"""
+        cls.starting_dir = abspath(os.curdir)
+        cls.test_dir = resource_filename(__name__, "")
+
+        os.chdir(cls.test_dir)
+
+        cls.working_dir = tempfile.TemporaryDirectory(
+            prefix="test_log_aggregator_", suffix='_temp', dir=os.curdir
+        )
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """At completion re-establish starting directory"""
+        cls.working_dir.cleanup()
+        os.chdir(cls.starting_dir)
+
+    def setUp(self) -> None:
+        """Use the temporary directory as the working directory"""
+        os.chdir(self.working_dir.name)
+
+    def tearDown(self) -> None:
+        """Return to starting directory"""
+        os.chdir(self.test_dir)
+
+    def test_log_aggregator_ordering(self):
+        """Test that lines received out of order are written in the order they were forwarded"""
+        now = time.time()
+
+        with LogAggregator('test_ordering_node.log', metrics_interval=0.1) as aggregator:
+            aggregator.queue.put((QueueLogSink.OPEN, 'job_a', now, 100))
+            aggregator.queue.put((QueueLogSink.TEXT, 'job_a', now + 0.2, 'third\n'))
+            aggregator.queue.put((QueueLogSink.TEXT, 'job_a', now + 0.1, 'first, Warning, '))
+            aggregator.queue.put((QueueLogSink.TEXT, 'job_a', now + 0.15, 'second half\n'))
+            aggregator.queue.put((QueueLogSink.CLOSE, 'job_a', now + 0.3, False))
+
+            # Allow at least one set of rolling metrics to be written
+            time.sleep(0.3)
+
+        with open('test_ordering_node.log', 'r') as infile:
+            lines = infile.read().splitlines()
+
+        job_lines = [line for line in lines if line.startswith('job_a: ')]
+
+        self.assertListEqual(job_lines, ['job_a: Job log opened by process 100',
+                                         'job_a: first, Warning, second half',
+                                         'job_a: third',
+                                         'job_a: Job log closed (succeeded)'])
+
+        self.assertTrue(any('node.window.log_messages.warning.per_second' in line for line in lines))
+        self.assertTrue(all(line.startswith(('job_a: ', 'aggregator: ')) for line in lines))
+
+        with open(aggregator.get_metrics_file_name(), 'r') as infile:
+            metrics = json.load(infile)
+
+        self.assertEqual(metrics['counters']['node.jobs.started'], 1)
+        self.assertEqual(metrics['counters']['node.log_messages.warning'], 1)
+        self.assertEqual(metrics['gauges']['node.jobs.active'], 0)
+
+    def test_log_aggregator_late_forwarding(self):
+        """Test that lines logged before forwarding was enabled are ordered by the time they were logged"""
+        logger = PgeLogger(log_filename='test_late_forwarding.log')
+        logger.info('opera_pge', 0, 'Message logged before forwarding was enabled')
+        logger.append_text('SAS output logged before forwarding was enabled\n')
+
+        time.sleep(0.2)
+
+        with LogAggregator('test_late_forwarding_node.log') as aggregator:
+            aggregator.queue.put((QueueLogSink.TEXT, 'job_b', time.time() - 0.1, 'Line forwarded by another job\n'))
+
+            logger.enable_forwarding(aggregator.queue, source='job_a')
+            logger.close_log_stream()
+
+        with open('test_late_forwarding_node.log', 'r') as infile:
+            lines = [line for line in infile.read().splitlines() if line.startswith(('job_a: ', 'job_b: '))]
+
+        self.assertEqual(lines[0], 'job_a: Job log opened by process ' + str(os.getpid()))
+        self.assertIn('Message logged before forwarding was enabled', lines[1])
+        self.assertEqual(lines[2], 'job_a: SAS output logged before forwarding was enabled')
+        self.assertEqual(lines[3], 'job_b: Line forwarded by another job')
+
+    def test_log_aggregator_processes(self):
+        """Test aggregation of the logs forwarded by concurrent processes"""
+        with LogAggregator('test_processes_node.log') as aggregator:
+            processes = [multiprocessing.Process(target=_run_forwarding_job,
+                                                 args=(aggregator.queue, job_index))
+                         for job_index in range(3)]
+
+            for process in processes:
+                process.start()
+
+            for process in processes:
+                process.join()
+
+        # The logs of the jobs themselves should be unaffected
+        with open('test_job_0.log', 'r') as infile:
+            job_log = infile.read()
+
+        self.assertIn('Message from job 0', job_log)
+        self.assertNotIn('job_0: ', job_log)
+
+        with open('test_processes_node.log', 'r') as infile:
+            node_log = infile.read()
+
+        for job_index in range(3):
+            self.assertIn(f'job_{job_index}: SAS output from job {job_index}\n', node_log)
+
+        self.assertIn('job_1: Job log closed (failed)', node_log)
+        self.assertEqual(node_log.count('Job log closed (succeeded)'), 2)
+        self.assertIn('node.jobs.failed: 1', node_log)
+        self.assertIn('node.log_messages.critical: 1', node_log)
+
+
+if __name__ == "__main__":
+    unittest.main()
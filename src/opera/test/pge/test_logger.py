@@ -22,21 +22,29 @@ test_logger.py
 Unit tests for the util/logger.py module.
 
 """
+import json
 import os
 import re
+import subprocess
+import sys
 import tempfile
+import threading
+import time
 import unittest
 from io import StringIO
 from os.path import abspath, exists, join
 from random import randint
+from unittest.mock import patch
 
 from pkg_resources import resource_filename
 
 from opera.util.error_codes import CODES_PER_RANGE, CRITICAL_RANGE_START, DEBUG_RANGE_START, ErrorCode, \
     INFO_RANGE_START, WARNING_RANGE_START
+from opera.util.logger import MAX_PARTIAL_LINE_LENGTH
 from opera.util.logger import PgeLogger
 from opera.util.logger import default_log_file_name
 from opera.util.logger import get_severity_from_error_code
+from opera.util.logger import open_pge_log
 from opera.util.logger import standardize_severity_string
 from opera.util.logger import write
 
@@ -274,6 +282,402 @@ class LoggerTestCase(unittest.TestCase):
                 self.assertIn("test_pge_args", line)
                 self.assertIn("1717", line)
 
+    def test_append_text_severity_counts(self):
+        """
+        Test that log messages within appended text are tallied by severity
+        as they arrive, including lines split across multiple appends.
+        """
+        logger = PgeLogger()
+        initial_counts = logger.get_log_count_by_severity_dict().copy()
+
+        sas_output = ("2021-10-05T19:03:04.000000Z, Info, sas, 1, sas.py, 10, first message\n"
+                      "2021-10-05T19:03:04.000000Z, Warning, sas, 2, sas.py, 20, second message\n"
+                      "plain output without a severity, or any log format\n"
+                      "2021-10-05T19:03:04.000000Z, Debug, sas, 3, sas.py, 30, third message\n"
+                      "2021-10-05T19:03:04.000000Z, Info, sas, 4, sas.py, 40, final message without newline")
+
+        # Append in small chunks so lines, and severities, are split across calls
+        for index in range(0, len(sas_output), 7):
+            logger.append_text(sas_output[index:index + 7])
+
+        expected_counts = dict(initial_counts)
+        expected_counts['Info'] += 1
+        expected_counts['Warning'] += 1
+        expected_counts['Debug'] += 1
+
+        self.assertEqual(logger.get_log_count_by_severity_dict(), expected_counts)
+
+        # The final incomplete line should be tallied by the log summary
+        logger.write_log_summary()
+
+        log_contents = logger.get_stream_object().getvalue()
+
+        self.assertIn(f"overall.log_messages.info: {expected_counts['Info'] + 1}", log_contents)
+        self.assertIn(f"overall.log_messages.warning: {expected_counts['Warning']}", log_contents)
+
+    def test_pge_logger_spill_to_disk(self):
+        """
+        Test that a logger with a bounded in-memory size spills to disk once
+        the bound is exceeded, with no change to the finalized log file.
+        """
+        spill_dir = tempfile.TemporaryDirectory(prefix="spill_", dir=os.curdir)
+
+        logger = PgeLogger(log_filename='test_spill.log', max_memory_size=1024,
+                           spill_dir=spill_dir.name)
+
+        logger.info('opera_pge', 0, 'First message, kept in memory')
+
+        self.assertFalse(logger.spilled)
+        self.assertIsInstance(logger.get_stream_object(), StringIO)
+        self.assertListEqual(os.listdir(spill_dir.name), [])
+
+        for index in range(50):
+            logger.info('opera_pge', 0, f'Message {index} of a verbose log')
+
+        logger.append_text('Appended SAS output\n')
+
+        # The log should now be held within a temp file in the spill directory
+        self.assertTrue(logger.spilled)
+        self.assertEqual(len(os.listdir(spill_dir.name)), 1)
+
+        logger.resync_log_count_by_severity()
+        self.assertEqual(logger.get_log_count_by_severity('Info'), 51)
+
+        logger.warning('opera_pge', 0, 'Message after the resync')
+
+        logger.move('test_spill_moved.log')
+        logger.close_log_stream()
+
+        # The spill file should be removed once the log is finalized
+        self.assertListEqual(os.listdir(spill_dir.name), [])
+
+        with open('test_spill_moved.log', 'r') as infile:
+            log_contents = infile.read()
+
+        self.assertIn('First message, kept in memory', log_contents)
+        self.assertIn('Message 49 of a verbose log', log_contents)
+        self.assertIn('Appended SAS output', log_contents)
+        self.assertIn('Message after the resync', log_contents)
+        self.assertIn('overall.log_messages.info: 51', log_contents)
+
+        spill_dir.cleanup()
+
+    def test_pge_logger_location_modes(self):
+        """
+        Test that the fast caller location mode logs the same locations as the
+        inspect mode, and that location capture may be disabled entirely.
+        """
+        with self.assertRaises(ValueError):
+            PgeLogger(location_mode='slow')
+
+        locations = {}
+
+        for location_mode in ('inspect', 'fast'):
+            logger = PgeLogger(location_mode=location_mode)
+
+            # Log from two distinct lines, and repeatedly from the same line,
+            # both directly and through the severity-specific helper methods
+            for _ in range(2):
+                logger.write('Info', 'opera_pge', 0, 'Logged via write()')
+                logger.info('opera_pge', 0, 'Logged via info()')
+
+            logger.log_one_metric('opera_pge', 'test.metric', 1)
+
+            locations[location_mode] = [line.split(', ')[4]
+                                        for line in logger.get_stream_object().getvalue().splitlines()]
+
+        self.assertListEqual(locations['fast'], locations['inspect'])
+        self.assertTrue(all(location.startswith(__file__) for location in locations['fast']))
+        self.assertEqual(locations['fast'][0], locations['fast'][2])
+        self.assertNotEqual(locations['fast'][0], locations['fast'][1])
+
+        logger = PgeLogger(location_mode='off')
+        logger.info('opera_pge', 0, 'Logged without a location')
+
+        self.assertIn(', N/A, "Logged without a location"', logger.get_stream_object().getvalue())
+
+    def test_pge_logger_write_behind(self):
+        """
+        Test that a logger with write-behind enabled mirrors its messages to a
+        journal on disk prior to the log being closed, and removes the journal
+        once the log file is written.
+        """
+        logger = PgeLogger(log_filename='test_write_behind.log')
+        logger.info('opera_pge', 0, 'Message logged before write-behind was enabled')
+
+        logger.enable_write_behind(flush_interval=0.05)
+
+        self.assertEqual(logger.get_journal_file_name(), 'test_write_behind.log.partial')
+
+        logger.info('opera_pge', 0, 'Message logged after write-behind was enabled')
+        logger.append_text('Appended SAS output\n')
+
+        logger.move('test_write_behind_moved.log')
+
+        self.assertFalse(exists('test_write_behind.log.partial'))
+        self.assertEqual(logger.get_journal_file_name(), 'test_write_behind_moved.log.partial')
+
+        logger.info('opera_pge', 0, 'Message logged after the move')
+
+        # Messages should reach the journal once the flush interval elapses
+        time.sleep(0.5)
+
+        with open('test_write_behind_moved.log.partial', 'r') as infile:
+            journal_contents = infile.read()
+
+        self.assertIn('Message logged before write-behind was enabled', journal_contents)
+        self.assertIn('Appended SAS output', journal_contents)
+        self.assertIn('Message logged after the move', journal_contents)
+
+        with self.assertRaises(RuntimeError):
+            logger.critical('opera_pge', 0, 'Critical message with write-behind enabled')
+
+        self.assertFalse(exists('test_write_behind_moved.log.partial'))
+
+        with open('test_write_behind_moved.log', 'r') as infile:
+            log_contents = infile.read()
+
+        self.assertTrue(log_contents.startswith(journal_contents))
+        self.assertIn('Critical message with write-behind enabled', log_contents)
+
+    def test_pge_logger_write_behind_killed(self):
+        """
+        Test that the write-behind journal retains the log of a process which
+        is killed before its log is closed.
+        """
+        script = ('import os, signal, time\n'
+                  'from opera.util.logger import PgeLogger\n'
+                  'logger = PgeLogger(log_filename="test_write_behind_killed.log", write_behind=True)\n'
+                  'for index in range(1000):\n'
+                  '    logger.info("opera_pge", 0, f"Message {index} before being killed")\n'
+                  'time.sleep(1.5)\n'
+                  'os.kill(os.getpid(), signal.SIGKILL)\n')
+
+        result = subprocess.run([sys.executable, '-c', script],
+                                env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+
+        self.assertNotEqual(result.returncode, 0)
+        self.assertFalse(exists('test_write_behind_killed.log'))
+
+        with open('test_write_behind_killed.log.partial', 'r') as infile:
+            journal_contents = infile.read()
+
+        self.assertIn('Message 999 before being killed', journal_contents)
+
+    def test_pge_logger_write_behind_failure(self):
+        """
+        Test that a logger with write-behind enabled neither hangs nor loses
+        messages should the journal writer thread exit unexpectedly, or stop
+        responding.
+        """
+        logger = PgeLogger(log_filename='test_write_behind_failure.log', write_behind=True)
+        logger.info('opera_pge', 0, 'Message logged before the writer thread exited')
+
+        # Enqueue an item the writer thread cannot handle, causing it to exit
+        with patch('threading.excepthook'):
+            logger._sink._queue.put(0)
+            logger._sink._thread.join(timeout=5)
+
+        self.assertFalse(logger._sink._thread.is_alive())
+
+        logger.info('opera_pge', 0, 'Message logged after the writer thread exited')
+        logger.move('test_write_behind_failure_moved.log')
+
+        with open('test_write_behind_failure_moved.log.partial', 'r') as infile:
+            journal_contents = infile.read()
+
+        self.assertIn('Message logged before the writer thread exited', journal_contents)
+        self.assertIn('Message logged after the writer thread exited', journal_contents)
+
+        logger.close_log_stream()
+
+        self.assertTrue(exists('test_write_behind_failure_moved.log'))
+        self.assertFalse(exists('test_write_behind_failure_moved.log.partial'))
+
+        # A writer thread which stops responding should only be waited on for so long
+        logger = PgeLogger(log_filename='test_write_behind_blocked.log', write_behind=True)
+        release = threading.Event()
+
+        with patch('opera.util.log_sink.COMMAND_TIMEOUT', 0.5), \
+                patch.object(logger._sink, '_run_command', side_effect=lambda *args: release.wait()):
+            start_time = time.monotonic()
+            logger._sink.flush()
+
+            self.assertLess(time.monotonic() - start_time, 5)
+            self.assertIsInstance(logger._sink.error, TimeoutError)
+
+        release.set()
+        logger.close_log_stream()
+
+        with open('test_write_behind_blocked.log', 'r') as infile:
+            log_contents = infile.read()
+
+        self.assertIn('Write-behind journal test_write_behind_blocked.log.partial is incomplete', log_contents)
+
+    def test_pge_logger_json_lines(self):
+        """
+        Test that a logger with JSON lines output enabled records each message,
+        metric and line of appended text as a typed JSON object.
+        """
+        logger = PgeLogger(log_filename='test_json_lines.log', json_lines=True)
+
+        logger.info('opera_pge', 0, 'A description, with commas, and "quotes"')
+        logger.log_one_metric('opera_pge', 'test.metric.int', 17)
+        logger.log_one_metric('opera_pge', 'test.metric.float', 1.5)
+        logger.append_text('2021-10-05T19:03:04.000000Z, Warning, sas, 2, sas.py, 20, SAS warning\nplain SAS ')
+        logger.append_text('output\nfinal line without newline')
+
+        logger.move('test_json_lines_moved.log')
+        self.assertEqual(logger.get_json_lines_file_name(), 'test_json_lines_moved.jsonl')
+
+        logger.close_log_stream()
+
+        self.assertFalse(exists('test_json_lines.jsonl'))
+
+        with open('test_json_lines_moved.jsonl', 'r') as infile:
+            records = [json.loads(line) for line in infile]
+
+        self.assertEqual(records[0]['severity'], 'Info')
+        self.assertEqual(records[0]['module'], 'opera_pge')
+        self.assertEqual(records[0]['error_code'], PgeLogger.LOGGER_CODE_BASE)
+        self.assertEqual(records[0]['description'], 'A description, with commas, and "quotes"')
+        self.assertRegex(records[0]['time'], self.iso_regex)
+        self.assertIn('test_logger.py:', records[0]['location'])
+
+        self.assertEqual(records[1]['metric'], 'test.metric.int')
+        self.assertEqual(records[1]['value'], 17)
+        self.assertEqual(records[1]['error_code'], PgeLogger.LOGGER_CODE_BASE + ErrorCode.SUMMARY_STATS_MESSAGE)
+        self.assertEqual(records[2]['value'], 1.5)
+
+        self.assertEqual(records[3]['severity'], 'Warning')
+        self.assertEqual(records[4], {'time': records[4]['time'], 'severity': None,
+                                      'description': 'plain SAS output'})
+
+        # The final line of appended text is recorded by the log summary
+        self.assertEqual(records[5]['description'], 'final line without newline')
+
+        summary_metrics = {record['metric']: record['value'] for record in records if 'metric' in record}
+        self.assertEqual(summary_metrics['overall.log_messages.warning'], 1)
+        self.assertIsInstance(summary_metrics['overall.elapsed_seconds'], float)
+
+    def test_pge_logger_json_lines_enabled_late(self):
+        """
+        Test that enabling JSON lines output records the messages already
+        logged, and that overly long lines of appended text are recorded in
+        fragments, rather than held in memory until complete.
+        """
+        logger = PgeLogger(log_filename='test_json_lines_late.log')
+
+        logger.info('opera_pge', 0, 'Message logged before JSON lines output was enabled')
+        logger.append_text('SAS output logged before\nSAS output split by ')
+
+        logger.enable_json_lines()
+
+        logger.append_text('enabling JSON lines output\n')
+        logger.append_text('x' * MAX_PARTIAL_LINE_LENGTH)
+        logger.append_text('y' * 10 + '\n')
+        logger.close_log_stream()
+
+        with open('test_json_lines_late.jsonl', 'r') as infile:
+            records = [json.loads(line) for line in infile]
+
+        self.assertEqual(records[0]['description'], 'Message logged before JSON lines output was enabled')
+        self.assertEqual(records[0]['error_code'], PgeLogger.LOGGER_CODE_BASE)
+        self.assertEqual(records[1], {'time': records[0]['time'], 'severity': None,
+                                      'description': 'SAS output logged before'})
+        self.assertEqual(records[2]['description'], 'SAS output split by enabling JSON lines output')
+
+        self.assertEqual(records[3]['description'], 'x' * MAX_PARTIAL_LINE_LENGTH)
+        self.assertTrue(records[3]['partial'])
+        self.assertEqual(records[4]['description'], 'y' * 10)
+        self.assertTrue(records[4]['partial'])
+        self.assertNotIn('partial', records[5])
+
+        # The start of a line split across calls should not be held beyond the limit
+        self.assertEqual(logger._partial_line, '')
+
+    def test_pge_logger_compression(self):
+        """
+        Test that logs are compressed when closed, when requested, and that
+        open_pge_log() reads compressed and uncompressed logs alike.
+        """
+        with self.assertRaises(ValueError):
+            PgeLogger(compression='zip')
+
+        for compression, extension in (('gzip', '.gz'), ('lzma', '.xz'), (None, '')):
+            logger = PgeLogger(log_filename=f'test_compression_{compression}.log',
+                               compression=compression, json_lines=True)
+            logger.info('opera_pge', 0, f'Message from a {compression} compressed log')
+            logger.close_log_stream()
+
+            self.assertEqual(logger.get_file_name(), f'test_compression_{compression}.log{extension}')
+            self.assertTrue(exists(f'test_compression_{compression}.jsonl{extension}'))
+
+            # The log should be readable via either its final or original name
+            for filename in (logger.get_file_name(), f'test_compression_{compression}.log'):
+                with open_pge_log(filename) as infile:
+                    self.assertIn(f'Message from a {compression} compressed log', infile.read())
+
+            with open_pge_log(f'test_compression_{compression}.jsonl') as infile:
+                self.assertEqual(json.loads(infile.readline())['description'],
+                                 f'Message from a {compression} compressed log')
+
+        # Compressed logs should actually be compressed
+        with open('test_compression_gzip.log.gz', 'rb') as infile:
+            self.assertEqual(infile.read(2), b'\x1f\x8b')
+
+    def test_pge_logger_level(self):
+        """
+        Test that messages below the level of the logger are discarded without
+        being formatted or counted, and that lazy descriptions are formatted
+        when logged.
+        """
+        with self.assertRaises(ValueError):
+            PgeLogger(level='Verbose')
+
+        def unexpected_call():
+            raise AssertionError('Description of a discarded message was evaluated')
+
+        logger = PgeLogger(level='info')
+        self.assertEqual(logger.level, 'Info')
+        self.assertFalse(logger.is_enabled_for('Debug'))
+        self.assertTrue(logger.is_enabled_for('Warning'))
+
+        logger.debug('opera_pge', 0, unexpected_call)
+        logger.debug('opera_pge', 0, 'Discarded debug message %s', 1)
+        logger.write('Debug', 'opera_pge', 0, unexpected_call)
+        logger.log('opera_pge', ErrorCode.SAS_EXE_COMMAND_LINE, unexpected_call)
+
+        logger.info('opera_pge', 0, 'Formatted %s message number %d', 'info', 1)
+        logger.warning('opera_pge', 0, lambda: 'Message from a callable')
+        logger.info('opera_pge', 0, lambda count: f'Message from a callable with {count} argument', 1)
+        logger.info('opera_pge', 0, 'Unformatted message with a literal %s')
+
+        stream = logger.get_stream_object().getvalue()
+
+        self.assertNotIn('Discarded', stream)
+        self.assertIn('"Formatted info message number 1"', stream)
+        self.assertIn('"Message from a callable"', stream)
+        self.assertIn('"Message from a callable with 1 argument"', stream)
+        self.assertIn('"Unformatted message with a literal %s"', stream)
+        self.assertEqual(logger.log_count_by_severity['Debug'], 0)
+        self.assertEqual(logger.log_count_by_severity['Info'], 3)
+
+        # Critical messages, and the closing summary, are always logged
+        logger.level = 'Critical'
+
+        with self.assertRaises(RuntimeError) as context:
+            logger.critical('opera_pge', 0, 'Critical message number %d', 1)
+
+        self.assertIn('Critical message number 1', str(context.exception))
+
+        with open(logger.get_file_name(), 'r') as infile:
+            log = infile.read()
+
+        self.assertIn('"Critical message number 1"', log)
+        self.assertIn('overall.log_messages.info: 3', log)
+        self.assertIn('overall.elapsed_seconds', log)
+
     def add_backframe(self, back_frames):
         """
         Makes a logs one line, then calls another method, that also logs one line
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021, by the California Institute of Technology.
+# ALL RIGHTS RESERVED.
+# United States Government sponsorship acknowledged.
+# Any commercial use must be negotiated with the Office of Technology Transfer
+# at the California Institute of Technology.
+# This software may be subject to U.S. export control laws and regulations.
+# By accepting this document, the user agrees to comply with all applicable
+# U.S. export laws and regulations. User has the responsibility to obtain
+# export licenses, or other export authority as may be required, before
+# exporting such information to foreign countries or providing access to
+# foreign persons.
+#
+
+"""
+===============
+test_metrics.py
+===============
+
+Unit tests for the util/metrics.py module.
+"""
+import json
+import os
+import tempfile
+import unittest
+from os.path import abspath
+
+from pkg_resources import resource_filename
+
+from opera.util.logger import PgeLogger
+from opera.util.metrics import MetricsRegistry
+from opera.util.metrics import StageTimer
+from opera.util.metrics import timed_stage
+
+
+class MetricsTestCase(unittest.TestCase):
+    """Base test class using unittest"""
+
+    starting_dir = None
+    working_dir = None
+    test_dir = None
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """Set up directories for testing"""
+        cls.starting_dir = abspath(os.curdir)
+        cls.test_dir = resource_filename(__name__, "")
+
+        os.chdir(cls.test_dir)
+
+        cls.working_dir = tempfile.TemporaryDirectory(
+            prefix="test_metrics_", suffix='_temp', dir=os.curdir
+        )
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """At completion re-establish starting directory"""
+        cls.working_dir.cleanup()
+        os.chdir(cls.starting_dir)
+
+    def setUp(self) -> None:
+        """Use the temporary directory as the working directory"""
+        os.chdir(self.working_dir.name)
+
+    def tearDown(self) -> None:
+        """Return to starting directory"""
+        os.chdir(self.test_dir)
+
+    def test_metrics_registry(self):
+        """Test accumulation of each kind of metric within the registry"""
+        metrics = MetricsRegistry()
+
+        metrics.counter('test.bytes').increment(10)
+        metrics.counter('test.bytes').increment(5)
+        metrics.gauge('test.depth').set(3)
+
+        for value in (1, 4, 4, 100):
+            metrics.histogram('test.sizes', buckets=(2, 4, 8)).observe(value)
+
+        with metrics.timer('test.seconds') as timer:
+            pass
+
+        self.assertGreaterEqual(timer.elapsed_time, 0)
+
+        with self.assertRaises(ValueError):
+            metrics.counter('test.bytes').increment(-1)
+
+        with self.assertRaises(ValueError):
+            metrics.gauge('test.bytes')
+
+        snapshot = metrics.snapshot()
+
+        self.assertEqual(snapshot['counters'], {'test.bytes': 15})
+        self.assertEqual(snapshot['gauges'], {'test.depth': 3})
+        self.assertDictEqual(snapshot['histograms']['test.sizes'],
+                             {'count': 4, 'sum': 109, 'min': 1, 'max': 100, 'mean': 27.25,
+                              'buckets': {'2': 1, '4': 2, '8': 0, 'inf': 1}})
+        self.assertEqual(snapshot['histograms']['test.seconds']['count'], 1)
+
+        summary = dict(metrics.summary())
+
+        self.assertEqual(summary['test.bytes'], 15)
+        self.assertEqual(summary['test.depth'], 3)
+        self.assertEqual(summary['test.sizes.count'], 4)
+        self.assertEqual(summary['test.sizes.max'], 100)
+
+    def test_logger_metrics(self):
+        """Test that the metrics of a logger are summarized and written to JSON when closed"""
+        logger = PgeLogger(log_filename='test_logger_metrics.log')
+        logger.metrics.counter('test.files').increment(2)
+        logger.close_log_stream()
+
+        self.assertEqual(logger.get_metrics_file_name(), 'test_logger_metrics_metrics.json')
+
+        with open('test_logger_metrics.log', 'r') as infile:
+            self.assertIn('test.files: 2', infile.read())
+
+        with open('test_logger_metrics_metrics.json', 'r') as infile:
+            metrics = json.load(infile)
+
+        self.assertEqual(metrics['counters']['test.files'], 2)
+        self.assertIn('overall.elapsed_seconds', metrics['summary'])
+
+        # The time taken to close the log is only available from the JSON file
+        self.assertEqual(metrics['histograms']['stage.close_log_stream.elapsed_seconds']['count'], 1)
+
+    def test_timed_stage(self):
+        """Test that timed stages record their elapsed time and resource usage"""
+
+        class Stages:
+            """Minimal stand-in for a PGE, with stages which may create the logger"""
+
+            def __init__(self):
+                self.logger = None
+
+            @timed_stage()
+            def _initialize_logger(self):
+                self.logger = PgeLogger()
+
+            @timed_stage(name='failing')
+            def fail(self):
+                raise RuntimeError('Stage failed')
+
+        stages = Stages()
+        stages._initialize_logger()
+
+        with self.assertRaises(RuntimeError):
+            stages.fail()
+
+        snapshot = stages.logger.metrics.snapshot()
+
+        for stage_name in ('initialize_logger', 'failing'):
+            self.assertEqual(snapshot['histograms'][f'stage.{stage_name}.elapsed_seconds']['count'], 1)
+            self.assertGreaterEqual(snapshot['counters'][f'stage.{stage_name}.user_cpu_seconds'], 0)
+            self.assertGreater(snapshot['gauges'][f'stage.{stage_name}.max_rss_kb'], 0)
+
+        # Stages run without a logger are not recorded
+        with StageTimer(None, 'unrecorded') as stage_timer:
+            pass
+
+        self.assertGreaterEqual(stage_timer.elapsed_time, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -20,16 +20,22 @@ test_main_pge.py
 
 Unit tests for the pge/base_pge.py module.
 """
+import json
 import os
 import tempfile
 import unittest
 from os.path import abspath, join
+from unittest import mock
 
 from pkg_resources import resource_filename
 
+import yaml
+
 from opera.pge import PgeExecutor, RunConfig
+from opera.scripts.pge_main import get_run_config_filenames
 from opera.scripts.pge_main import load_run_config_file
 from opera.scripts.pge_main import open_log_file
+from opera.scripts.pge_main import pge_batch
 from opera.scripts.pge_main import pge_start
 from opera.util import PgeLogger
 
@@ -160,12 +166,130 @@ class PgeMainTestCase(unittest.TestCase):
         Verifies proper error is seen when a bad file is passed to pge_start()
 
         """
-        # Verify the function call returns None
-        self.assertIsNone(pge_start(self.config_file))
+        # Verify the function call returns None, and that the RunConfig file
+        # was parsed only once, with the result shared by pge_main and the PGE
+        with mock.patch.object(RunConfig, '_parse_run_config_file',
+                               wraps=RunConfig._parse_run_config_file) as parse_run_config_file:
+            self.assertIsNone(pge_start(self.config_file))
+
+        parse_run_config_file.assert_called_once_with(self.config_file)
 
         # Verify that a bad filename raises an error
         self.assertRaises(FileNotFoundError, pge_start, "abc")
 
+    def test_get_run_config_filenames(self):
+        """
+        Test resolution of the list of RunConfigs to process from paths, glob
+        patterns and manifest files.
+        """
+        # Single path
+        self.assertListEqual(get_run_config_filenames([self.config_file]), [self.config_file])
+
+        # Glob pattern, duplicates should be removed
+        run_config_filenames = get_run_config_filenames(
+            [join(self.data_dir, 'test_*_config.yaml'), self.config_file]
+        )
+
+        self.assertIn(self.config_file, run_config_filenames)
+        self.assertIn(join(self.data_dir, 'test_sas_error_config.yaml'), run_config_filenames)
+        self.assertEqual(len(run_config_filenames), len(set(run_config_filenames)))
+
+        # Manifest file, with paths relative to the manifest location
+        with open('test_manifest.txt', 'w') as outfile:
+            outfile.write(f'# Test manifest\n\n{self.config_file}\n'
+                          f'{os.path.relpath(join(self.data_dir, "test_sas_error_config.yaml"))}\n')
+
+        self.assertListEqual(get_run_config_filenames(manifest_filename='test_manifest.txt'),
+                             [self.config_file, join(self.data_dir, 'test_sas_error_config.yaml')])
+
+        # Missing files and unmatched patterns should be caught up front
+        self.assertRaises(FileNotFoundError, get_run_config_filenames, ['abc.yaml'])
+        self.assertRaises(FileNotFoundError, get_run_config_filenames, ['abc*.yaml'])
+        self.assertRaises(FileNotFoundError, get_run_config_filenames, None, 'abc.txt')
+
+    def test_pge_batch(self):
+        """
+        Test execution of a batch of RunConfigs, including one which is
+        expected to fail.
+        """
+        with open(self.config_file, 'r') as infile:
+            runconfig_dict = yaml.safe_load(infile)
+
+        run_config_filenames = []
+
+        # Create several jobs, each writing to its own output location
+        for index in range(3):
+            product_path_group = runconfig_dict['RunConfig']['Groups']['PGE']['ProductPathGroup']
+            product_path_group['OutputProductPath'] = f'batch_test/job_{index}/outputs/'
+            product_path_group['ScratchPath'] = f'batch_test/job_{index}/scratch/'
+
+            run_config_filename = abspath(f'batch_test_config_{index}.yaml')
+
+            with open(run_config_filename, 'w') as outfile:
+                yaml.safe_dump(runconfig_dict, outfile, sort_keys=False)
+
+            run_config_filenames.append(run_config_filename)
+
+        run_config_filenames.append(join(self.data_dir, 'test_sas_error_config.yaml'))
+
+        summary = pge_batch(run_config_filenames, max_workers=2, trace_filename='batch_trace.json',
+                            aggregate_logs=True)
+
+        self.assertEqual(summary['batch.jobs.total'], 4)
+        self.assertEqual(summary['batch.jobs.succeeded'], 3)
+        self.assertEqual(summary['batch.jobs.failed'], 1)
+        self.assertEqual(summary['batch.max_workers'], 2)
+        self.assertGreater(summary['batch.throughput.jobs_per_hour'], 0)
+
+        # Each successful job should have its own log in its output location
+        for index in range(3):
+            log_files = [filename for filename in os.listdir(f'batch_test/job_{index}/outputs/')
+                         if filename.endswith('.log')]
+
+            self.assertEqual(len(log_files), 1)
+
+            with open(join(f'batch_test/job_{index}/outputs/', log_files[0]), 'r') as infile:
+                self.assertIn('hello world', infile.read())
+
+        # The batch log should record the outcome of each job
+        batch_log_files = [filename for filename in os.listdir(os.curdir)
+                           if filename.endswith('_batch.log')]
+
+        self.assertEqual(len(batch_log_files), 1)
+
+        with open(batch_log_files[0], 'r') as infile:
+            batch_log = infile.read()
+
+        self.assertEqual(batch_log.count('completed in'), 3)
+        self.assertIn('test_sas_error_config.yaml failed', batch_log)
+        self.assertIn('batch.jobs.failed: 1', batch_log)
+
+        # The trace should include the timeline of every job, failed or not
+        with open('batch_trace.json', 'r') as infile:
+            trace_events = json.load(infile)['traceEvents']
+
+        spans = [event for event in trace_events if event['ph'] == 'X']
+
+        self.assertEqual(len([span for span in spans if span['name'] == 'pge_batch']), 1)
+        self.assertEqual(len([span for span in spans if span['name'] == 'run']), 4)
+        self.assertEqual(len([span for span in spans if span['name'] == 'sas_subprocess']), 4)
+        self.assertEqual(len([span for span in spans if span['name'] == 'validate_runconfig']), 4)
+
+        # The node log should merge the logs of every job
+        node_log_files = [filename for filename in os.listdir(os.curdir)
+                          if filename.endswith('_node.log')]
+
+        self.assertEqual(len(node_log_files), 1)
+
+        with open(node_log_files[0], 'r') as infile:
+            node_log = infile.read()
+
+        self.assertEqual(node_log.count('hello world'), 3)
+        self.assertEqual(node_log.count('Job log closed (succeeded)'), 3)
+        self.assertEqual(node_log.count('Job log closed (failed)'), 1)
+        self.assertRegex(node_log, r'node\.jobs\.active_peak: [12]"')
+        self.assertIn('node.jobs.failure_rate: 0.25', node_log)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021, by the California Institute of Technology.
+# ALL RIGHTS RESERVED.
+# United States Government sponsorship acknowledged.
+# Any commercial use must be negotiated with the Office of Technology Transfer
+# at the California Institute of Technology.
+# This software may be subject to U.S. export control laws and regulations.
+# By accepting this document, the user agrees to comply with all applicable
+# U.S. export laws and regulations. User has the responsibility to obtain
+# export licenses, or other export authority as may be required, before
+# exporting such information to foreign countries or providing access to
+# foreign persons.
+#
+
+"""
+====================
+test_result_cache.py
+====================
+
+Unit tests for the util/result_cache.py module.
+"""
+import importlib
+import os
+import sys
+import tempfile
+import time
+import unittest
+from os.path import abspath, exists, join
+
+from pkg_resources import resource_filename
+
+from opera.util.result_cache import SasResultCache
+from opera.util.result_cache import changed_files
+from opera.util.result_cache import snapshot_directory
+
+
+class ResultCacheTestCase(unittest.TestCase):
+    """Base test class using unittest"""
+
+    starting_dir = None
+    working_dir = None
+    test_dir = None
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """Set up directories for testing"""
+        cls.starting_dir = abspath(os.curdir)
+        cls.test_dir = resource_filename(__name__, "")
+
+        os.chdir(cls.test_dir)
+
+        cls.working_dir = tempfile.TemporaryDirectory(
+            prefix="test_result_cache_", suffix='_temp', dir=os.curdir
+        )
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """At completion re-establish starting directory"""
+        cls.working_dir.cleanup()
+        os.chdir(cls.starting_dir)
+
+    def setUp(self) -> None:
+        """Use the temporary directory as the working directory"""
+        os.chdir(self.working_dir.name)
+
+    def tearDown(self) -> None:
+        """Return to starting directory"""
+        os.chdir(self.test_dir)
+
+    @staticmethod
+    def _write_file(filename, contents):
+        """Writes a file, creating any parent directories as needed"""
+        os.makedirs(os.path.dirname(filename) or os.curdir, exist_ok=True)
+
+        with open(filename, 'w') as outfile:
+            outfile.write(contents)
+
+    def test_compute_key(self):
+        """Test that the cache key reflects every component of a SAS execution"""
+        self._write_file('key_test/inputs/granule/band01.tif', 'band 1')
+        self._write_file('key_test/inputs/dem.vrt', 'dem')
+        self._write_file('key_test/sas_runconfig.yaml', 'threshold: 1\n')
+
+        input_paths = ['key_test/inputs/granule', 'key_test/inputs/dem.vrt']
+
+        key = SasResultCache.compute_key(input_paths, 'key_test/sas_runconfig.yaml', 'echo', ['hello'])
+
+        # The key should be stable, and independent of input ordering
+        self.assertEqual(key, SasResultCache.compute_key(list(reversed(input_paths)),
+                                                         'key_test/sas_runconfig.yaml', 'echo', ['hello']))
+
+        # Changes to the SAS program or its options should change the key
+        self.assertNotEqual(key, SasResultCache.compute_key(input_paths, 'key_test/sas_runconfig.yaml',
+                                                            'cat', ['hello']))
+        self.assertNotEqual(key, SasResultCache.compute_key(input_paths, 'key_test/sas_runconfig.yaml',
+                                                            'echo', ['goodbye']))
+
+        # As should changes to the contents of the inputs, or the SAS RunConfig
+        self._write_file('key_test/inputs/granule/band01.tif', 'band 1, reprocessed')
+        input_key = SasResultCache.compute_key(input_paths, 'key_test/sas_runconfig.yaml', 'echo', ['hello'])
+        self.assertNotEqual(key, input_key)
+
+        self._write_file('key_test/sas_runconfig.yaml', 'threshold: 2\n')
+        self.assertNotEqual(input_key, SasResultCache.compute_key(input_paths, 'key_test/sas_runconfig.yaml',
+                                                                  'echo', ['hello']))
+
+    def test_compute_key_sas_package(self):
+        """Test that the cache key reflects every module of a SAS package, not only its entry point"""
+        self._write_file('package_test/inputs/band01.tif', 'band 1')
+        self._write_file('package_test/sas_runconfig.yaml', 'threshold: 1\n')
+        self._write_file('package_test/site/cache_test_sas/__init__.py', '')
+        self._write_file('package_test/site/cache_test_sas/main.py', 'from . import algorithm\n')
+        self._write_file('package_test/site/cache_test_sas/algorithm.py', 'THRESHOLD = 1\n')
+
+        sys.path.insert(0, abspath('package_test/site'))
+        importlib.invalidate_caches()
+
+        try:
+            def compute_key():
+                return SasResultCache.compute_key(['package_test/inputs'], 'package_test/sas_runconfig.yaml',
+                                                  'cache_test_sas.main')
+
+            key = compute_key()
+
+            # Bytecode written by importing the package should not change the key
+            importlib.import_module('cache_test_sas.main')
+            self.assertEqual(key, compute_key())
+
+            # A change to a module other than the entry point should
+            self._write_file('package_test/site/cache_test_sas/algorithm.py', 'THRESHOLD = 2\n')
+            package_key = compute_key()
+            self.assertNotEqual(key, package_key)
+
+            # Once installed from a distribution, the version of the distribution
+            # identifies the package
+            self._write_file('package_test/site/cache_test_sas-1.0.dist-info/METADATA',
+                             'Metadata-Version: 2.1\nName: cache-test-sas\nVersion: 1.0\n')
+            self._write_file('package_test/site/cache_test_sas-1.0.dist-info/top_level.txt', 'cache_test_sas\n')
+            self._write_file('package_test/site/cache_test_sas-1.0.dist-info/RECORD',
+                             'cache_test_sas/algorithm.py,sha256=one,14\n')
+            importlib.invalidate_caches()
+
+            installed_key = compute_key()
+            self.assertNotEqual(package_key, installed_key)
+
+            os.rename('package_test/site/cache_test_sas-1.0.dist-info',
+                      'package_test/site/cache_test_sas-1.1.dist-info')
+            self._write_file('package_test/site/cache_test_sas-1.1.dist-info/METADATA',
+                             'Metadata-Version: 2.1\nName: cache-test-sas\nVersion: 1.1\n')
+            self._write_file('package_test/site/cache_test_sas-1.1.dist-info/RECORD',
+                             'cache_test_sas/algorithm.py,sha256=two,14\n')
+            importlib.invalidate_caches()
+
+            self.assertNotEqual(installed_key, compute_key())
+        finally:
+            sys.path.remove(abspath('package_test/site'))
+
+            for module_name in [name for name in sys.modules if name.startswith('cache_test_sas')]:
+                del sys.modules[module_name]
+
+    def test_store_and_restore(self):
+        """Test storing and restoring the files written by a SAS"""
+        cache = SasResultCache('restore_test/cache')
+
+        self._write_file('restore_test/outputs/preexisting.txt', 'not from the SAS')
+
+        snapshot = snapshot_directory('restore_test/outputs')
+
+        self._write_file('restore_test/outputs/product.tif', 'product')
+        self._write_file('restore_test/outputs/browse/product.png', 'browse')
+
+        sas_output_files = changed_files('restore_test/outputs', snapshot)
+
+        self.assertListEqual(sorted(sas_output_files), ['browse/product.png', 'product.tif'])
+
+        self.assertFalse(cache.contains('abc123'))
+        self.assertIsNone(cache.restore('abc123', 'restore_test/restored'))
+
+        size_bytes = cache.store('abc123', 'restore_test/outputs', sas_output_files)
+
+        self.assertEqual(size_bytes, len('product') + len('browse'))
+        self.assertTrue(cache.contains('abc123'))
+
+        restored_files = cache.restore('abc123', 'restore_test/restored')
+
+        self.assertListEqual(restored_files, ['browse/product.png', 'product.tif'])
+        self.assertFalse(exists('restore_test/restored/preexisting.txt'))
+
+        with open('restore_test/restored/browse/product.png', 'r') as infile:
+            self.assertEqual(infile.read(), 'browse')
+
+    def test_eviction(self):
+        """Test that the least recently used entries are evicted first"""
+        cache = SasResultCache('eviction_test/cache', max_size_bytes=250)
+
+        self._write_file('eviction_test/outputs/product.bin', 'x' * 100)
+
+        cache.store('first', 'eviction_test/outputs', ['product.bin'])
+        time.sleep(0.05)
+        cache.store('second', 'eviction_test/outputs', ['product.bin'])
+        time.sleep(0.05)
+
+        # Using the first entry should make the second the least recently used
+        cache.restore('first', 'eviction_test/restored')
+        time.sleep(0.05)
+
+        cache.store('third', 'eviction_test/outputs', ['product.bin'])
+
+        self.assertTrue(cache.contains('first'))
+        self.assertFalse(cache.contains('second'))
+        self.assertTrue(cache.contains('third'))
+        self.assertFalse(exists(join(cache.cache_dir, 'second')))
+
+        # An entry larger than the size budget should never be stored, rather
+        # than being evicted as soon as it is written
+        self._write_file('eviction_test/outputs/large.bin', 'x' * 300)
+
+        self.assertIsNone(cache.store('large', 'eviction_test/outputs', ['large.bin']))
+        self.assertFalse(cache.contains('large'))
+        self.assertTrue(cache.contains('first'))
+        self.assertTrue(cache.contains('third'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021, by the California Institute of Technology.
+# ALL RIGHTS RESERVED.
+# United States Government sponsorship acknowledged.
+# Any commercial use must be negotiated with the Office of Technology Transfer
+# at the California Institute of Technology.
+# This software may be subject to U.S. export control laws and regulations.
+# By accepting this document, the user agrees to comply with all applicable
+# U.S. export laws and regulations. User has the responsibility to obtain
+# export licenses, or other export authority as may be required, before
+# exporting such information to foreign countries or providing access to
+# foreign persons.
+#
+
+"""
+=================
+test_run_utils.py
+=================
+
+Unit tests for the util/run_utils.py module.
+"""
+import asyncio
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from io import BytesIO
+from os.path import abspath
+from unittest.mock import patch
+
+from pkg_resources import resource_filename
+
+from opera.util.error_codes import ErrorCode
+from opera.util.logger import PgeLogger
+from opera.util.run_utils import THREAD_COUNT_ENV_VARS
+from opera.util.run_utils import create_sas_command_line
+from opera.util.run_utils import create_sas_environment
+from opera.util.warm_worker import preload_sas_modules
+from opera.util.run_utils import stream_output_to_logger
+from opera.util.run_utils import time_and_execute
+from opera.util.run_utils import time_and_execute_async
+
+
+class RunUtilsTestCase(unittest.TestCase):
+    """Base test class using unittest"""
+
+    starting_dir = None
+    working_dir = None
+    test_dir = None
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """Set up directories for testing"""
+        cls.starting_dir = abspath(os.curdir)
+        cls.test_dir = resource_filename(__name__, "")
+
+        os.chdir(cls.test_dir)
+
+        cls.working_dir = tempfile.TemporaryDirectory(
+            prefix="test_run_utils_", suffix='_temp', dir=os.curdir
+        )
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """At completion re-establish starting directory"""
+        cls.working_dir.cleanup()
+        os.chdir(cls.starting_dir)
+
+    def setUp(self) -> None:
+        """Use the temporary directory as the working directory"""
+        os.chdir(self.working_dir.name)
+
+    def tearDown(self) -> None:
+        """Return to starting directory"""
+        os.chdir(self.test_dir)
+
+    def test_stream_output_to_logger(self):
+        """
+        Test that output is streamed into the logger in bounded chunks, and
+        that multibyte characters split across chunk boundaries are decoded
+        correctly.
+        """
+        logger = PgeLogger()
+
+        text = 'SAS output with multibyte characters: é世界\n' * 100
+        pipe = BytesIO(text.encode('utf-8'))
+
+        # Use a chunk size guaranteed to split the multibyte characters
+        num_bytes = stream_output_to_logger(pipe, logger, chunk_size=7)
+
+        self.assertEqual(num_bytes, len(text.encode('utf-8')))
+        self.assertEqual(logger.get_stream_object().getvalue(), text)
+
+    def test_time_and_execute_streams_output(self):
+        """
+        Test that the output of an executed command is captured in its
+        entirety within the log.
+        """
+        logger = PgeLogger()
+
+        num_lines = 20000
+        command_line = [sys.executable, '-c',
+                        f'import sys\nfor i in range({num_lines}): print(f"line {{i}}")\n'
+                        f'print("to stderr", file=sys.stderr)']
+
+        elapsed_time = time_and_execute(command_line, logger)
+
+        self.assertGreater(elapsed_time, 0.0)
+
+        log_contents = logger.get_stream_object().getvalue()
+
+        self.assertIn('line 0\n', log_contents)
+        self.assertIn(f'line {num_lines - 1}\n', log_contents)
+        self.assertIn('to stderr', log_contents)
+
+    def test_time_and_execute_failure(self):
+        """Test that a failing command is logged and raises a RuntimeError"""
+        logger = PgeLogger(log_filename='test_time_and_execute_failure.log')
+
+        with self.assertRaises(RuntimeError):
+            time_and_execute(['bash', '-c', 'echo failing; exit 3'], logger)
+
+        with open('test_time_and_execute_failure.log', 'r') as infile:
+            log_contents = infile.read()
+
+        self.assertIn('failing', log_contents)
+        self.assertIn('failed with exit code 3', log_contents)
+
+    def test_time_and_execute_timeout(self):
+        """
+        Test that a command exceeding its timeout is terminated along with all
+        of its descendants, including those that ignore SIGTERM.
+        """
+        logger = PgeLogger(log_filename='test_time_and_execute_timeout.log')
+
+        # The trap makes the shell (and the sleep it waits on) ignore SIGTERM,
+        # so termination requires escalation to SIGKILL
+        command_line = ['bash', '-c', 'trap "" TERM; sleep 30 & echo "started $!"; wait']
+
+        start_time = time.monotonic()
+
+        with self.assertRaises(RuntimeError):
+            time_and_execute(command_line, logger, sample_interval=0.1,
+                             timeout=0.5, grace_period=0.5)
+
+        # Both the timeout and grace period should have been honored, well
+        # before the sleep could complete on its own
+        self.assertLess(time.monotonic() - start_time, 10)
+
+        with open('test_time_and_execute_timeout.log', 'r') as infile:
+            log_contents = infile.read()
+
+        self.assertIn('started', log_contents)
+        sleep_pid = int(log_contents.split('started ')[1].split()[0])
+        self.assertIn('exceeded timeout of 0.5 second(s)', log_contents)
+        self.assertIn(f'{PgeLogger.LOGGER_CODE_BASE + ErrorCode.SAS_PROGRAM_TIMED_OUT}', log_contents)
+
+        # Partial metrics should have been logged prior to the error
+        self.assertIn('sas.elapsed_seconds', log_contents)
+        self.assertIn('sas.process_tree.rss_kb.peak', log_contents)
+
+        # The backgrounded sleep should have been killed along with the shell,
+        # although it may linger as a zombie until reaped by its new parent
+        try:
+            with open(f'/proc/{sleep_pid}/stat', 'r') as infile:
+                self.assertEqual(infile.read().rsplit(')', 1)[1].split()[0], 'Z')
+        except FileNotFoundError:
+            pass
+
+    def test_time_and_execute_timeout_detached_output(self):
+        """
+        Test that a command exceeding its timeout is reported as such, rather
+        than hanging, when a descendant which left its process group still
+        holds the output pipe open.
+        """
+        logger = PgeLogger(log_filename='test_time_and_execute_timeout_detached.log')
+        async_logger = PgeLogger(log_filename='test_time_and_execute_timeout_detached_async.log')
+
+        command_line = ['bash', '-c', 'setsid sleep 30 & echo "detached $!"; sleep 30']
+
+        detached_pids = []
+        readers = []
+
+        try:
+            with patch('opera.util.run_utils.OUTPUT_DRAIN_TIMEOUT', 0.5):
+                start_time = time.monotonic()
+
+                with self.assertRaises(RuntimeError):
+                    time_and_execute(command_line, logger, timeout=0.5, grace_period=0.5)
+
+                with self.assertRaises(RuntimeError):
+                    asyncio.run(time_and_execute_async(command_line, async_logger, timeout=0.5,
+                                                       grace_period=0.5))
+
+                self.assertLess(time.monotonic() - start_time, 10)
+
+            for log_filename in ('test_time_and_execute_timeout_detached.log',
+                                 'test_time_and_execute_timeout_detached_async.log'):
+                with open(log_filename, 'r') as infile:
+                    log_contents = infile.read()
+
+                detached_pids.append(int(log_contents.split('detached ')[1].split()[0]))
+
+                self.assertIn('Some output may have been lost', log_contents)
+                self.assertIn(f'{PgeLogger.LOGGER_CODE_BASE + ErrorCode.SAS_OUTPUT_INCOMPLETE}', log_contents)
+                self.assertIn('exceeded timeout of 0.5 second(s)', log_contents)
+
+            # The abandoned output pipe should be left open to its reader
+            # thread, rather than closed while the thread is reading from it
+            readers = [thread for thread in threading.enumerate()
+                       if thread.name.startswith('time_and_execute-')]
+
+            self.assertEqual(len(readers), 1)
+        finally:
+            for detached_pid in detached_pids:
+                try:
+                    os.kill(detached_pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+        # Once the descendant holding the pipe open is gone, the reader thread
+        # should reach the end of the output, close the pipe and exit
+        for reader in readers:
+            reader.join(timeout=10)
+            self.assertFalse(reader.is_alive())
+
+    def test_time_and_execute_within_timeout(self):
+        """Test that a command completing within its timeout is unaffected"""
+        logger = PgeLogger()
+
+        time_and_execute(['echo', 'hello world'], logger, timeout=30)
+
+        self.assertIn('hello world', logger.get_stream_object().getvalue())
+
+    def test_time_and_execute_warm_worker(self):
+        """
+        Test execution of a Python module SAS program within a child forked
+        from the current process.
+        """
+        # Write a "SAS" module which reports whether it inherited the modules
+        # imported by the test process, and exits with a requested code
+        with open('warm_worker_test_sas.py', 'w') as outfile:
+            outfile.write('import sys\n'
+                          'import time\n'
+                          'print(f"pytest loaded: {\'pytest\' in sys.modules}")\n'
+                          'print(f"args: {sys.argv[1:]}")\n'
+                          'time.sleep(float(sys.argv[2]))\n'
+                          'sys.exit(int(sys.argv[1]))\n')
+
+        sys.path.insert(0, os.getcwd())
+
+        try:
+            preload_sas_modules(['json', 'nonexistent_module_for_preload_test'])
+
+            command_line = create_sas_command_line('warm_worker_test_sas', 'runconfig.yaml', ['0', '0'])
+
+            logger = PgeLogger()
+            time_and_execute(command_line, logger, sample_interval=0.1, warm_worker=True)
+
+            log_contents = logger.get_stream_object().getvalue()
+
+            self.assertIn('pytest loaded: True', log_contents)
+            self.assertIn("args: ['0', '0', 'runconfig.yaml']", log_contents)
+
+            # Without warm worker mode, a fresh interpreter should be used
+            logger = PgeLogger()
+            time_and_execute(command_line, logger, warm_worker=False)
+
+            self.assertIn('pytest loaded: False', logger.get_stream_object().getvalue())
+
+            # Forking while other threads are running is unsafe, so a fresh
+            # interpreter should be used in that case as well
+            release = threading.Event()
+            thread = threading.Thread(target=release.wait)
+            thread.start()
+
+            try:
+                logger = PgeLogger()
+                time_and_execute(command_line, logger, warm_worker=True)
+            finally:
+                release.set()
+                thread.join()
+
+            log_contents = logger.get_stream_object().getvalue()
+
+            self.assertIn('pytest loaded: False', log_contents)
+            self.assertIn('rather than forked as a warm worker', log_contents)
+
+            # Exit codes and timeouts should be handled the same as a subprocess
+            logger = PgeLogger(log_filename='test_time_and_execute_warm_worker.log')
+
+            with self.assertRaises(RuntimeError):
+                time_and_execute(create_sas_command_line('warm_worker_test_sas', 'runconfig.yaml', ['5', '0']),
+                                 logger, warm_worker=True)
+
+            with open('test_time_and_execute_warm_worker.log', 'r') as infile:
+                self.assertIn('failed with exit code 5', infile.read())
+
+            logger = PgeLogger(log_filename='test_time_and_execute_warm_worker.log')
+
+            with self.assertRaises(RuntimeError):
+                time_and_execute(create_sas_command_line('warm_worker_test_sas', 'runconfig.yaml', ['0', '30']),
+                                 logger, timeout=0.5, grace_period=0.5, warm_worker=True)
+
+            with open('test_time_and_execute_warm_worker.log', 'r') as infile:
+                self.assertIn('exceeded timeout of 0.5 second(s)', infile.read())
+        finally:
+            sys.path.remove(os.getcwd())
+
+    def test_time_and_execute_placement(self):
+        """
+        Test that the SAS is executed with the requested thread count and
+        CPU affinity.
+        """
+        env = create_sas_environment(num_threads=3)
+
+        for env_var in THREAD_COUNT_ENV_VARS:
+            self.assertEqual(env[env_var], '3')
+
+        # Without a thread count, the current environment is left as is
+        self.assertDictEqual(create_sas_environment(), dict(os.environ))
+
+        cpu = min(os.sched_getaffinity(0))
+
+        command_line = ['bash', '-c', 'echo "threads=$OMP_NUM_THREADS"; grep Cpus_allowed_list /proc/self/status']
+
+        logger = PgeLogger()
+        time_and_execute(command_line, logger, env=env, cpu_affinity={cpu})
+
+        log_contents = logger.get_stream_object().getvalue()
+
+        self.assertIn('threads=3', log_contents)
+        self.assertRegex(log_contents, rf'Cpus_allowed_list:\s+{cpu}\n')
+
+        logger = PgeLogger()
+        asyncio.run(time_and_execute_async(command_line, logger, env=env, cpu_affinity={cpu}))
+
+        self.assertRegex(logger.get_stream_object().getvalue(), rf'Cpus_allowed_list:\s+{cpu}\n')
+
+    def test_time_and_execute_async(self):
+        """
+        Test asynchronous execution of several commands concurrently, with and
+        without a timeout.
+        """
+        loggers = [PgeLogger() for _ in range(4)]
+        timeout_logger = PgeLogger(log_filename='test_time_and_execute_async.log')
+
+        async def run_all():
+            return await asyncio.gather(
+                *[time_and_execute_async(['bash', '-c', f'sleep 0.5; echo "job {index}"'], logger)
+                  for index, logger in enumerate(loggers)],
+                time_and_execute_async(['sleep', '30'], timeout_logger, timeout=0.5, grace_period=0.5),
+                return_exceptions=True
+            )
+
+        start_time = time.monotonic()
+
+        results = asyncio.run(run_all())
+
+        # All commands should have run concurrently
+        self.assertLess(time.monotonic() - start_time, 10)
+
+        for index, logger in enumerate(loggers):
+            self.assertGreater(results[index], 0.5)
+            self.assertIn(f'job {index}', logger.get_stream_object().getvalue())
+
+        self.assertIsInstance(results[-1], RuntimeError)
+
+        with open('test_time_and_execute_async.log', 'r') as infile:
+            self.assertIn('exceeded timeout of 0.5 second(s)', infile.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -21,6 +21,8 @@ test_runconfig.py
 Unit tests for the pge/runconfig.py module.
 """
 
+import os
+import shutil
 import tempfile
 import unittest
 from os.path import join
@@ -29,7 +31,7 @@ from pkg_resources import resource_filename
 
 from yamale import YamaleError
 
-from opera.pge import RunConfig
+from opera.pge import FrozenRunConfig, RunConfig
 
 
 class RunconfigTestCase(unittest.TestCase):
@@ -120,6 +122,103 @@ class RunconfigTestCase(unittest.TestCase):
         # Check that None was assigned for SAS config section
         self.assertIsNone(runconfig.sas_config)
 
+    def test_validate_reuses_parsed_document(self):
+        """
+        Test that validation uses the document parsed when the RunConfig was
+        created, rather than parsing the RunConfig file again.
+        """
+        with tempfile.TemporaryDirectory(prefix='test_runconfig_') as temp_dir:
+            runconfig_copy = shutil.copy(self.valid_config_full, temp_dir)
+            runconfig = RunConfig(runconfig_copy)
+
+            # With the file removed, validation can only succeed on the
+            # previously parsed document
+            os.remove(runconfig_copy)
+
+            try:
+                runconfig.validate()
+            except YamaleError as err:
+                self.fail(str(err))
+
+    def test_freeze(self):
+        """
+        Test creation of a frozen snapshot of a RunConfig, and that any missing
+        fields are reported when the snapshot is created.
+        """
+        runconfig = RunConfig(self.valid_config_full)
+        runconfig.validate()
+
+        frozen_runconfig = runconfig.freeze()
+
+        self.assertIsInstance(frozen_runconfig, FrozenRunConfig)
+        self.assertIsInstance(frozen_runconfig, RunConfig)
+        self.assertIs(frozen_runconfig.freeze(), frozen_runconfig)
+        self.assertFalse(hasattr(frozen_runconfig, '__dict__'))
+
+        # The snapshot should provide the same fields as the original
+        self.assertEqual(frozen_runconfig.filename, self.valid_config_full)
+        self._compare_runconfig_to_expected(frozen_runconfig)
+        self.assertDictEqual(frozen_runconfig.sas_config, runconfig.sas_config)
+
+        # The snapshot may still be validated
+        try:
+            frozen_runconfig.validate()
+        except YamaleError as err:
+            self.fail(str(err))
+
+        # Fields of the snapshot may not be modified
+        with self.assertRaises(AttributeError):
+            frozen_runconfig.pge_name = 'MODIFIED_PGE'
+
+        with self.assertRaises(AttributeError):
+            del frozen_runconfig.input_files
+
+        # A missing field should be reported when the snapshot is created
+        with self.assertRaises(RuntimeError) as context:
+            RunConfig(self.invalid_config).freeze()
+
+        self.assertIn('ProgramPath', str(context.exception))
+        self.assertIn(f'is missing from RunConfig {self.invalid_config}', str(context.exception))
+
+    def test_freeze_subclass(self):
+        """
+        Test that a frozen snapshot of a RunConfig subclass retains the fields
+        added or overridden by the subclass.
+        """
+        class SampleRunConfig(RunConfig):
+            """RunConfig subclass with an added and an overridden field"""
+
+            @property
+            def sas_program_name(self) -> str:
+                return self.sas_program_path.split('.')[-1]
+
+            @property
+            def name(self) -> str:
+                return f'{super().name}-SAMPLE'
+
+            def describe(self):
+                """Returns a description of the RunConfig"""
+                return f'{self.name} ({self.sas_program_name})'
+
+        runconfig = SampleRunConfig(self.valid_config_full)
+        runconfig.extra_attribute = 'extra'
+
+        frozen_runconfig = runconfig.freeze()
+
+        self.assertIsInstance(frozen_runconfig, FrozenRunConfig)
+        self.assertIsInstance(frozen_runconfig, SampleRunConfig)
+        self.assertIs(type(runconfig.freeze()), type(frozen_runconfig))
+        self.assertIs(frozen_runconfig.freeze(), frozen_runconfig)
+
+        self.assertEqual(frozen_runconfig.name, 'OPERA-SAMPLE-PGE-SAS-CONFIG-SAMPLE')
+        self.assertEqual(frozen_runconfig.sas_program_name, 'example_workflow')
+        self.assertEqual(frozen_runconfig.describe(), runconfig.describe())
+        self.assertEqual(frozen_runconfig.extra_attribute, 'extra')
+        self.assertEqual(frozen_runconfig.pge_name, runconfig.pge_name)
+
+        with self.assertRaises(AttributeError):
+            frozen_runconfig.sas_program_name = 'modified'
+
     def test_strict_mode_validation(self):
         """
         Test validation of a RunConfig with strict_mode both enabled and disabled
@@ -171,6 +270,12 @@ class RunconfigTestCase(unittest.TestCase):
             self.assertIn("RunConfig.Groups.PGE.PrimaryExecutable.ProgramOptions: '--debug --restart' is not a list.",
                           str(err))
             self.assertIn("RunConfig.Groups.PGE.QAExecutable.ProgramOptions: '--debug' is not a list.", str(err))
+            self.assertIn("RunConfig.Groups.PGE.ProcessingResourcesGroup.NumThreads: 0 is less than 1", str(err))
+            self.assertIn("RunConfig.Groups.PGE.ProcessingResourcesGroup.CpuAffinity: '0' is not a list.", str(err))
+            self.assertIn("RunConfig.Groups.PGE.LoggingGroup.MaxInMemoryLogSize: -1 is less than 0", str(err))
+            self.assertIn("RunConfig.Groups.PGE.LoggingGroup.CallerLocationMode: "
+                          "'slow' not in ('inspect', 'fast', 'off')", str(err))
+            self.assertIn("RunConfig.Groups.PGE.LoggingGroup.Compression: 'zip' not in ('gzip', 'lzma')", str(err))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021, by the California Institute of Technology.
+# ALL RIGHTS RESERVED.
+# United States Government sponsorship acknowledged.
+# Any commercial use must be negotiated with the Office of Technology Transfer
+# at the California Institute of Technology.
+# This software may be subject to U.S. export control laws and regulations.
+# By accepting this document, the user agrees to comply with all applicable
+# U.S. export laws and regulations. User has the responsibility to obtain
+# export licenses, or other export authority as may be required, before
+# exporting such information to foreign countries or providing access to
+# foreign persons.
+#
+
+"""
+====================
+test_schema_cache.py
+====================
+
+Unit tests for the util/schema_cache.py module.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from os.path import abspath, join
+from unittest import mock
+
+from pkg_resources import resource_filename
+
+from yamale import YamaleError
+
+from opera.pge import RunConfig
+from opera.pge.runconfig import BASE_PGE_SCHEMA
+from opera.util import schema_cache
+from opera.util.schema_cache import SCHEMA_CACHE_EXTENSION
+from opera.util.schema_cache import clear_schema_cache
+from opera.util.schema_cache import get_schema
+
+
+class SchemaCacheTestCase(unittest.TestCase):
+    """Base test class using unittest"""
+
+    starting_dir = None
+    working_dir = None
+    test_dir = None
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """Set up directories for testing"""
+        cls.starting_dir = abspath(os.curdir)
+        cls.test_dir = resource_filename(__name__, "")
+        cls.data_dir = join(cls.test_dir, "data")
+        cls.sas_schema_file = resource_filename('opera', 'schema/sample_sas_schema.yaml')
+
+        os.chdir(cls.test_dir)
+
+        cls.working_dir = tempfile.TemporaryDirectory(
+            prefix="test_schema_cache_", suffix='_temp', dir=os.curdir
+        )
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """At completion re-establish starting directory"""
+        cls.working_dir.cleanup()
+        os.chdir(cls.starting_dir)
+
+    def setUp(self) -> None:
+        """Use the temporary directory as the working directory, with an empty cache"""
+        os.chdir(self.working_dir.name)
+        clear_schema_cache()
+
+    def tearDown(self) -> None:
+        """Return to starting directory"""
+        clear_schema_cache()
+        os.chdir(self.test_dir)
+
+    def test_in_memory_cache(self):
+        """Test that schemas are compiled once, and recompiled when their files change"""
+        with mock.patch.object(schema_cache, 'compile_schema',
+                               wraps=schema_cache.compile_schema) as compile_schema:
+            schema = get_schema(BASE_PGE_SCHEMA, self.sas_schema_file)
+
+            self.assertIs(get_schema(BASE_PGE_SCHEMA, self.sas_schema_file), schema)
+            self.assertEqual(compile_schema.call_count, 1)
+            self.assertIn('sas_configuration', schema.includes)
+
+            # The PGE schema alone is a distinct combination
+            self.assertNotIn('sas_configuration', get_schema(BASE_PGE_SCHEMA).includes)
+            self.assertEqual(compile_schema.call_count, 2)
+
+            # Modifying a schema file should result in recompilation
+            sas_schema_copy = shutil.copy(self.sas_schema_file, 'sas_schema.yaml')
+            copy_schema = get_schema(BASE_PGE_SCHEMA, sas_schema_copy)
+
+            with open(sas_schema_copy, 'a') as outfile:
+                outfile.write('\n# Modified\n')
+
+            self.assertIsNot(get_schema(BASE_PGE_SCHEMA, sas_schema_copy), copy_schema)
+            self.assertEqual(compile_schema.call_count, 4)
+
+    def test_on_disk_cache(self):
+        """Test that compiled schemas are shared between processes via the on-disk cache"""
+        with mock.patch.object(schema_cache, 'compile_schema',
+                               wraps=schema_cache.compile_schema) as compile_schema:
+            get_schema(BASE_PGE_SCHEMA, self.sas_schema_file, cache_dir='schema_cache')
+
+            cached_files = os.listdir('schema_cache')
+            self.assertEqual(len(cached_files), 1)
+            self.assertTrue(cached_files[0].endswith(SCHEMA_CACHE_EXTENSION))
+
+            # Simulate a new process via a cleared in-memory cache
+            clear_schema_cache()
+
+            with mock.patch.dict(os.environ, {schema_cache.SCHEMA_CACHE_DIR_ENV: 'schema_cache'}):
+                schema = get_schema(BASE_PGE_SCHEMA, self.sas_schema_file)
+
+            self.assertEqual(compile_schema.call_count, 1)
+            self.assertIn('sas_configuration', schema.includes)
+
+            # A corrupt cache entry should simply be recompiled
+            with open(join('schema_cache', cached_files[0]), 'wb') as outfile:
+                outfile.write(b'corrupt')
+
+            clear_schema_cache()
+            get_schema(BASE_PGE_SCHEMA, self.sas_schema_file, cache_dir='schema_cache')
+
+            self.assertEqual(compile_schema.call_count, 2)
+
+    def test_on_disk_cache_untrusted(self):
+        """Test that entries of a group or world writable on-disk cache are never loaded"""
+        with mock.patch.object(schema_cache, 'compile_schema',
+                               wraps=schema_cache.compile_schema) as compile_schema:
+            get_schema(BASE_PGE_SCHEMA, self.sas_schema_file, cache_dir='untrusted_cache')
+
+            cached_file = join('untrusted_cache', os.listdir('untrusted_cache')[0])
+
+            # A writable entry should be ignored, and recompiled
+            os.chmod(cached_file, 0o666)
+            clear_schema_cache()
+            get_schema(BASE_PGE_SCHEMA, self.sas_schema_file, cache_dir='untrusted_cache')
+
+            self.assertEqual(compile_schema.call_count, 2)
+
+            # As should any entry within a writable directory
+            os.chmod(cached_file, 0o600)
+            os.chmod('untrusted_cache', 0o777)
+            clear_schema_cache()
+            get_schema(BASE_PGE_SCHEMA, self.sas_schema_file, cache_dir='untrusted_cache')
+
+            self.assertEqual(compile_schema.call_count, 3)
+
+            # Restoring the permissions should restore use of the cache
+            os.chmod('untrusted_cache', 0o700)
+            clear_schema_cache()
+            get_schema(BASE_PGE_SCHEMA, self.sas_schema_file, cache_dir='untrusted_cache')
+
+            self.assertEqual(compile_schema.call_count, 3)
+
+    def test_validation_with_cached_schema(self):
+        """Test that validation results are unaffected by reuse of a cached schema"""
+        for _ in range(2):
+            RunConfig(join(self.data_dir, 'valid_runconfig_full.yaml')).validate()
+
+            with self.assertRaises(YamaleError):
+                RunConfig(join(self.data_dir, 'invalid_runconfig.yaml')).validate()
+
+
+if __name__ == "__main__":
+    unittest.main()
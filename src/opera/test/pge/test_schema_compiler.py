@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021, by the California Institute of Technology.
+# ALL RIGHTS RESERVED.
+# United States Government sponsorship acknowledged.
+# Any commercial use must be negotiated with the Office of Technology Transfer
+# at the California Institute of Technology.
+# This software may be subject to U.S. export control laws and regulations.
+# By accepting this document, the user agrees to comply with all applicable
+# U.S. export laws and regulations. User has the responsibility to obtain
+# export licenses, or other export authority as may be required, before
+# exporting such information to foreign countries or providing access to
+# foreign persons.
+#
+
+"""
+=======================
+test_schema_compiler.py
+=======================
+
+Unit tests for the util/schema_compiler.py module, using Yamale as the
+reference implementation of validation.
+"""
+import copy
+import os
+import tempfile
+import unittest
+from os.path import abspath, join
+
+from pkg_resources import resource_filename
+
+import yaml
+
+import yamale
+
+from opera.pge import RunConfig
+from opera.pge.runconfig import BASE_PGE_SCHEMA
+from opera.util.schema_cache import VALIDATOR_CACHE_EXTENSION
+from opera.util.schema_cache import clear_schema_cache
+from opera.util.schema_cache import compile_schema
+from opera.util.schema_cache import get_validator
+from opera.util.schema_compiler import generate_validator_source
+from opera.util.schema_compiler import load_validator
+
+_DELETE = object()
+"""Mutation which deletes the targeted field"""
+
+MUTATIONS = [
+    {},
+    {('Name',): 5},
+    {('Groups',): None},
+    {('Groups', 'PGE'): ['not', 'a', 'map']},
+    {('Groups', 'PGE', 'PGENameGroup'): _DELETE},
+    {('Groups', 'PGE', 'PGENameGroup', 'PGEName'): None},
+    {('Groups', 'PGE', 'InputFilesGroup', 'InputFilePaths'): []},
+    {('Groups', 'PGE', 'InputFilesGroup', 'InputFilePaths'): ['input.h5', 7, None]},
+    {('Groups', 'PGE', 'InputFilesGroup', 'InputFilePaths'): 'input.h5'},
+    {('Groups', 'PGE', 'DynamicAncillaryFilesGroup', 'AncillaryFileMap'): {1: 'dem.vrt', 'LandCover': 2}},
+    {('Groups', 'PGE', 'ProductPathGroup', 'ProductCounter'): 0},
+    {('Groups', 'PGE', 'ProductPathGroup', 'ProductCounter'): 1000},
+    {('Groups', 'PGE', 'ProductPathGroup', 'ProductCounter'): True},
+    {('Groups', 'PGE', 'ProductPathGroup', 'ProductCounter'): None},
+    {('Groups', 'PGE', 'ProductPathGroup', 'OutputProductPath'): _DELETE,
+     ('Groups', 'PGE', 'ProductPathGroup', 'ScratchPath'): _DELETE},
+    {('Groups', 'PGE', 'PrimaryExecutable', 'ErrorCodeBase'): 1.5},
+    {('Groups', 'PGE', 'PrimaryExecutable', 'Timeout'): -0.5},
+    {('Groups', 'PGE', 'PrimaryExecutable', 'ResourceSamplingInterval'): 'often'},
+    {('Groups', 'PGE', 'PrimaryExecutable', 'ProgramOptions'): ['--debug', ['nested']]},
+    {('Groups', 'PGE', 'QAExecutable', 'Enabled'): 'yes'},
+    {('Groups', 'PGE', 'ProcessingResourcesGroup'): {'NumThreads': 0, 'CpuAffinity': [0, -1, 'a']}},
+    {('Groups', 'PGE', 'ProcessingResourcesGroup'): {'CpuAffinity': []}},
+    {('Groups', 'PGE', 'LoggingGroup'): {'CallerLocationMode': 'slow', 'Compression': None,
+                                         'Unexpected': True}},
+    {('Groups', 'PGE', 'LoggingGroup'): 'gzip'},
+    {('Groups', 'PGE', 'DebugLevelGroup', 'DebugSwitch'): 1},
+    {('Groups', 'PGE', 'ExtraGroup'): {}, ('Groups', 'Extra'): 1, ('Extra',): None},
+    {('Groups', 'SAS'): None},
+    {('Groups', 'SAS'): 'not a map'},
+    {('Groups', 'SAS', 'input_subset', 'list_of_frequencies', 'A'): ['HH', 'V']},
+    {('Groups', 'SAS', 'input_subset', 'list_of_frequencies', 'B'): 'HHV'},
+    {('Groups', 'SAS', 'input_subset', 'list_of_frequencies', 'A'): ['HH', 'HV', 'VH', 'VV', 'HH']},
+    {('Groups', 'SAS', 'geocode'): {'outputEPSG': 100, 'memory_mode': 'none',
+                                    'output_posting': {'A': {'x_posting': -1}}}},
+    {('Groups', 'SAS', 'geo2rdr'): {'threshold': 1.0, 'maxiter': 5}},
+    {('Groups', 'SAS', 'logging'): {}},
+    {('Groups', 'SAS', 'runconfig', 'groups', 'pge_name_group', 'pge_name'): 'OTHER_PGE'},
+    {('Groups', 'SAS', 'runconfig', 'groups', 'input_file_group'): _DELETE},
+    {('Groups', 'SAS', 'runconfig', 'extra'): 1},
+]
+"""Mutations of the valid RunConfigs used for testing, keyed by the path to each mutated field"""
+
+
+def mutate(document, mutation):
+    """Returns a copy of a parsed RunConfig, with the fields targeted by a mutation replaced or deleted."""
+    document = copy.deepcopy(document)
+
+    for path, value in mutation.items():
+        parent = document['RunConfig']
+
+        for key in path[:-1]:
+            if not isinstance(parent, dict) or key not in parent:
+                break
+
+            parent = parent[key]
+        else:
+            if not isinstance(parent, dict):
+                continue
+
+            if value is _DELETE:
+                parent.pop(path[-1], None)
+            else:
+                parent[path[-1]] = copy.deepcopy(value)
+
+    return document
+
+
+class SchemaCompilerTestCase(unittest.TestCase):
+    """Base test class using unittest"""
+
+    starting_dir = None
+    working_dir = None
+    test_dir = None
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """Set up directories for testing"""
+        cls.starting_dir = abspath(os.curdir)
+        cls.test_dir = resource_filename(__name__, "")
+        cls.data_dir = join(cls.test_dir, "data")
+
+        # Combinations of RunConfigs and the SAS schemas they are validated with
+        cls.runconfig_schemas = [
+            ('valid_runconfig_full.yaml', resource_filename('opera', 'schema/sample_sas_schema.yaml')),
+            ('valid_runconfig_no_sas.yaml', None),
+            ('valid_runconfig_extra_fields.yaml', resource_filename('opera', 'schema/sample_sas_schema.yaml')),
+            ('invalid_runconfig.yaml', resource_filename('opera', 'schema/sample_sas_schema.yaml')),
+            ('test_dswx_hls_config.yaml', resource_filename('opera', 'schema/dswx_hls_sas_schema.yaml'))
+        ]
+
+        os.chdir(cls.test_dir)
+
+        cls.working_dir = tempfile.TemporaryDirectory(
+            prefix="test_schema_compiler_", suffix='_temp', dir=os.curdir
+        )
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """At completion re-establish starting directory"""
+        cls.working_dir.cleanup()
+        os.chdir(cls.starting_dir)
+
+    def setUp(self) -> None:
+        """Use the temporary directory as the working directory, with an empty cache"""
+        os.chdir(self.working_dir.name)
+        clear_schema_cache()
+
+    def tearDown(self) -> None:
+        """Return to starting directory"""
+        clear_schema_cache()
+        os.chdir(self.test_dir)
+
+    def _assert_same_errors(self, schema, validate, document, data_name):
+        """Asserts the generated validator reports the same errors as Yamale for a document."""
+        for strict in (True, False):
+            expected_errors = schema.validate(document, data_name, strict).errors
+
+            self.assertListEqual(validate(document, strict), expected_errors,
+                                 f'{data_name} (strict={strict})')
+
+    def test_generated_validator_matches_yamale(self):
+        """Test that generated validators report exactly the errors reported by Yamale"""
+        for runconfig_name, sas_schema_file in self.runconfig_schemas:
+            schema = compile_schema(BASE_PGE_SCHEMA, sas_schema_file)
+            validate = load_validator(generate_validator_source(schema))
+
+            with open(join(self.data_dir, runconfig_name), 'r') as infile:
+                document = yaml.safe_load(infile)
+
+            for index, mutation in enumerate(MUTATIONS):
+                self._assert_same_errors(schema, validate, mutate(document, mutation),
+                                         f'{runconfig_name}[{index}]')
+
+            # Documents which are not RunConfigs at all
+            for document in (None, [], 'RunConfig', {'Other': {}}):
+                self._assert_same_errors(schema, validate, document, repr(document))
+
+    def test_runconfig_validation_errors(self):
+        """Test that RunConfig.validate() reports its errors exactly as Yamale would"""
+        runconfig_name, sas_schema_file = self.runconfig_schemas[3]
+        runconfig_file = join(self.data_dir, runconfig_name)
+
+        with self.assertRaises(yamale.YamaleError) as expected:
+            yamale.validate(compile_schema(BASE_PGE_SCHEMA, sas_schema_file),
+                            yamale.make_data(runconfig_file))
+
+        with self.assertRaises(yamale.YamaleError) as context:
+            RunConfig(runconfig_file).validate()
+
+        self.assertEqual(str(context.exception), str(expected.exception))
+
+    def test_schema_features(self):
+        """Test the validators and constraints supported by the compiler beyond those of the RunConfig schemas"""
+        schema = yamale.make_schema(content='\n'.join([
+            "text: str(min=2, max=4, none=False, required=False)",
+            "pairs: list(list(int(), num()), min=1)",
+            "lookup: map(any(int(max=3), null()), str(), key=int(min=0), max=2)",
+            "nested: include('node', strict=False, required=False)",
+            "ratio: enum(0.5, 1, 'half', False)",
+            "position: [num(), num(), num(required=False)]",
+            "missing: include('undefined', required=False)",
+            "---",
+            "node:",
+            "  value: int()",
+            "  child: include('node', required=False)"
+        ]))
+
+        validate = load_validator(generate_validator_source(schema))
+
+        documents = [
+            {'pairs': [[1, 2.5]], 'lookup': {0: 1}, 'ratio': 1, 'position': [0, 0]},
+            {'text': None, 'pairs': [], 'lookup': {-1: 4, 1: 'a', 2: None}, 'ratio': True,
+             'position': [0]},
+            {'text': 'a', 'pairs': ['a', [True]], 'lookup': [], 'ratio': 0.5,
+             'position': [0, 1, 2, 3], 'extra': 1},
+            {'text': 'abcde', 'pairs': [[1]], 'lookup': {'a': 1}, 'ratio': 'half',
+             'position': (1, 'a', None),
+             'nested': {'value': 1, 'extra': 1, 'child': {'value': 'a', 'child': {}}}},
+            {'text': 5, 'pairs': {'a': 1}, 'lookup': None, 'ratio': '1', 'position': {}},
+            {'missing': {}},
+            {'missing': None}
+        ]
+
+        for index, document in enumerate(documents):
+            self._assert_same_errors(schema, validate, document, f'document[{index}]')
+
+    def test_unsupported_schema(self):
+        """Test that schemas using unsupported features fall back to validation with Yamale"""
+        with open('unsupported_schema.yaml', 'w') as outfile:
+            outfile.write("RunConfig:\n  Name: regex('^OPERA')\n")
+
+        with self.assertRaises(NotImplementedError):
+            generate_validator_source(yamale.make_schema('unsupported_schema.yaml'))
+
+        self.assertIsNone(get_validator('unsupported_schema.yaml'))
+
+    def test_validator_cache(self):
+        """Test caching of generated validators, both in memory and on disk"""
+        sas_schema_file = self.runconfig_schemas[0][1]
+
+        validate = get_validator(BASE_PGE_SCHEMA, sas_schema_file, cache_dir='schema_cache')
+
+        self.assertIs(get_validator(BASE_PGE_SCHEMA, sas_schema_file), validate)
+
+        cached_files = [filename for filename in os.listdir('schema_cache')
+                        if filename.endswith(VALIDATOR_CACHE_EXTENSION)]
+        self.assertEqual(len(cached_files), 1)
+
+        # The cached source should be loaded by a new process, simulated via
+        # a cleared in-memory cache, and validate identically
+        clear_schema_cache()
+
+        cached_validate = get_validator(BASE_PGE_SCHEMA, sas_schema_file, cache_dir='schema_cache')
+
+        self.assertIsNot(cached_validate, validate)
+        self.assertEqual(cached_validate.__code__.co_filename,
+                         join('schema_cache', cached_files[0]))
+
+        with open(join(self.data_dir, 'invalid_runconfig.yaml'), 'r') as infile:
+            document = yaml.safe_load(infile)
+
+        self.assertListEqual(cached_validate(document), validate(document))
+
+        # A corrupt cache entry should simply be regenerated
+        with open(join('schema_cache', cached_files[0]), 'w') as outfile:
+            outfile.write('def validate(data, strict=True:\n')
+
+        clear_schema_cache()
+
+        regenerated_validate = get_validator(BASE_PGE_SCHEMA, sas_schema_file, cache_dir='schema_cache')
+
+        self.assertListEqual(regenerated_validate(document), validate(document))
+
+
+if __name__ == "__main__":
+    unittest.main()
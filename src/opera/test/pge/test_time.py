@@ -32,7 +32,9 @@ from pkg_resources import resource_filename
 
 from opera.util.time import get_catalog_metadata_datetime_str
 from opera.util.time import get_current_iso_time
+from opera.util.time import get_current_iso_time_cached
 from opera.util.time import get_iso_time
+from opera.util.time import get_iso_time_from_ns
 from opera.util.time import get_time_for_filename
 
 
@@ -133,6 +135,33 @@ class TimeTestCase(unittest.TestCase):
         # Verify that the datetime.now() format does not match iso_time
         self.assertIsNone(self.match_iso_time(dt_str))
 
+    def test_get_iso_time_from_ns(self):
+        """
+        Verify that times converted with the cached date/time prefix match
+        those converted by get_iso_time(), including when the second changes
+        in either direction between consecutive calls.
+
+        """
+        base_seconds = int(datetime(2021, 11, 2, 15, 51, 39).timestamp())
+
+        test_times = [
+            (base_seconds, 955666),
+            (base_seconds, 955667),  # same second, prefix reused
+            (base_seconds + 1, 0),   # next second
+            (base_seconds - 3600, 999999),  # earlier second
+            (base_seconds, 1)
+        ]
+
+        for seconds, microseconds in test_times:
+            time_ns = seconds * 1_000_000_000 + microseconds * 1000 + 999
+            expected = get_iso_time(datetime.fromtimestamp(seconds).replace(microsecond=microseconds))
+
+            self.assertEqual(get_iso_time_from_ns(time_ns), expected)
+
+        for i in range(self.reps):
+            time = get_current_iso_time_cached()
+            self.assertEqual(time, self.match_iso_time(time).group())
+
     def test_get_time_for_filename(self):
         """
         Converts the provided datetime object to a time-tag string suitable for
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021, by the California Institute of Technology.
+# ALL RIGHTS RESERVED.
+# United States Government sponsorship acknowledged.
+# Any commercial use must be negotiated with the Office of Technology Transfer
+# at the California Institute of Technology.
+# This software may be subject to U.S. export control laws and regulations.
+# By accepting this document, the user agrees to comply with all applicable
+# U.S. export laws and regulations. User has the responsibility to obtain
+# export licenses, or other export authority as may be required, before
+# exporting such information to foreign countries or providing access to
+# foreign persons.
+#
+
+"""
+=============
+test_trace.py
+=============
+
+Unit tests for the util/trace.py module.
+"""
+import json
+import os
+import sys
+import tempfile
+import unittest
+from os.path import abspath
+
+from pkg_resources import resource_filename
+
+from opera.util.logger import PgeLogger
+from opera.util.run_utils import time_and_execute
+from opera.util.trace import TraceRecorder
+from opera.util.trace import trace_span
+
+
+class TraceTestCase(unittest.TestCase):
+    """Base test class using unittest"""
+
+    starting_dir = None
+    working_dir = None
+    test_dir = None
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """Set up directories for testing"""
+        cls.starting_dir = abspath(os.curdir)
+        cls.test_dir = resource_filename(__name__, "")
+
+        os.chdir(cls.test_dir)
+
+        cls.working_dir = tempfile.TemporaryDirectory(
+            prefix="test_trace_", suffix='_temp', dir=os.curdir
+        )
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """At completion re-establish starting directory"""
+        cls.working_dir.cleanup()
+        os.chdir(cls.starting_dir)
+
+    def setUp(self) -> None:
+        """Use the temporary directory as the working directory"""
+        os.chdir(self.working_dir.name)
+
+    def tearDown(self) -> None:
+        """Return to starting directory"""
+        os.chdir(self.test_dir)
+
+    def test_trace_recorder(self):
+        """Test recording of spans and counters, and writing of the trace file"""
+        trace = TraceRecorder(process_name='test_trace')
+
+        with trace.span('outer', category='test', step=1) as args:
+            with self.assertRaises(ValueError):
+                with trace.span('failing'):
+                    raise ValueError('Span failed')
+
+            args['result'] = 'done'
+
+        trace.add_counter_event('test.counter', 1.0, {'value': 2})
+
+        # Absent recorders should be tolerated by trace_span()
+        with trace_span(None, 'ignored'):
+            pass
+
+        other_trace = TraceRecorder(pid=1)
+
+        with trace_span(other_trace, 'other'):
+            pass
+
+        trace.add_events(other_trace.events)
+        trace.write('test_trace.json')
+
+        with open('test_trace.json', 'r') as infile:
+            events = json.load(infile)['traceEvents']
+
+        spans = {event['name']: event for event in events if event['ph'] == 'X'}
+
+        self.assertListEqual(sorted(spans), ['failing', 'other', 'outer'])
+        self.assertEqual(spans['outer']['args'], {'step': 1, 'result': 'done'})
+        self.assertEqual(spans['outer']['cat'], 'test')
+        self.assertEqual(spans['other']['pid'], 1)
+
+        # The failed span should be nested within the outer span
+        self.assertGreaterEqual(spans['failing']['ts'], spans['outer']['ts'])
+        self.assertLessEqual(spans['failing']['ts'] + spans['failing']['dur'],
+                             spans['outer']['ts'] + spans['outer']['dur'])
+
+        metadata = [event for event in events if event['ph'] == 'M']
+
+        self.assertIn({'name': 'process_name', 'ph': 'M', 'pid': trace.pid,
+                       'args': {'name': 'test_trace'}}, metadata)
+        self.assertTrue(any(event['name'] == 'thread_name' for event in metadata))
+
+        counters = [event for event in events if event['ph'] == 'C']
+
+        self.assertListEqual(counters, [{'name': 'test.counter', 'ph': 'C', 'ts': 1e6,
+                                         'pid': trace.pid, 'args': {'value': 2}}])
+
+    def test_trace_execution(self):
+        """Test tracing of the lifetime and resource usage of an executed command"""
+        trace = TraceRecorder()
+        logger = PgeLogger()
+
+        time_and_execute([sys.executable, '-c', 'import time; time.sleep(0.3)'], logger,
+                         sample_interval=0.05, trace=trace)
+
+        spans = [event for event in trace.events if event['ph'] == 'X']
+
+        self.assertEqual(len(spans), 1)
+        self.assertEqual(spans[0]['name'], 'sas_subprocess')
+        self.assertEqual(spans[0]['args']['returncode'], 0)
+        self.assertGreaterEqual(spans[0]['dur'], 0.3e6)
+
+        rss_counters = [event for event in trace.events
+                        if event['ph'] == 'C' and event['name'] == 'sas.rss_kb']
+
+        self.assertGreater(len(rss_counters), 1)
+        self.assertTrue(all(spans[0]['ts'] <= event['ts'] <= spans[0]['ts'] + spans[0]['dur']
+                            for event in rss_counters))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -23,13 +23,20 @@ Unit tests for the util/usage_metrics.py module.
 """
 import os
 import re
+import signal
+import subprocess
 import tempfile
+import time
 import unittest
 from os.path import abspath, join
 
 from pkg_resources import resource_filename
 
+from opera.util.usage_metrics import ProcessTreeSampler
+from opera.util.usage_metrics import RESOURCE_SAMPLE_FIELDS
+from opera.util.usage_metrics import _scan_process_tree
 from opera.util.usage_metrics import get_os_metrics
+from opera.util.usage_metrics import get_process_tree
 
 
 class UsageMetricsTestCase(unittest.TestCase):
@@ -118,6 +125,121 @@ class UsageMetricsTestCase(unittest.TestCase):
             # Verify that the main process, takes more RAM than the child process
             self.assertGreater(metrics['os.max_rss_kb.main_process'], metrics['os.max_rss_kb.largest_child_process'])
 
+    def test_process_tree_sampler(self):
+        """
+        Test sampling of a process tree consisting of a shell with several
+        child processes.
+        """
+        num_children = 3
+
+        with subprocess.Popen(['bash', '-c', f'for i in $(seq {num_children}); do sleep 1 & done; wait']) as process:
+            sampler = ProcessTreeSampler(process.pid, interval=0.05)
+            sampler.start()
+
+            process.wait()
+
+            sampler.stop()
+
+        # The tree should have been observed with all of its children at some point
+        self.assertGreater(len(sampler.samples), 1)
+        self.assertEqual(max(sample['num_processes'] for sample in sampler.samples), num_children + 1)
+
+        # Processes which are part-way through exiting may have already
+        # released their memory, so only the peak is expected to be non-zero
+        for sample in sampler.samples:
+            self.assertListEqual(list(sample.keys()), RESOURCE_SAMPLE_FIELDS)
+
+        self.assertGreater(max(sample['rss_kb'] for sample in sampler.samples), 0)
+
+        metrics = sampler.get_summary_metrics()
+
+        self.assertEqual(metrics['sas.process_tree.num_samples'], len(sampler.samples))
+        self.assertEqual(metrics['sas.process_tree.num_processes.peak'], num_children + 1)
+        self.assertGreaterEqual(metrics['sas.process_tree.rss_kb.peak'], metrics['sas.process_tree.rss_kb.mean'])
+        self.assertGreaterEqual(metrics['sas.process_tree.cpu_seconds.total'], 0)
+        self.assertGreaterEqual(metrics['sas.process_tree.cpu_utilization.peak'],
+                                metrics['sas.process_tree.cpu_utilization.mean'])
+        self.assertNotIn('sas.process_tree.cpu_seconds.peak', metrics)
+        self.assertIn('pid', metrics['sas.process_tree.largest_process'])
+
+        # Once the tree has exited there should be nothing left to sample
+        self.assertDictEqual(get_process_tree(process.pid), {})
+        self.assertIsNone(sampler.sample())
+
+        sampler.write_series('test_process_tree_sampler.csv')
+
+        with open('test_process_tree_sampler.csv', 'r') as infile:
+            lines = infile.read().splitlines()
+
+        self.assertEqual(lines[0], ','.join(RESOURCE_SAMPLE_FIELDS))
+        self.assertEqual(len(lines), len(sampler.samples) + 1)
+
+    def test_process_tree_sampler_summary(self):
+        """
+        Test that sampled gauges are summarized by their peak and mean, and
+        cumulative counters by their total and rates.
+        """
+        sampler = ProcessTreeSampler(os.getpid())
+        sampler.peak_rss_by_process[os.getpid()] = ('python', 300)
+
+        sampler.samples = [
+            {'elapsed_seconds': 0.0, 'num_processes': 1, 'rss_kb': 100,
+             'cpu_seconds': 1.0, 'num_threads': 1, 'read_bytes': 0, 'write_bytes': 0},
+            {'elapsed_seconds': 1.0, 'num_processes': 2, 'rss_kb': 300,
+             'cpu_seconds': 3.0, 'num_threads': 3, 'read_bytes': 1000, 'write_bytes': 100},
+            # A descendant exited, taking its share of the counters with it
+            {'elapsed_seconds': 2.0, 'num_processes': 1, 'rss_kb': 200,
+             'cpu_seconds': 2.5, 'num_threads': 2, 'read_bytes': 1000, 'write_bytes': 100},
+            {'elapsed_seconds': 4.0, 'num_processes': 1, 'rss_kb': 200,
+             'cpu_seconds': 3.5, 'num_threads': 2, 'read_bytes': 3000, 'write_bytes': 100}
+        ]
+
+        metrics = sampler.get_summary_metrics()
+
+        self.assertEqual(metrics['sas.process_tree.rss_kb.peak'], 300)
+        self.assertEqual(metrics['sas.process_tree.rss_kb.mean'], 200)
+        self.assertEqual(metrics['sas.process_tree.num_threads.peak'], 3)
+
+        self.assertEqual(metrics['sas.process_tree.cpu_seconds.total'], 4.0)
+        self.assertEqual(metrics['sas.process_tree.cpu_utilization.peak'], 2.0)
+        self.assertEqual(metrics['sas.process_tree.cpu_utilization.mean'], 0.75)
+        self.assertEqual(metrics['sas.process_tree.read_bytes.total'], 3000)
+        self.assertEqual(metrics['sas.process_tree.read_bytes_per_second.peak'], 1000)
+        self.assertEqual(metrics['sas.process_tree.read_bytes_per_second.mean'], 750)
+        self.assertEqual(metrics['sas.process_tree.write_bytes.total'], 100)
+
+        for field in ('cpu_seconds', 'read_bytes', 'write_bytes'):
+            self.assertNotIn(f'sas.process_tree.{field}.peak', metrics)
+            self.assertNotIn(f'sas.process_tree.{field}.mean', metrics)
+
+        # Rates cannot be derived from a single sample
+        sampler.samples = sampler.samples[:1]
+        metrics = sampler.get_summary_metrics()
+
+        self.assertEqual(metrics['sas.process_tree.cpu_seconds.total'], 1.0)
+        self.assertNotIn('sas.process_tree.cpu_utilization.mean', metrics)
+
+    def test_get_process_tree(self):
+        """
+        Test that walking a process tree from its root finds the same
+        processes as scanning all processes on the system.
+        """
+        with subprocess.Popen(['bash', '-c', 'sleep 5 & sleep 5 & wait'], start_new_session=True) as process:
+            try:
+                # Wait for the shell to start both of its children
+                deadline = time.monotonic() + 5
+
+                while len(get_process_tree(process.pid)) < 3 and time.monotonic() < deadline:
+                    time.sleep(0.01)
+
+                process_tree = get_process_tree(process.pid)
+
+                self.assertEqual(len(process_tree), 3)
+                self.assertListEqual(sorted(process_tree), sorted(_scan_process_tree(process.pid)))
+                self.assertIn(process.pid, get_process_tree(os.getpid()))
+            finally:
+                os.killpg(process.pid, signal.SIGKILL)
+
 # TODO test get_self_peak_vmm_kb() - right now it is not finding the file.
 
 
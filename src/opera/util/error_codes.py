@@ -78,6 +78,12 @@ class ErrorCode(IntEnum):
     QA_SAS_DID_NOT_PRODUCE_VALIDATION_LOG_MESSAGES = auto()
     RENDERING_ISO_METADATA = auto()
     CLOSING_LOG_FILE = auto()
+    RESOURCE_SAMPLES_WRITTEN = auto()
+    BATCH_STARTING = auto()
+    BATCH_JOB_COMPLETED = auto()
+    SAS_PROCESS_PLACEMENT = auto()
+    SAS_RESULT_CACHE_HIT = auto()
+    SAS_RESULT_CACHE_STORED = auto()
 
     # Debug - 1000 – 1999
     CONFIGURATION_DETAILS = DEBUG_RANGE_START
@@ -91,6 +97,13 @@ class ErrorCode(IntEnum):
     LOGGING_SOURCE_FILE_DOES_NOT_EXIST = auto()
     LOGGING_COULD_NOT_INCREMENT_SEVERITY = auto()
     LOGGING_RESYNC_FAILED = auto()
+    RESOURCE_SAMPLES_NOT_WRITTEN = auto()
+    BATCH_JOB_FAILED = auto()
+    CPU_AFFINITY_UNAVAILABLE = auto()
+    SAS_RESULT_CACHE_FAILED = auto()
+    LOG_JOURNAL_FAILED = auto()
+    METRICS_NOT_WRITTEN = auto()
+    SAS_OUTPUT_INCOMPLETE = auto()
 
     # Critical - 3000 to 3999
     RUN_CONFIG_VALIDATION_FAILED = CRITICAL_RANGE_START
@@ -108,6 +121,8 @@ class ErrorCode(IntEnum):
     ISO_METADATA_GOT_SOME_RENDERING_ERRORS = auto()
     ISO_METADATA_RENDER_FAILED = auto()
     SAS_OUTPUT_FILE_HAS_MISSING_DATA = auto()
+    SAS_PROGRAM_TIMED_OUT = auto()
+    INVALID_CPU_AFFINITY = auto()
 
     @classmethod
     def describe(cls):
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021, by the California Institute of Technology.
+# ALL RIGHTS RESERVED.
+# United States Government sponsorship acknowledged.
+# Any commercial use must be negotiated with the Office of Technology Transfer
+# at the California Institute of Technology.
+# This software may be subject to U.S. export control laws and regulations.
+# By accepting this document, the user agrees to comply with all applicable
+# U.S. export laws and regulations. User has the responsibility to obtain
+# export licenses, or other export authority as may be required, before
+# exporting such information to foreign countries or providing access to
+# foreign persons.
+#
+
+"""
+=================
+log_aggregator.py
+=================
+
+Aggregation of the logs of concurrent PGE jobs running on a single node.
+
+Each job forwards its log to a multiprocessing queue (see
+PgeLogger.enable_forwarding()), which is drained by a listener thread of the
+LogAggregator. The aggregator merges the forwarded lines from every job into
+a single node log, ordered by the time each line was forwarded, and tracks
+aggregate metrics across jobs, such as the number of concurrently active
+jobs, the rate of messages by severity, and the rate of failed jobs.
+
+Every line of the node log is prefixed by the source of the line, which is
+either the identifier of a job, or "aggregator" for the periodic metrics
+written by the aggregator itself.
+
+"""
+
+import heapq
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from os.path import splitext
+
+import opera.util.time as time_util
+
+from .error_codes import ErrorCode
+from .log_sink import QueueLogSink
+from .logger import DISABLED_LOCATION
+from .logger import PgeLogger
+from .logger import SEVERITY_LEVELS
+from .logger import write
+from .metrics import MetricsRegistry
+
+DEFAULT_METRICS_INTERVAL = 60.0
+"""Default number of seconds between each set of rolling metrics written to the node log"""
+
+DEFAULT_REORDER_WINDOW = 0.5
+"""Default number of seconds forwarded lines are held to restore their order across jobs"""
+
+AGGREGATOR_SOURCE = 'aggregator'
+"""Source prefix of the lines written by the aggregator itself"""
+
+_STOP = 'stop'
+"""Item placed on the queue to stop the listener thread"""
+
+
+class LogAggregator:
+    """
+    Listener which merges the logs forwarded by concurrent PGE jobs into a
+    single, time-ordered node log, along with rolling aggregate metrics.
+
+    Items forwarded by separate processes may arrive slightly out of order,
+    so each line is held for a short reorder window before it is written,
+    allowing lines forwarded earlier (but received later) to be written
+    first. The logs of the jobs themselves are not affected by aggregation.
+
+    Usage:
+
+        with LogAggregator('node.log') as aggregator:
+            # Provide aggregator.queue to each job, which calls
+            # logger.enable_forwarding(queue)
+            ...
+
+    """
+
+    def __init__(self, log_filename, metrics_interval=DEFAULT_METRICS_INTERVAL,
+                 reorder_window=DEFAULT_REORDER_WINDOW, mp_context=None):
+        """
+        Creates a new instance of LogAggregator. The node log is not opened
+        until start() is called.
+
+        Parameters
+        ----------
+        log_filename : str
+            Path to the node log to write.
+        metrics_interval : float, optional
+            Number of seconds between each set of rolling metrics written to
+            the node log.
+        reorder_window : float, optional
+            Number of seconds forwarded lines are held before being written.
+        mp_context : multiprocessing.context.BaseContext, optional
+            The multiprocessing context to create the queue within, which
+            should match that of the processes running the jobs. Defaults to
+            the default context.
+
+        """
+        self.log_filename = log_filename
+        self.metrics_interval = metrics_interval
+        self.reorder_window = reorder_window
+        self.metrics = MetricsRegistry()
+        self.queue = (mp_context or multiprocessing).Queue()
+        self.workflow = f'PGE::{os.path.basename(__file__)}'
+
+        self._outfile = None
+        self._thread = None
+        self._pending = []
+        self._sequence = 0
+        self._partial_lines = {}
+        self._active_sources = set()
+        self._window_start_time = None
+        self._window_snapshot = {}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.stop()
+
+    def get_metrics_file_name(self):
+        """Returns the file name the aggregate metrics are written to by stop()."""
+        return f'{splitext(self.log_filename)[0]}_metrics.json'
+
+    def start(self):
+        """Opens the node log and starts the listener thread."""
+        self._outfile = open(self.log_filename, 'w', encoding='utf-8')
+        self._window_start_time = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name='LogAggregator', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the listener thread once all items enqueued prior to this call
+        have been processed, writes any held lines, the final metrics and the
+        metrics JSON file, then closes the node log.
+
+        Jobs must have finished forwarding (i.e. closed their logs) before
+        this is called, for their lines to be included in the node log.
+
+        """
+        if not self._thread:
+            return
+
+        self.queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+        self._release_lines(flush=True)
+        self._write_rolling_metrics()
+        self._write_summary()
+
+        self._outfile.close()
+        self.queue.close()
+
+        self.metrics.write_json(self.get_metrics_file_name(), workflow=self.workflow)
+
+    def _run(self):
+        """Main loop of the listener thread."""
+        next_metrics_time = time.monotonic() + self.metrics_interval
+
+        while True:
+            timeout = max(0.0, min(self.reorder_window, next_metrics_time - time.monotonic()))
+
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item == _STOP:
+                return
+
+            if item is not None:
+                self._process_item(*item)
+
+            self._release_lines()
+
+            if time.monotonic() >= next_metrics_time:
+                self._write_rolling_metrics()
+                next_metrics_time += self.metrics_interval
+
+    def _process_item(self, kind, source, timestamp, payload):
+        """Processes a single item forwarded by a job."""
+        self.metrics.histogram('node.forward_latency_seconds', (0.001, 0.01, 0.1, 1.0, 10.0)) \
+            .observe(max(time.time() - timestamp, 0.0))
+
+        if kind == QueueLogSink.OPEN:
+            self._active_sources.add(source)
+            self.metrics.counter('node.jobs.started').increment()
+            self._update_active_jobs()
+            self._hold_line(timestamp, source, f'Job log opened by process {payload}')
+        elif kind == QueueLogSink.TEXT:
+            lines = (self._partial_lines.pop(source, '') + payload).split('\n')
+
+            if lines[-1]:
+                self._partial_lines[source] = lines[-1]
+
+            for line in lines[:-1]:
+                self._count_line(line)
+                self._hold_line(timestamp, source, line)
+        elif kind == QueueLogSink.CLOSE:
+            partial_line = self._partial_lines.pop(source, None)
+
+            if partial_line:
+                self._count_line(partial_line)
+                self._hold_line(timestamp, source, partial_line)
+
+            self._active_sources.discard(source)
+            self.metrics.counter('node.jobs.failed' if payload else 'node.jobs.succeeded').increment()
+            self._update_active_jobs()
+            self._hold_line(timestamp, source, f'Job log closed ({"failed" if payload else "succeeded"})')
+
+    def _update_active_jobs(self):
+        """Updates the gauges tracking the number of concurrently active jobs."""
+        num_active = len(self._active_sources)
+
+        self.metrics.gauge('node.jobs.active').set(num_active)
+
+        peak = self.metrics.gauge('node.jobs.active_peak')
+        peak.set(max(peak.value or 0, num_active))
+
+    def _count_line(self, line):
+        """Tallies the severity of a forwarded line, if it is formatted as a log message."""
+        self.metrics.counter('node.lines').increment()
+
+        row = line.split(',', 2)
+
+        if len(row) >= 2:
+            severity = row[1].strip()
+
+            if severity in SEVERITY_LEVELS:
+                self.metrics.counter(f'node.log_messages.{severity.lower()}').increment()
+
+    def _hold_line(self, timestamp, source, line):
+        """Holds a line for the reorder window before it is written."""
+        heapq.heappush(self._pending, (timestamp, self._sequence, source, line))
+        self._sequence += 1
+
+    def _release_lines(self, flush=False):
+        """Writes the held lines which have exceeded the reorder window, in order."""
+        cutoff = time.time() - self.reorder_window
+
+        while self._pending and (flush or self._pending[0][0] <= cutoff):
+            _, _, source, line = heapq.heappop(self._pending)
+            self._outfile.write(f'{source}: {line}\n')
+
+        self._outfile.flush()
+
+    def _write_metric(self, metric_name, value):
+        """Writes a single metric to the node log, in the format used by PgeLogger."""
+        self._outfile.write(f'{AGGREGATOR_SOURCE}: ')
+        write(self._outfile, 'Info', self.workflow, 'LogAggregator',
+              PgeLogger.LOGGER_CODE_BASE + ErrorCode.SUMMARY_STATS_MESSAGE, DISABLED_LOCATION,
+              f'{metric_name}: {value}')
+
+    def _write_rolling_metrics(self):
+        """
+        Writes the change in each counter over the window since the previous
+        rolling metrics, as rates per second, along with the current gauges.
+        """
+        now = time.monotonic()
+        elapsed_time = max(now - self._window_start_time, 1e-9)
+        snapshot = self.metrics.snapshot()
+
+        self._write_metric('node.window.seconds', round(elapsed_time, 3))
+
+        for name, value in snapshot['counters'].items():
+            delta = value - self._window_snapshot.get(name, 0)
+            self._write_metric(f'node.window.{name[len("node."):]}.per_second',
+                               round(delta / elapsed_time, 3))
+
+        for name, value in snapshot['gauges'].items():
+            self._write_metric(name, value)
+
+        num_failed = snapshot['counters'].get('node.jobs.failed', 0)
+        num_completed = num_failed + snapshot['counters'].get('node.jobs.succeeded', 0)
+
+        if num_completed:
+            self._write_metric('node.jobs.failure_rate', round(num_failed / num_completed, 3))
+
+        self._window_start_time = now
+        self._window_snapshot = snapshot['counters']
+
+        self._outfile.flush()
+
+    def _write_summary(self):
+        """Writes the totals of every aggregate metric to the node log."""
+        self._write_metric('node.completed_at', time_util.get_current_iso_time())
+
+        for metric_name, value in self.metrics.summary():
+            self._write_metric(metric_name, value)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021, by the California Institute of Technology.
+# ALL RIGHTS RESERVED.
+# United States Government sponsorship acknowledged.
+# Any commercial use must be negotiated with the Office of Technology Transfer
+# at the California Institute of Technology.
+# This software may be subject to U.S. export control laws and regulations.
+# By accepting this document, the user agrees to comply with all applicable
+# U.S. export laws and regulations. User has the responsibility to obtain
+# export licenses, or other export authority as may be required, before
+# exporting such information to foreign countries or providing access to
+# foreign persons.
+#
+
+"""
+==================
+log_compression.py
+==================
+
+Compression of the log files written by PgeLogger.
+
+"""
+
+import functools
+import gzip
+import lzma
+import os
+
+from os.path import splitext
+
+COMPRESSION_EXTENSIONS = {
+    'gzip': '.gz',
+    'lzma': '.xz'
+}
+"""Mapping of each supported log compression format to the extension appended to compressed log filenames"""
+
+_COMPRESSION_OPENERS = {
+    '.gz': functools.partial(gzip.open, compresslevel=6),
+    '.xz': lzma.open
+}
+"""Mapping of compressed log filename extensions to the function used to open such files"""
+
+
+def open_pge_log(filename, mode='r'):
+    """
+    Opens a log file written by PgeLogger in text mode, transparently handling
+    logs compressed by close_log_stream().
+
+    The compression format is determined from the extension of the filename.
+    When opening for reading, a filename which does not exist is also tried
+    with each compressed extension appended, so that callers need not know
+    whether a log was compressed.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the log file.
+    mode : str, optional
+        Mode to open the file in, "r" (the default), "w" or "a". Files are
+        always opened in text mode.
+
+    Returns
+    -------
+    file : io.TextIOBase
+        The opened file object.
+
+    """
+    mode = mode.replace('t', '') + 't'
+
+    if mode.startswith('r') and not os.path.exists(filename):
+        for extension in _COMPRESSION_OPENERS:
+            if os.path.exists(filename + extension):
+                filename += extension
+                break
+
+    opener = _COMPRESSION_OPENERS.get(splitext(filename)[1], open)
+
+    return opener(filename, mode, encoding='utf-8')
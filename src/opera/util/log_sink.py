@@ -0,0 +1,651 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021, by the California Institute of Technology.
+# ALL RIGHTS RESERVED.
+# United States Government sponsorship acknowledged.
+# Any commercial use must be negotiated with the Office of Technology Transfer
+# at the California Institute of Technology.
+# This software may be subject to U.S. export control laws and regulations.
+# By accepting this document, the user agrees to comply with all applicable
+# U.S. export laws and regulations. User has the responsibility to obtain
+# export licenses, or other export authority as may be required, before
+# exporting such information to foreign countries or providing access to
+# foreign persons.
+#
+
+"""
+===========
+log_sink.py
+===========
+
+Supplementary destinations for the messages written by PgeLogger.
+
+"""
+
+import json
+import os
+import queue
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+from datetime import datetime
+from os.path import basename, splitext
+
+DEFAULT_FLUSH_SIZE = 64 * 1024
+"""Default number of buffered characters which triggers a flush of an AsyncLogSink"""
+
+DEFAULT_FLUSH_INTERVAL = 1.0
+"""Default maximum number of seconds an AsyncLogSink buffers text before flushing"""
+
+REPLAY_CHUNK_SIZE = 64 * 1024
+"""Maximum number of characters of the existing log passed to a newly enabled sink at a time"""
+
+JOURNAL_SUFFIX = '.partial'
+"""Suffix appended to the log filename to form the filename of its write-behind journal"""
+
+JSON_LINES_EXTENSION = '.jsonl'
+"""File extension of the structured JSON lines version of the log"""
+
+COMMAND_TIMEOUT = 30.0
+"""Maximum number of seconds to wait on the writer thread of an AsyncLogSink to complete a command"""
+
+COMMAND_POLL_INTERVAL = 0.1
+"""Number of seconds between checks that the writer thread of an AsyncLogSink is still running"""
+
+_LOG_MESSAGE_PATTERN = re.compile(
+    r'^(?P<time>[^,]+), (?P<severity>[^,]+), (?P<workflow>[^,]*), (?P<module>[^,]*),'
+    r'(?P<error_code>-?\d+), (?P<location>.*?), "(?P<description>.*)"$'
+)
+"""Pattern matching a single line log message, as written by logger.write()"""
+
+_FLUSH = 'flush'
+_MOVE = 'move'
+_CLOSE = 'close'
+
+
+def _parse_time_tag(time_tag):
+    """
+    Converts the time-tag of a log message back to seconds since the epoch,
+    returning None should the time-tag not be in the expected format.
+    """
+    try:
+        return datetime.fromisoformat(time_tag.rstrip('Z')).timestamp()
+    except ValueError:
+        return None
+
+
+class AsyncLogSink:
+    """
+    Write-behind sink which mirrors log text to a journal file on disk from a
+    background thread.
+
+    Callers of write() only enqueue text, and never wait on file I/O. The
+    background thread batches the enqueued text, writing it to the journal
+    once either the buffered size or the time since the last write exceeds
+    its threshold. Each batch is flushed to the operating system as it is
+    written, so the journal survives the abrupt termination of the process,
+    such as by the out-of-memory killer.
+
+    Should the writer thread exit unexpectedly, text and commands are instead
+    carried out synchronously by the caller. Should it fail to complete a
+    command in a timely manner, such as when blocked on unresponsive storage,
+    the caller stops waiting on it, and the journal is regarded as incomplete
+    (see error).
+
+    """
+
+    def __init__(self, filename, flush_size=DEFAULT_FLUSH_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL):
+        """
+        Creates a new instance of AsyncLogSink, creating (or truncating) the
+        journal file and starting the background writer thread.
+
+        Parameters
+        ----------
+        filename : str
+            Path to the journal file to write.
+        flush_size : int, optional
+            Number of buffered characters which triggers a write to the journal.
+        flush_interval : float, optional
+            Maximum number of seconds text may remain buffered before being
+            written to the journal.
+
+        """
+        self.filename = filename
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.error = None
+
+        self._closed = False
+        self._file = open(filename, 'w', encoding='utf-8')
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name='AsyncLogSink', daemon=True)
+        self._thread.start()
+
+    @property
+    def closed(self):
+        """Returns True if the sink has been closed."""
+        return self._closed
+
+    def write(self, text):
+        """
+        Enqueues text to be written to the journal. This method never blocks
+        on the writer thread.
+
+        Parameters
+        ----------
+        text : str
+            The text to write.
+
+        """
+        self._queue.put(text)
+
+        if not self._thread.is_alive():
+            self._drain_queue()
+
+    def _send_command(self, *command):
+        """
+        Enqueues a command for the writer thread, and waits for its completion,
+        for up to COMMAND_TIMEOUT seconds. Should the writer thread no longer
+        be running, the command is carried out synchronously instead.
+        """
+        if self._closed:
+            return
+
+        done = threading.Event()
+        self._queue.put((done,) + command)
+
+        deadline = time.monotonic() + COMMAND_TIMEOUT
+
+        while not done.wait(timeout=COMMAND_POLL_INTERVAL):
+            if not self._thread.is_alive():
+                self._drain_queue()
+                return
+
+            if time.monotonic() >= deadline:
+                self.error = self.error or TimeoutError(f'Journal writer thread failed to complete '
+                                                        f'"{command[0]}" within {COMMAND_TIMEOUT} seconds')
+                return
+
+    def flush(self):
+        """
+        Writes all text enqueued prior to this call to the journal, and
+        synchronizes the journal with the underlying storage device. Blocks
+        until complete.
+        """
+        self._send_command(_FLUSH)
+
+    def move(self, new_filename):
+        """
+        Relocates the journal file, once all text enqueued prior to this call
+        has been written to it. Blocks until complete.
+
+        Parameters
+        ----------
+        new_filename : str
+            The new path of the journal file.
+
+        """
+        self._send_command(_MOVE, new_filename)
+
+    def close(self, remove=True):
+        """
+        Writes any remaining enqueued text, then closes the journal and stops
+        the writer thread. Blocks until complete.
+
+        Parameters
+        ----------
+        remove : bool, optional
+            If True (the default), the journal file is removed once closed,
+            as is appropriate once the complete log has been written elsewhere.
+
+        """
+        self._send_command(_CLOSE)
+        self._closed = True
+
+        if remove and os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def _write_batch(self, batch):
+        """Writes a batch of text to the journal, retaining the first error encountered."""
+        if batch and not self.error:
+            try:
+                self._file.write(''.join(batch))
+                self._file.flush()
+            except (OSError, ValueError) as err:
+                self.error = err
+
+        batch.clear()
+
+    def _run(self):
+        """Main loop of the writer thread."""
+        batch = []
+        batch_size = 0
+        last_write_time = time.monotonic()
+
+        while True:
+            timeout = None
+
+            if batch:
+                timeout = max(0.0, self.flush_interval - (time.monotonic() - last_write_time))
+
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, str):
+                batch.append(item)
+                batch_size += len(item)
+
+                flush_due = time.monotonic() - last_write_time >= self.flush_interval
+
+                if batch_size < self.flush_size and not flush_due:
+                    continue
+
+            self._write_batch(batch)
+            batch_size = 0
+            last_write_time = time.monotonic()
+
+            if item is None or isinstance(item, str):
+                continue
+
+            if not self._run_command(*item):
+                return
+
+    def _drain_queue(self):
+        """
+        Writes the text, and carries out the commands, left enqueued by a
+        writer thread which is no longer running.
+        """
+        batch = []
+
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if isinstance(item, str):
+                batch.append(item)
+                continue
+
+            self._write_batch(batch)
+            self._run_command(*item)
+
+        self._write_batch(batch)
+
+    def _run_command(self, done, command, *args):
+        """
+        Carries out a command, signaling the provided event once complete.
+        Returns False once the journal has been closed, True otherwise.
+        """
+        try:
+            if command == _FLUSH and not self.error:
+                os.fsync(self._file.fileno())
+            elif command == _MOVE:
+                self._file.close()
+                shutil.move(self.filename, args[0])
+                self.filename = args[0]
+                self._file = open(self.filename, 'a', encoding='utf-8')
+            elif command == _CLOSE:
+                self._file.close()
+                return False
+        except OSError as err:
+            self.error = self.error or err
+        finally:
+            done.set()
+
+        return True
+
+
+class JsonLinesLogSink:
+    """
+    Sink which records log messages as JSON lines, one object per message,
+    with typed fields suitable for bulk-loading without any text parsing.
+
+    Records are written to a temporary file as they are logged, and moved to
+    their final destination once the sink is closed, mirroring the life-cycle
+    of the log itself.
+
+    """
+
+    def __init__(self, temp_dir=None):
+        """
+        Creates a new instance of JsonLinesLogSink
+
+        Parameters
+        ----------
+        temp_dir : str, optional
+            Directory to create the temporary file holding records within,
+            until the sink is closed. Defaults to the system temporary directory.
+
+        """
+        self._file = tempfile.NamedTemporaryFile(mode='w', encoding='utf-8', dir=temp_dir, prefix='pge_log_',
+                                                 suffix='.jsonl', delete=False)
+
+    @property
+    def closed(self):
+        """Returns True if the sink has been closed."""
+        return self._file.closed
+
+    def write_record(self, record):
+        """
+        Writes a single record to the sink.
+
+        Parameters
+        ----------
+        record : dict
+            The record to write. Values which are not natively supported by
+            JSON are recorded as their string representation.
+
+        """
+        self._file.write(json.dumps(record, default=str) + '\n')
+
+    def close(self, filename, opener=None):
+        """
+        Closes the sink, moving the recorded JSON lines to their final
+        destination.
+
+        Parameters
+        ----------
+        filename : str
+            Path to write the JSON lines file to.
+        opener : callable, optional
+            Function used to open the destination file for writing, with the
+            same signature as open(), such as to compress the JSON lines as
+            they are written. If not provided, the recorded JSON lines are
+            moved to the destination as is.
+
+        """
+        self._file.close()
+
+        if opener is None:
+            shutil.move(self._file.name, filename)
+            return
+
+        try:
+            with open(self._file.name, 'r', encoding='utf-8') as infile, opener(filename, 'w') as outfile:
+                shutil.copyfileobj(infile, outfile)
+        finally:
+            os.remove(self._file.name)
+
+
+class QueueLogSink:
+    """
+    Sink which forwards log text to a queue shared with another process, such
+    as the queue of a LogAggregator collecting the logs of concurrent PGE jobs.
+
+    Forwarding never waits on the consumer of the queue: a multiprocessing
+    queue hands each item off to a background feeder thread, so the cost to
+    the logging process is that of enqueuing the text.
+
+    Each item placed on the queue is a tuple of (kind, source, timestamp,
+    payload), where kind is one of "open", "text" or "close", source
+    identifies the forwarding log, and timestamp is the wall-clock time, as
+    returned by time.time(), at which the text was logged (or the item was
+    forwarded, for the other kinds).
+
+    """
+
+    OPEN = 'open'
+    TEXT = 'text'
+    CLOSE = 'close'
+
+    def __init__(self, log_queue, source, opened_at=None):
+        """
+        Creates a new instance of QueueLogSink, announcing the source to the
+        consumer of the queue.
+
+        Parameters
+        ----------
+        log_queue : multiprocessing.Queue
+            The queue to forward text to.
+        source : str
+            Identifier of the forwarding log, attached to each item.
+        opened_at : float, optional
+            Time, in seconds since the epoch, at which the forwarding log was
+            opened. Defaults to the current time.
+
+        """
+        self.queue = log_queue
+        self.source = source
+        self.closed = False
+
+        self._put(self.OPEN, os.getpid(), opened_at)
+
+    def _put(self, kind, payload, timestamp=None):
+        """Enqueues an item, ignoring a queue which has since been closed."""
+        try:
+            self.queue.put((kind, self.source, time.time() if timestamp is None else timestamp, payload))
+        except (OSError, ValueError):
+            pass
+
+    def write(self, text, timestamp=None):
+        """
+        Forwards text to the queue.
+
+        Parameters
+        ----------
+        text : str
+            The text to forward.
+        timestamp : float, optional
+            Time, in seconds since the epoch, at which the text was logged.
+            Defaults to the current time.
+
+        """
+        self._put(self.TEXT, text, timestamp)
+
+    def close(self, failed=False):
+        """
+        Announces the end of the forwarding log to the consumer of the queue.
+
+        Parameters
+        ----------
+        failed : bool, optional
+            Whether the job writing the log failed.
+
+        """
+        if not self.closed:
+            self._put(self.CLOSE, failed)
+            self.closed = True
+
+
+class LogSinkMixin:
+    """
+    Mixin class providing management of the supplementary sinks of a
+    PgeLogger: the write-behind journal, the JSON lines version of the log,
+    and forwarding of the log to another process.
+
+    The sinks are held by the _sink, _json_sink and _forward_sink attributes
+    of the logger, each of which is None while the sink is not enabled. The
+    logger itself is responsible for writing to, and closing, each enabled
+    sink as messages are logged and the log is closed.
+
+    """
+
+    def _replay_log_stream(self, write):
+        """
+        Passes everything logged up to this point to the provided function,
+        in bounded chunks, so that a newly enabled sink is not missing the
+        start of the log.
+
+        Parameters
+        ----------
+        write : callable
+            Function to pass each chunk of the log stream to.
+
+        """
+        self.log_stream.seek(0)
+
+        for contents in iter(lambda: self.log_stream.read(REPLAY_CHUNK_SIZE), ''):
+            write(contents)
+
+        self.log_stream.seek(0, os.SEEK_END)
+
+    def _iter_log_stream_lines(self):
+        """
+        Yields each line logged up to this point, including its trailing
+        newline (absent from an incomplete final line), along with the match
+        of the line against the log message format, or None for lines which
+        are not log messages, such as appended text.
+        """
+        self.log_stream.seek(0)
+
+        try:
+            for line in self.log_stream:
+                yield line, _LOG_MESSAGE_PATTERN.match(line.rstrip('\n'))
+        finally:
+            self.log_stream.seek(0, os.SEEK_END)
+
+    def get_journal_file_name(self):
+        """
+        Returns the file name of the write-behind journal of the current log,
+        or None if write-behind is not enabled.
+        """
+        return self._sink.filename if self._sink else None
+
+    def enable_write_behind(self, flush_size=DEFAULT_FLUSH_SIZE,
+                            flush_interval=DEFAULT_FLUSH_INTERVAL):
+        """
+        Enables mirroring of the log to a journal file on disk, named for the
+        log file with a ".partial" suffix.
+
+        Messages are handed off to a background thread which batches them to
+        the journal, flushing once either the buffered size or time threshold
+        is reached, as well as whenever a critical message is logged. This
+        ensures the log is not lost should the process be killed before the
+        log stream is closed, without the cost of file I/O for each message.
+
+        The journal follows the log through any calls to move(), and is
+        removed once the complete log is written by close_log_stream().
+        Enabling write-behind on a logger which already has it enabled has no
+        effect.
+
+        Parameters
+        ----------
+        flush_size : int, optional
+            Number of buffered characters which triggers a write to the journal.
+        flush_interval : float, optional
+            Maximum number of seconds messages may remain buffered before
+            being written to the journal.
+
+        """
+        if self._sink:
+            return
+
+        self._sink = AsyncLogSink(f'{self.log_filename}{JOURNAL_SUFFIX}',
+                                  flush_size=flush_size, flush_interval=flush_interval)
+
+        # Seed the journal with everything logged up to this point
+        self._replay_log_stream(self._sink.write)
+
+    def get_json_lines_file_name(self):
+        """
+        Returns the file name the JSON lines version of the current log will
+        be written to, or None if JSON lines output is not enabled.
+        """
+        if not self._json_sink:
+            return None
+
+        return f'{splitext(self.log_filename)[0]}{JSON_LINES_EXTENSION}'
+
+    def enable_forwarding(self, log_queue, source=None):
+        """
+        Enables forwarding of the log, as it is written, to a queue shared
+        with another process, such as that of a LogAggregator which merges the
+        logs of concurrent PGE jobs (see opera.util.log_aggregator).
+
+        Forwarding only enqueues text, so the log itself is unaffected. The
+        end of the log, and whether any critical message was logged, is
+        forwarded once the log stream is closed. Enabling forwarding on a
+        logger which already has it enabled has no effect.
+
+        Parameters
+        ----------
+        log_queue : multiprocessing.Queue
+            The queue to forward the log to.
+        source : str, optional
+            Identifier of this log within the forwarded items. Defaults to the
+            base name of the log file.
+
+        """
+        if self._forward_sink:
+            return
+
+        # The log is announced as opened at the time of its first message, so
+        # that it precedes the forwarded messages
+        self.log_stream.seek(0)
+        first_match = _LOG_MESSAGE_PATTERN.match(self.log_stream.readline().rstrip('\n'))
+        self.log_stream.seek(0, os.SEEK_END)
+
+        self._forward_sink = QueueLogSink(log_queue, source or splitext(basename(self.log_filename))[0],
+                                          opened_at=_parse_time_tag(first_match['time']) if first_match else None)
+
+        # Forward everything logged up to this point, with the time each line
+        # was logged, or for text appended to the log, that of the preceding
+        # log message
+        timestamp = None
+
+        for line, match in self._iter_log_stream_lines():
+            if match:
+                timestamp = _parse_time_tag(match['time'])
+
+            self._forward_sink.write(line, timestamp)
+
+    def enable_json_lines(self):
+        """
+        Enables a structured version of the log, written as JSON lines to a
+        file named for the log file with a ".jsonl" extension.
+
+        Each message is recorded as an object with the following fields:
+            time - ISO-format time-tag of the message
+            severity - Severity level of the message
+            workflow - Workflow associated to the logger
+            module - Module where the logging took place
+            error_code - The error code of the message, as an integer
+            location - File name and line number where the logging took place
+            description - Description of the logged event
+        Messages written by log_one_metric() additionally include "metric"
+        and "value" fields with the name and (numeric) value of the metric.
+        Each line of text appended to the log, such as SAS output, is recorded
+        with only the "time", "severity" and "description" fields, where the
+        severity is null unless the line is itself formatted as a log message.
+        Overly long lines are recorded in fragments, each with an additional
+        "partial" field set to true.
+
+        Messages logged before this method is called are recovered from the
+        log stream, retaining their original time-tags, although without any
+        metric fields. Lines of the log stream which are not log messages,
+        such as appended text, are recorded with the time-tag of the message
+        preceding them.
+
+        The file is written once the log stream is closed. Enabling JSON lines
+        output on a logger which already has it enabled has no effect.
+
+        """
+        if self._json_sink:
+            return
+
+        self._json_sink = JsonLinesLogSink(temp_dir=self.spill_dir)
+
+        # Record everything logged up to this point, other than an incomplete
+        # final line, which is recorded once completed by subsequent text
+        record_time = None
+
+        for line, match in self._iter_log_stream_lines():
+            if not line.endswith('\n'):
+                self._partial_line = line
+                break
+
+            if match:
+                record = match.groupdict()
+                record['error_code'] = int(record['error_code'])
+                record_time = record['time']
+            else:
+                record = {'time': record_time, 'severity': None, 'description': line[:-1]}
+
+            self._json_sink.write_record(record)
@@ -27,17 +27,67 @@ Adapted By: Scott Collins, Jim Hofman
 """
 import datetime
 import inspect
+import os
 import shutil
+import sys
+import tempfile
 import time
 from io import StringIO
 
-from os.path import basename, isfile
+from os.path import basename, isfile, splitext
 
 from opera.util import error_codes
 import opera.util.time as time_util
 
 from .error_codes import ErrorCode
-from .usage_metrics import get_os_metrics
+from .log_compression import COMPRESSION_EXTENSIONS
+from .log_compression import open_pge_log
+from .log_sink import JOURNAL_SUFFIX
+from .log_sink import LogSinkMixin
+from .metrics import LogMetricsMixin
+from .metrics import MetricsRegistry
+from .metrics import StageTimer
+
+APPEND_CHUNK_SIZE = 64 * 1024
+"""Maximum number of characters read at a time when appending a file to the log"""
+
+SEVERITY_PREFIX_LENGTH = 256
+"""
+Maximum number of characters retained from an incomplete line of appended text
+while waiting for the remainder of the line. The severity field of a log line
+is expected to appear within this many characters from the start of the line.
+"""
+
+MAX_PARTIAL_LINE_LENGTH = 64 * 1024
+"""Maximum length of an incomplete line of appended text held for structured output before being recorded"""
+
+LOCATION_MODE_INSPECT = 'inspect'
+"""Caller location mode which walks the call stack via the inspect module"""
+
+LOCATION_MODE_FAST = 'fast'
+"""Caller location mode which jumps directly to the caller frame, caching formatted locations"""
+
+LOCATION_MODE_OFF = 'off'
+"""Caller location mode which disables capture of the caller location"""
+
+LOCATION_MODES = (LOCATION_MODE_INSPECT, LOCATION_MODE_FAST, LOCATION_MODE_OFF)
+"""The available modes for capturing the caller location of logged messages"""
+
+DISABLED_LOCATION = 'N/A'
+"""Location logged for each message when caller location capture is disabled"""
+
+_location_cache = {}
+"""Formatted caller locations, keyed by code object and line number"""
+
+SEVERITY_LEVELS = ('Debug', 'Info', 'Warning', 'Critical')
+"""The severity levels of log messages, in increasing order of severity"""
+
+_SEVERITY_RANKS = {severity: rank for rank, severity in enumerate(SEVERITY_LEVELS)}
+"""Mapping of each severity level to its rank, for comparison against the logger level"""
+
+_DEBUG_RANK = _SEVERITY_RANKS['Debug']
+_INFO_RANK = _SEVERITY_RANKS['Info']
+_WARNING_RANK = _SEVERITY_RANKS['Warning']
 
 
 def write(log_stream, severity, workflow, module, error_code, error_location,
@@ -62,15 +112,54 @@ def write(log_stream, severity, workflow, module, error_code, error_location,
     description : str
         Description of the logged event.
 
+    Returns
+    -------
+    message_str : str
+        The formatted message written to the log stream.
+
     """
 
-    time_tag = time_util.get_current_iso_time()
+    time_tag = time_util.get_current_iso_time_cached()
 
     message_str = f'{time_tag}, {severity}, {workflow}, {module},' \
                   f'{str(error_code)}, {error_location}, "{description}"\n'
 
     log_stream.write(message_str)
 
+    return message_str
+
+
+def format_description(description, args=()):
+    """
+    Produces the final description of a log message from a lazily-evaluated
+    description, as accepted by the logging methods of PgeLogger.
+
+    Parameters
+    ----------
+    description : str or callable
+        The description, which may be a %-style format string, or a callable
+        returning the description.
+    args : tuple, optional
+        Arguments to the description. If the description is a callable, these
+        are passed to it, otherwise they are substituted into the description
+        using %-style formatting. If not provided, a string description is
+        returned as is.
+
+    Returns
+    -------
+    description : str
+        The formatted description.
+
+    """
+    if callable(description):
+        return description(*args)
+
+    if args:
+        return description % args
+
+    return description
+
+
 def default_log_file_name():
     """
     Returns a path + filename that can be used for the log file right away.
@@ -142,7 +231,7 @@ def standardize_severity_string(severity):
     return severity.title()  # first char uppercase, rest lowercase.
 
 
-class PgeLogger:
+class PgeLogger(LogSinkMixin, LogMetricsMixin):
     """
     Class to help with the PGE logging.
 
@@ -154,7 +243,9 @@ class PgeLogger:
     LOGGER_CODE_BASE = 900000
 
     def __init__(self, workflow=None, error_code_base=None,
-                 log_filename=None):
+                 log_filename=None, max_memory_size=None, spill_dir=None,
+                 location_mode=LOCATION_MODE_FAST, write_behind=False,
+                 json_lines=False, compression=None, level='Debug'):
         """
         Constructor opens the log file as a stream
 
@@ -169,11 +260,55 @@ class PgeLogger:
         log_filename : str, optional
             Path to write the log's contents to on disk. Defaults to the value
             provided by default_log_file_name().
+        max_memory_size : int, optional
+            Maximum number of characters of the log to keep in memory. Once
+            exceeded, the log is spilled to a temporary file within spill_dir,
+            to which all subsequent messages are written. Defaults to no limit,
+            in which case the entire log is kept in memory until closed.
+        spill_dir : str, optional
+            Directory to create the temporary spill file within. Defaults to
+            the system temporary directory.
+        location_mode : str, optional
+            How the file name and line number of the caller of each message is
+            determined, one of "inspect", "fast" or "off". The "inspect" mode
+            walks back through the call stack one frame at a time, while the
+            "fast" mode jumps directly to the caller frame and reuses previously
+            formatted locations. Both produce identical locations. The "off"
+            mode skips capture of the location entirely, logging "N/A" in its
+            place. Defaults to "fast".
+        write_behind : bool, optional
+            If True, the log is additionally mirrored to a journal on disk by
+            a background thread, see enable_write_behind(). Defaults to False.
+        json_lines : bool, optional
+            If True, a structured JSON lines version of the log is written
+            alongside the log file, see enable_json_lines(). Defaults to False.
+        compression : str, optional
+            Compression format to write the log file with once the log stream
+            is closed, either "gzip" or "lzma". The extension of the format
+            (".gz" or ".xz") is appended to the log filename when the log is
+            closed. Defaults to no compression.
+        level : str, optional
+            The minimum severity level of messages to log, one of "Debug",
+            "Info", "Warning" or "Critical" (case-insensitive). Messages below
+            this level are discarded before any formatting takes place.
+            Critical messages are always logged. Defaults to "Debug", which
+            logs all messages.
 
         """
         self.start_time = time.monotonic()
         self.log_count_by_severity = self._make_blank_log_count_by_severity_dict()
+        self._partial_line = ''
+        self._partial_line_split = False
         self.log_filename = log_filename
+        self.max_memory_size = max_memory_size
+        self.spill_dir = spill_dir
+        self.location_mode = location_mode
+        self.compression = compression
+        self.level = level
+        self._sink = None
+        self._json_sink = None
+        self._forward_sink = None
+        self.metrics = MetricsRegistry()
 
         if not log_filename:
             self.log_filename = default_log_file_name()
@@ -188,6 +323,12 @@ class PgeLogger:
         self._error_code_base = (error_code_base
                                  if error_code_base else PgeLogger.LOGGER_CODE_BASE)
 
+        if write_behind:
+            self.enable_write_behind()
+
+        if json_lines:
+            self.enable_json_lines()
+
     @property
     def workflow(self):
         return self._workflow
@@ -204,22 +345,158 @@ class PgeLogger:
     def error_code_base(self, error_code_base: int):
         self._error_code_base = error_code_base
 
+    @property
+    def compression(self):
+        return self._compression
+
+    @compression.setter
+    def compression(self, compression: str):
+        if compression is not None and compression not in COMPRESSION_EXTENSIONS:
+            raise ValueError(f"Invalid compression format '{compression}', "
+                             f"must be one of {tuple(COMPRESSION_EXTENSIONS)}")
+
+        self._compression = compression
+
+    @property
+    def level(self):
+        return SEVERITY_LEVELS[self._level_rank]
+
+    @level.setter
+    def level(self, level: str):
+        level = standardize_severity_string(level)
+
+        if level not in _SEVERITY_RANKS:
+            raise ValueError(f"Invalid log level '{level}', must be one of {SEVERITY_LEVELS}")
+
+        self._level_rank = _SEVERITY_RANKS[level]
+
+    def is_enabled_for(self, severity):
+        """
+        Returns True if messages of the provided severity level are logged,
+        given the current level of the logger. This may be used to avoid the
+        cost of gathering information solely for a message that is discarded.
+
+        Parameters
+        ----------
+        severity : str
+            The severity level to check (case-insensitive).
+
+        """
+        return _SEVERITY_RANKS.get(standardize_severity_string(severity), 0) >= self._level_rank
+
+    @property
+    def location_mode(self):
+        return self._location_mode
+
+    @location_mode.setter
+    def location_mode(self, location_mode: str):
+        if location_mode not in LOCATION_MODES:
+            raise ValueError(f"Invalid location mode '{location_mode}', "
+                             f"must be one of {LOCATION_MODES}")
+
+        self._location_mode = location_mode
+
+    @property
+    def spilled(self):
+        """Returns True if the log has been spilled from memory to disk."""
+        return not isinstance(self.log_stream, StringIO)
+
+    def _spill_if_needed(self):
+        """
+        Moves the contents of the in-memory log stream to a temporary file
+        within the spill directory, if the configured maximum in-memory size
+        has been exceeded. The temporary file then replaces the in-memory
+        stream for all subsequent writes, and is removed once the log stream
+        is closed.
+
+        """
+        if self.max_memory_size is None or self.spilled:
+            return
+
+        if self.log_stream.tell() <= self.max_memory_size:
+            return
+
+        spill_file = tempfile.NamedTemporaryFile(
+            mode='w+', encoding='utf-8', dir=self.spill_dir, suffix='.spill',
+            prefix=f'{splitext(basename(self.log_filename))[0]}_'
+        )
+
+        spill_file.write(self.log_stream.getvalue())
+
+        self.log_stream.close()
+        self.log_stream = spill_file
+
     def close_log_stream(self):
         """
         Writes the log summary to the log stream
         Writes the log stream to a log file and saves the file to disk
         Closes the log stream
 
+        If the log was spilled to disk, the temporary spill file is removed
+        once its contents are written to the log file. Likewise, any
+        write-behind journal is removed once the log file is written.
+
+        If compression is enabled, the log (and any JSON lines version of it)
+        is compressed as it is written, with the extension of the compression
+        format appended to the log filename. The logger's file name reflects
+        the compressed filename once this method returns. Compressed logs may
+        be read with open_pge_log().
+
+        The summary metrics, along with the full contents of the metrics
+        registry of the logger, are also written to a JSON file alongside the
+        log file (see get_metrics_file_name()). The JSON file is written last,
+        so that it may also include the time taken to close the log stream,
+        as the "stage.close_log_stream.*" metrics. Should the JSON file fail to
+        be written, a warning is written to stderr, as the log is already
+        closed.
+
         """
         if self.log_stream and not self.log_stream.closed:
-            self.write_log_summary()
+            metrics_filename = self.get_metrics_file_name()
+
+            with StageTimer(self.metrics, 'close_log_stream'):
+                if self._sink and self._sink.error:
+                    self.warning("PgeLogger", ErrorCode.LOG_JOURNAL_FAILED,
+                                 f"Write-behind journal {self._sink.filename} is incomplete, "
+                                 f"reason: {str(self._sink.error)}")
 
-            self.log_stream.seek(0)
+                summary = self.write_log_summary()
 
-            with open(self.log_filename, 'w') as outfile:
-                shutil.copyfileobj(self.log_stream, outfile)
+                if self._forward_sink:
+                    self._forward_sink.close(failed=self.log_count_by_severity['Critical'] > 0)
+                    self._forward_sink = None
 
-            self.log_stream.close()
+                json_lines_filename = self.get_json_lines_file_name()
+
+                if self.compression:
+                    extension = COMPRESSION_EXTENSIONS[self.compression]
+                    self.log_filename += extension
+
+                    if json_lines_filename:
+                        json_lines_filename += extension
+
+                self.log_stream.seek(0)
+
+                with open_pge_log(self.log_filename, 'w') as outfile:
+                    shutil.copyfileobj(self.log_stream, outfile)
+
+                self.log_stream.close()
+
+                if self._sink:
+                    self._sink.close()
+                    self._sink = None
+
+                if self._json_sink:
+                    self._json_sink.close(json_lines_filename,
+                                          opener=open_pge_log if self.compression else None)
+                    self._json_sink = None
+
+            try:
+                self.metrics.write_json(metrics_filename, workflow=self.workflow, summary=summary)
+            except OSError as err:
+                write(sys.stderr, "Warning", self.workflow, "PgeLogger",
+                      self.error_code_base + ErrorCode.METRICS_NOT_WRITTEN, DISABLED_LOCATION,
+                      f"Failed to write metrics to {metrics_filename}, reason: {str(err)}")
 
     def get_log_count_by_severity(self, severity):
         """
@@ -279,7 +556,7 @@ class PgeLogger:
                          f"Could not increment severity level: '{severity}' ")
 
     def write(self, severity, module, error_code_offset, description,
-              additional_back_frames=0):
+              additional_back_frames=0, metric=None):
         """
         Write a message to the log.
 
@@ -294,30 +571,80 @@ class PgeLogger:
             Error code offset to add to the specified base to determine the
             error code associated with the log message
             TODO: should this be just the error code itself?
-        description : str
-            Description message to write to the log.
+        description : str or callable
+            Description message to write to the log, or a callable returning
+            the description, which is only invoked if the message is logged.
         additional_back_frames : int, optional
             Number of call-stack frames to "back up" to in order to determine
             the calling function and line number.
+        metric : tuple, optional
+            Name and value of the metric described by the message, if any,
+            which are recorded as distinct fields by structured log output.
 
         """
         severity = standardize_severity_string(severity)
+
+        if _SEVERITY_RANKS.get(severity, 0) < self._level_rank:
+            return
+
+        if callable(description):
+            description = description()
+
         self.increment_log_count_by_severity(severity)
 
-        caller = inspect.currentframe().f_back
+        if self._location_mode == LOCATION_MODE_FAST:
+            # Frame 0 is this method, so the caller is always one frame beyond
+            # the requested number of back frames
+            caller = sys._getframe(additional_back_frames + 1)
+            location_key = (caller.f_code, caller.f_lineno)
+
+            location = _location_cache.get(location_key)
+
+            if location is None:
+                location = caller.f_code.co_filename + ':' + str(caller.f_lineno)
+                _location_cache[location_key] = location
+        elif self._location_mode == LOCATION_MODE_OFF:
+            location = DISABLED_LOCATION
+        else:
+            caller = inspect.currentframe().f_back
+
+            # TODO: Can the number of back frames be determined implicitly?
+            #       i.e. back up until the first non-logging frame is reached?
+            for _ in range(additional_back_frames):
+                caller = caller.f_back
+
+            location = caller.f_code.co_filename + ':' + str(caller.f_lineno)
+
+        error_code = self.error_code_base + error_code_offset
 
-        # TODO: Can the number of back frames be determined implicitly?
-        #       i.e. back up until the first non-logging frame is reached?
-        for _ in range(additional_back_frames):
-            caller = caller.f_back
+        message = write(self.log_stream, severity, self.workflow, module,
+                        error_code, location, description)
 
-        location = caller.f_code.co_filename + ':' + str(caller.f_lineno)
+        if self._sink:
+            self._sink.write(message)
 
-        write(self.log_stream, severity, self.workflow, module,
-              self.error_code_base + error_code_offset,
-              location, description)
+        if self._forward_sink:
+            self._forward_sink.write(message)
 
-    def info(self, module, error_code_offset, description):
+        if self._json_sink:
+            record = {
+                'time': message[:message.index(',')],
+                'severity': severity,
+                'workflow': self.workflow,
+                'module': module,
+                'error_code': int(error_code),
+                'location': location,
+                'description': description
+            }
+
+            if metric:
+                record['metric'], record['value'] = metric
+
+            self._json_sink.write_record(record)
+
+        self._spill_if_needed()
+
+    def info(self, module, error_code_offset, description, *args):
         """
         Write an info-level message to the log.
 
@@ -329,14 +656,21 @@ class PgeLogger:
             Error code offset to add to the specified base to determine the
             error code associated with the log message
             TODO: should this be just the error code itself?
-        description : str
-            Description message to write to the log.
+        description : str or callable
+            Description message to write to the log. May be a %-style format
+            string, or a callable returning the description, which are only
+            evaluated if the message is logged. See format_description().
+        args : tuple
+            Any arguments to the description.
 
         """
-        self.write("Info", module, error_code_offset, description,
+        if self._level_rank > _INFO_RANK:
+            return
+
+        self.write("Info", module, error_code_offset, format_description(description, args),
                    additional_back_frames=1)
 
-    def debug(self, module, error_code_offset, description):
+    def debug(self, module, error_code_offset, description, *args):
         """
         Write a debug-level message to the log.
 
@@ -348,14 +682,21 @@ class PgeLogger:
             Error code offset to add to the specified base to determine the
             error code associated with the log message
             TODO: should this be just the error code itself?
-        description : str
-            Description message to write to the log.
+        description : str or callable
+            Description message to write to the log. May be a %-style format
+            string, or a callable returning the description, which are only
+            evaluated if the message is logged. See format_description().
+        args : tuple
+            Any arguments to the description.
 
         """
-        self.write("Debug", module, error_code_offset, description,
+        if self._level_rank > _DEBUG_RANK:
+            return
+
+        self.write("Debug", module, error_code_offset, format_description(description, args),
                    additional_back_frames=1)
 
-    def warning(self, module, error_code_offset, description):
+    def warning(self, module, error_code_offset, description, *args):
         """
         Write a warning-level message to the log.
 
@@ -367,14 +708,21 @@ class PgeLogger:
             Error code offset to add to the specified base to determine the
             error code associated with the log message
             TODO: should this be just the error code itself?
-        description : str
-            Description message to write to the log.
+        description : str or callable
+            Description message to write to the log. May be a %-style format
+            string, or a callable returning the description, which are only
+            evaluated if the message is logged. See format_description().
+        args : tuple
+            Any arguments to the description.
 
         """
-        self.write("Warning", module, error_code_offset, description,
+        if self._level_rank > _WARNING_RANK:
+            return
+
+        self.write("Warning", module, error_code_offset, format_description(description, args),
                    additional_back_frames=1)
 
-    def critical(self, module, error_code_offset, description):
+    def critical(self, module, error_code_offset, description, *args):
         """
         Write a critical-level message to the log.
 
@@ -391,18 +739,30 @@ class PgeLogger:
             Error code offset to add to the specified base to determine the
             error code associated with the log message
             TODO: should this be just the error code itself?
-        description : str
-            Description message to write to the log.
+        description : str or callable
+            Description message to write to the log. May be a %-style format
+            string, or a callable returning the description. See
+            format_description().
+        args : tuple
+            Any arguments to the description.
 
         """
+        description = format_description(description, args)
+
         self.write("Critical", module, error_code_offset, description,
                    additional_back_frames=1)
 
+        # Make sure the critical message reaches the journal, even if the
+        # log file itself cannot be written
+        if self._sink:
+            self._sink.flush()
+
         self.close_log_stream()
 
         raise RuntimeError(description)
 
-    def log(self, module, error_code_offset, description, additional_back_frames=0):
+    def log(self, module, error_code_offset, description, additional_back_frames=0,
+            metric=None):
         """
         Logs any kind of message.
 
@@ -417,16 +777,24 @@ class PgeLogger:
             Error code offset to add to the specified base to determine the
             error code associated with the log message
             TODO: should this be just the error code itself?
-        description : str
-            Description message to write to the log.
+        description : str or callable
+            Description message to write to the log, or a callable returning
+            the description, which is only invoked if the message is logged.
         additional_back_frames : int, optional
             Number of call-stack frames to "back up" to in order to determine
             the calling function and line number.
+        metric : tuple, optional
+            Name and value of the metric described by the message, if any.
+            See write().
 
         """
         severity = get_severity_from_error_code(error_code_offset)
+
+        if _SEVERITY_RANKS[severity] < self._level_rank:
+            return
+
         self.write(severity, module, error_code_offset, description,
-                   additional_back_frames=additional_back_frames + 1)
+                   additional_back_frames=additional_back_frames + 1, metric=metric)
 
     def get_warning_count(self):
         """Returns the number of messages logged at the warning level."""
@@ -449,8 +817,14 @@ class PgeLogger:
         """
         self.log_filename = new_filename
 
+        if self._sink:
+            self._sink.move(f'{new_filename}{JOURNAL_SUFFIX}')
+
     def get_stream_object(self):
-        """Return the stingIO object for the current log."""
+        """
+        Return the stream object for the current log. This is a StringIO
+        object, unless the log has been spilled to disk.
+        """
         return self.log_stream
 
     def get_file_name(self):
@@ -471,60 +845,121 @@ class PgeLogger:
         """
 
         if isfile(source):
-            with open(source, 'r') as source_file_object:
-                source_contents = source_file_object.read()
+            with open(source, 'r', encoding='utf-8') as source_file_object:
+                for source_contents in iter(lambda: source_file_object.read(APPEND_CHUNK_SIZE), ''):
+                    self.append_text(source_contents)
         else:
-            source_contents = source
+            self.append_text(source)
+
+    def append_text(self, text):
+        """
+        Appends the provided text to this log file as is.
 
-        self.log_stream.write(source_contents)
+        Unlike append(), the provided text is never interpreted as a file
+        name, which makes this method suitable for appending arbitrary chunks
+        of output, such as those streamed from a running SAS executable.
+
+        Any complete lines within the appended text which are formatted as log
+        messages (such as those written by a SAS using the same log format)
+        are tallied into the log counts by severity as they arrive. Lines
+        split across multiple calls to this method are reassembled before
+        being tallied.
+
+        Parameters
+        ----------
+        text : str
+            The text to append.
 
-    def log_one_metric(self, module, metric_name, metric_value,
-                       additional_back_frames=0):
         """
-        Writes one metric value to the log file.
+        self.log_stream.write(text)
+
+        if self._sink:
+            self._sink.write(text)
+
+        if self._forward_sink:
+            self._forward_sink.write(text)
+
+        self._spill_if_needed()
+
+        lines = text.split('\n')
+        lines[0] = self._partial_line + lines[0]
+
+        # The last element is whatever follows the final newline, which is
+        # the start of a line yet to be completed by subsequent text. Only
+        # the start of the line is needed to tally its severity, but the
+        # entire line is needed for structured output, so a line too long to
+        # hold is recorded in fragments.
+        self._partial_line = lines.pop()
+
+        for line in lines:
+            self._process_appended_line(line)
+
+        if not self._json_sink:
+            self._partial_line = self._partial_line[:SEVERITY_PREFIX_LENGTH]
+        elif len(self._partial_line) >= MAX_PARTIAL_LINE_LENGTH:
+            self._process_appended_line(self._partial_line, complete=False)
+            self._partial_line = ''
+
+    def _process_appended_line(self, line, complete=True):
+        """
+        Tallies the severity of a line of appended text, and records the line
+        within the structured log output, if enabled. Lines too long to be
+        recorded whole are recorded in fragments, each with a "partial" field
+        set to true, of which only the first is tallied.
 
         Parameters
         ----------
-        module : str
-            Name of the module where the logging took place.
-        metric_name : str
-            Name of the metric being logged.
-        metric_value : object
-            Value to associate to the logged metric.
-        additional_back_frames : int
-            Number of call-stack frames to "back up" to in order to determine
-            the calling function and line number.
+        line : str
+            A single line of text appended to the log, or a fragment of one.
+        complete : bool, optional
+            False if the line is yet to be completed by subsequent text.
 
         """
-        # msg = "{}: {}".format(metric_name, metric_value)
-        msg = f"{metric_name}: {metric_value}"
-        self.log(module, ErrorCode.SUMMARY_STATS_MESSAGE, msg,
-                 additional_back_frames=additional_back_frames + 1)
+        partial = self._partial_line_split or not complete
+        severity = None if self._partial_line_split else self._count_line_severity(line)
+
+        self._partial_line_split = not complete
+
+        if self._json_sink:
+            record = {
+                'time': time_util.get_current_iso_time_cached(),
+                'severity': severity,
+                'description': line
+            }
 
-    def write_log_summary(self):
+            if partial:
+                record['partial'] = True
+
+            self._json_sink.write_record(record)
+
+    def _count_line_severity(self, line):
         """
-        Writes a summary at the end of the log file, which includes totals
-        of each message logged for each severity level, OS-level metrics,
-        and total elapsed run time (since logger creation).
+        Increments the log count for the severity of the provided line, if
+        the line is formatted as a log message. Lines which are not log
+        messages are ignored.
+
+        Parameters
+        ----------
+        line : str
+            A single line of text from the log.
+
+        Returns
+        -------
+        severity : str or None
+            The severity of the line, or None if the line is not formatted
+            as a log message.
 
         """
-        module_name = "PgeLogger"
+        row = line.split(',', 2)
 
-        # totals of messages logged
-        copy_of_log_count_by_severity = self.log_count_by_severity.copy()
-        for severity, count in copy_of_log_count_by_severity.items():
-            metric_name = "overall.log_messages." + severity.lower()
-            self.log_one_metric(module_name, metric_name, count)
+        if len(row) >= 2:
+            severity = standardize_severity_string(row[1].strip())
 
-        # overall OS metrics
-        metrics = get_os_metrics()
-        for metric_name, value in metrics.items():
-            self.log_one_metric(module_name, "overall." + metric_name, value)
+            if severity in self.log_count_by_severity:
+                self.log_count_by_severity[severity] += 1
+                return severity
 
-        # Overall elapsed time
-        elapsed_time_seconds = time.monotonic() - self.start_time
-        self.log_one_metric(module_name, "overall.elapsed_seconds",
-                            elapsed_time_seconds)
+        return None
 
     def resync_log_count_by_severity(self):
         """
@@ -532,24 +967,32 @@ class PgeLogger:
         messages in the log file, including messages logged by anything external
         to the PgeLogger class, such as an external SAS invoked by a PGE wrapper.
 
-        """
-        # TODO: is this method really necessary? if the log file was kept in
-        #       memory, could these tallies be kept in real-time?
+        Note that messages appended via append() or append_text() are tallied
+        as they arrive, so this method is only needed if the log stream was
+        written to directly, since it rescans the entire log.
 
+        """
         if not self.log_stream:
             return
 
-        # read the log_stream and get a count of log messages for each severity
+        # read the log_stream and get a count of log messages for each severity,
+        # one line at a time so the log need not be fully loaded into memory
         count_by_severity = self._make_blank_log_count_by_severity_dict()
-        csv_reader = self.log_stream.getvalue().split('\n')
-        for i in csv_reader:
+        num_failures = 0
+        self.log_stream.seek(0)
+        for i in self.log_stream:
             row = i.split(',')
             if len(row) >= 2:
                 try:
                     severity = standardize_severity_string(row[1].strip())
                     count_by_severity[severity] += 1
                 except KeyError:
-                    self.warning("PgeLogger", ErrorCode.LOGGING_RESYNC_FAILED,
-                                 f"Unable to resync the 'log_count_by_severity' dict.")
+                    num_failures += 1
+
+        # Warnings can only be written once the stream is back at its end
+        self.log_stream.seek(0, os.SEEK_END)
+        for _ in range(num_failures):
+            self.warning("PgeLogger", ErrorCode.LOGGING_RESYNC_FAILED,
+                         "Unable to resync the 'log_count_by_severity' dict.")
 
         self.log_count_by_severity = count_by_severity
@@ -0,0 +1,548 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021, by the California Institute of Technology.
+# ALL RIGHTS RESERVED.
+# United States Government sponsorship acknowledged.
+# Any commercial use must be negotiated with the Office of Technology Transfer
+# at the California Institute of Technology.
+# This software may be subject to U.S. export control laws and regulations.
+# By accepting this document, the user agrees to comply with all applicable
+# U.S. export laws and regulations. User has the responsibility to obtain
+# export licenses, or other export authority as may be required, before
+# exporting such information to foreign countries or providing access to
+# foreign persons.
+#
+
+"""
+==========
+metrics.py
+==========
+
+Registry of the metrics accumulated over the course of a PGE job.
+
+Metrics are identified by dot-separated names, following the convention used
+for the metrics logged by PgeLogger (e.g. "sas.elapsed_seconds"), and are one
+of the following kinds:
+
+    Counter   : a monotonically increasing total, such as a number of bytes.
+    Gauge     : a value which is set, such as a queue depth or a file count.
+    Histogram : a distribution of observed values, over fixed buckets.
+
+Timers are provided as context managers which record their elapsed time,
+in seconds, into a histogram. Stage timers additionally record the resources
+used over the course of a processing stage (see timed_stage()).
+
+"""
+
+import bisect
+import functools
+import json
+import resource
+import threading
+import time
+
+from os.path import splitext
+
+from .error_codes import ErrorCode
+from .trace import trace_span
+from .usage_metrics import get_os_metrics
+
+DEFAULT_TIMER_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0, 300.0, 1800.0, 3600.0)
+"""Default upper bounds, in seconds, of the histogram buckets used by timers"""
+
+DEFAULT_SIZE_BUCKETS = tuple(2 ** exponent for exponent in range(0, 41, 4))
+"""Default upper bounds, in bytes, of the histogram buckets used for sizes"""
+
+STAGE_METRIC_PREFIX = 'stage'
+"""Prefix of the names of the metrics recorded by StageTimer"""
+
+METRICS_FILE_SUFFIX = '_metrics.json'
+"""Suffix appended to the base name of the log to name the JSON file of its metrics"""
+
+# Resource usage of the calling thread is preferred, as pre- and
+# post-processing stages may run on a worker thread alongside other jobs
+_RUSAGE_WHO = getattr(resource, 'RUSAGE_THREAD', resource.RUSAGE_SELF)
+
+_RUSAGE_DELTA_FIELDS = {
+    'user_cpu_seconds': 'ru_utime',
+    'system_cpu_seconds': 'ru_stime',
+    'block_input_ops': 'ru_inblock',
+    'block_output_ops': 'ru_oublock',
+    'voluntary_context_switches': 'ru_nvcsw',
+    'involuntary_context_switches': 'ru_nivcsw'
+}
+"""Mapping of the resource usage deltas recorded by StageTimer to their rusage fields"""
+
+
+class Counter:
+    """A monotonically increasing total."""
+
+    kind = 'counter'
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def increment(self, amount=1):
+        """
+        Increments the counter.
+
+        Parameters
+        ----------
+        amount : int or float, optional
+            The (non-negative) amount to increment by. Defaults to one.
+
+        """
+        if amount < 0:
+            raise ValueError(f'Counters may only be incremented, got {amount}')
+
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self):
+        """Returns the current value of the counter."""
+        return self.value
+
+    def summary(self):
+        """Returns the (name suffix, value) pairs summarizing the counter."""
+        return [('', self.value)]
+
+
+class Gauge:
+    """A value which may be arbitrarily set."""
+
+    kind = 'gauge'
+
+    def __init__(self):
+        self.value = None
+
+    def set(self, value):
+        """
+        Sets the value of the gauge.
+
+        Parameters
+        ----------
+        value : object
+            The new value of the gauge.
+
+        """
+        self.value = value
+
+    def snapshot(self):
+        """Returns the current value of the gauge."""
+        return self.value
+
+    def summary(self):
+        """Returns the (name suffix, value) pairs summarizing the gauge."""
+        return [('', self.value)]
+
+
+class Histogram:
+    """
+    Distribution of observed values over a fixed set of buckets.
+
+    Each bucket counts the observations less than or equal to its upper
+    bound, and greater than the bound of the preceding bucket. A final,
+    unbounded bucket counts any observations exceeding the largest bound.
+
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, buckets):
+        """
+        Creates a new instance of Histogram
+
+        Parameters
+        ----------
+        buckets : Iterable[float]
+            The upper bounds of the buckets of the histogram.
+
+        """
+        self.buckets = tuple(sorted(buckets))
+
+        if not self.buckets:
+            raise ValueError('A histogram requires at least one bucket')
+
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        """
+        Records an observed value.
+
+        Parameters
+        ----------
+        value : int or float
+            The observed value.
+
+        """
+        index = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+
+    @property
+    def mean(self):
+        """Returns the mean of the observed values, or None if there are none."""
+        return self.total / self.count if self.count else None
+
+    def snapshot(self):
+        """Returns a dictionary of the statistics and bucket counts of the histogram."""
+        with self._lock:
+            bounds = [str(bound) for bound in self.buckets] + ['inf']
+
+            return {
+                'count': self.count,
+                'sum': self.total,
+                'min': self.min,
+                'max': self.max,
+                'mean': self.mean,
+                'buckets': dict(zip(bounds, self.counts))
+            }
+
+    def summary(self):
+        """Returns the (name suffix, value) pairs summarizing the histogram."""
+        return [('.count', self.count), ('.sum', self.total), ('.min', self.min),
+                ('.max', self.max), ('.mean', self.mean)]
+
+
+class Timer:
+    """
+    Context manager which records the elapsed (monotonic) time of its body,
+    in seconds, into a histogram.
+    """
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start_time = None
+        self.elapsed_time = None
+
+    def __enter__(self):
+        self.start_time = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.elapsed_time = time.monotonic() - self.start_time
+        self.histogram.observe(self.elapsed_time)
+
+
+class StageTimer:
+    """
+    Context manager which records the elapsed (monotonic) time of a processing
+    stage, along with the change in resource usage over the stage, as the
+    following metrics of a registry:
+
+        stage.<name>.elapsed_seconds              : histogram
+        stage.<name>.user_cpu_seconds             : counter
+        stage.<name>.system_cpu_seconds           : counter
+        stage.<name>.block_input_ops              : counter
+        stage.<name>.block_output_ops             : counter
+        stage.<name>.voluntary_context_switches   : counter
+        stage.<name>.involuntary_context_switches : counter
+        stage.<name>.max_rss_kb                   : gauge
+
+    The metrics are recorded whether or not the stage completes successfully.
+
+    """
+
+    def __init__(self, metrics, name):
+        """
+        Creates a new instance of StageTimer
+
+        Parameters
+        ----------
+        metrics : MetricsRegistry or None
+            The registry to record the metrics of the stage into. If None, the
+            registry may instead be assigned (to the metrics attribute) before
+            the stage completes, such as when the registry is itself created
+            by the stage.
+        name : str
+            Name of the stage.
+
+        """
+        self.metrics = metrics
+        self.name = name
+        self.start_time = None
+        self.start_usage = None
+        self.elapsed_time = None
+
+    def __enter__(self):
+        self.start_usage = resource.getrusage(_RUSAGE_WHO)
+        self.start_time = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.elapsed_time = time.monotonic() - self.start_time
+        end_usage = resource.getrusage(_RUSAGE_WHO)
+
+        if self.metrics is None:
+            return
+
+        prefix = f'{STAGE_METRIC_PREFIX}.{self.name}'
+
+        self.metrics.histogram(f'{prefix}.elapsed_seconds', DEFAULT_TIMER_BUCKETS).observe(self.elapsed_time)
+
+        for metric_name, field in _RUSAGE_DELTA_FIELDS.items():
+            delta = getattr(end_usage, field) - getattr(self.start_usage, field)
+            self.metrics.counter(f'{prefix}.{metric_name}').increment(max(delta, 0))
+
+        self.metrics.gauge(f'{prefix}.max_rss_kb').set(end_usage.ru_maxrss)
+
+
+def timed_stage(name=None):
+    """
+    Decorator which times each call to a method of a PGE, such as a pre- or
+    post-processing step, as a stage via StageTimer. The metrics are recorded
+    into the registry of the logger of the PGE instance (self.logger.metrics),
+    as determined once the method returns, so that the stage which creates
+    the logger is also timed. If the PGE instance has a trace recorder
+    (self.trace), each call is also recorded as a span of the trace.
+
+    Parameters
+    ----------
+    name : str, optional
+        Name of the stage. Defaults to the name of the decorated method,
+        without any leading underscores.
+
+    """
+    def decorator(method):
+        stage_name = name or method.__name__.lstrip('_')
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with trace_span(getattr(self, 'trace', None), stage_name, category='stage'), \
+                    StageTimer(None, stage_name) as stage_timer:
+                try:
+                    return method(self, *args, **kwargs)
+                finally:
+                    stage_timer.metrics = getattr(getattr(self, 'logger', None), 'metrics', None)
+
+        return wrapper
+
+    return decorator
+
+
+class MetricsRegistry:
+    """
+    Collection of the named metrics accumulated over the course of a PGE job.
+
+    Metrics are created on first use, and subsequently retrieved by name, so
+    independent components may contribute to the same metric. Requesting an
+    existing metric as a different kind raises a ValueError.
+
+    """
+
+    def __init__(self):
+        """Creates a new, empty instance of MetricsRegistry"""
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._metrics)
+
+    def __contains__(self, name):
+        return name in self._metrics
+
+    def _get_or_create(self, name, metric_class, *args):
+        """Returns the named metric, creating it if it does not exist."""
+        metric = self._metrics.get(name)
+
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.setdefault(name, metric_class(*args))
+
+        if not isinstance(metric, metric_class):
+            raise ValueError(f'Metric {name} is a {metric.kind}, not a {metric_class.kind}')
+
+        return metric
+
+    def counter(self, name):
+        """Returns the named Counter, creating it if it does not exist."""
+        return self._get_or_create(name, Counter)
+
+    def gauge(self, name):
+        """Returns the named Gauge, creating it if it does not exist."""
+        return self._get_or_create(name, Gauge)
+
+    def histogram(self, name, buckets=DEFAULT_SIZE_BUCKETS):
+        """
+        Returns the named Histogram, creating it if it does not exist.
+
+        Parameters
+        ----------
+        name : str
+            Name of the histogram.
+        buckets : Iterable[float], optional
+            The upper bounds of the buckets of the histogram, used only when
+            the histogram is created.
+
+        """
+        return self._get_or_create(name, Histogram, buckets)
+
+    def timer(self, name, buckets=DEFAULT_TIMER_BUCKETS):
+        """
+        Returns a new Timer recording into the named histogram, for use as a
+        context manager, e.g.:
+
+            with metrics.timer('sas.execution_seconds'):
+                ...
+
+        Parameters
+        ----------
+        name : str
+            Name of the histogram to record the elapsed time into.
+        buckets : Iterable[float], optional
+            The upper bounds, in seconds, of the buckets of the histogram, used
+            only when the histogram is created.
+
+        """
+        return Timer(self.histogram(name, buckets))
+
+    def summary(self):
+        """
+        Returns the flattened (name, value) pairs summarizing every metric in
+        the registry, sorted by name, as suitable for logging.
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+
+        return [(name + suffix, value)
+                for name, metric in metrics
+                for suffix, value in metric.summary()]
+
+    def snapshot(self):
+        """
+        Returns a dictionary of the current state of every metric in the
+        registry, keyed by kind, then by name.
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+
+        snapshot = {'counters': {}, 'gauges': {}, 'histograms': {}}
+
+        for name, metric in metrics:
+            snapshot[f'{metric.kind}s'][name] = metric.snapshot()
+
+        return snapshot
+
+    def write_json(self, filename, **extra_fields):
+        """
+        Writes a snapshot of the registry to a JSON file.
+
+        Parameters
+        ----------
+        filename : str
+            Path to the JSON file to write.
+        extra_fields : dict
+            Any additional top-level fields to include in the JSON file.
+
+        """
+        document = dict(extra_fields)
+        document.update(self.snapshot())
+
+        with open(filename, 'w', encoding='utf-8') as outfile:
+            json.dump(document, outfile, indent=2, default=str)
+
+
+class LogMetricsMixin:
+    """
+    Mixin class providing the logging of metrics by a PgeLogger, including
+    the summary written at the end of the log.
+
+    The metrics accumulated over the course of the job are held by the
+    metrics attribute of the logger, a MetricsRegistry instance.
+
+    """
+
+    def get_metrics_file_name(self):
+        """
+        Returns the file name the metrics accumulated by the logger are
+        written to, as JSON, once the log is closed.
+        """
+        return f'{splitext(self.log_filename)[0]}{METRICS_FILE_SUFFIX}'
+
+    def log_one_metric(self, module, metric_name, metric_value,
+                       additional_back_frames=0):
+        """
+        Writes one metric value to the log file.
+
+        Parameters
+        ----------
+        module : str
+            Name of the module where the logging took place.
+        metric_name : str
+            Name of the metric being logged.
+        metric_value : object
+            Value to associate to the logged metric.
+        additional_back_frames : int
+            Number of call-stack frames to "back up" to in order to determine
+            the calling function and line number.
+
+        """
+        # Message is only formatted if the logger level permits it to be written
+        self.log(module, ErrorCode.SUMMARY_STATS_MESSAGE,
+                 lambda: f"{metric_name}: {metric_value}",
+                 additional_back_frames=additional_back_frames + 1,
+                 metric=(metric_name, metric_value))
+
+    def write_log_summary(self):
+        """
+        Writes a summary at the end of the log file, which includes totals
+        of each message logged for each severity level, OS-level metrics,
+        and total elapsed run time (since logger creation), followed by a
+        block summarizing each metric accumulated in the metrics registry of
+        the logger.
+
+        The summary is always written, regardless of the level of the logger.
+
+        Returns
+        -------
+        summary : dict
+            The overall metrics written to the summary, keyed by metric name.
+
+        """
+        module_name = "PgeLogger"
+
+        # Account for any final line of appended text lacking a newline
+        if self._partial_line:
+            self._process_appended_line(self._partial_line)
+            self._partial_line = ''
+
+        summary = {}
+
+        # totals of messages logged
+        copy_of_log_count_by_severity = self.log_count_by_severity.copy()
+        for severity, count in copy_of_log_count_by_severity.items():
+            summary["overall.log_messages." + severity.lower()] = count
+
+        # overall OS metrics
+        metrics = get_os_metrics()
+        for metric_name, value in metrics.items():
+            summary["overall." + metric_name] = value
+
+        # Overall elapsed time
+        summary["overall.elapsed_seconds"] = time.monotonic() - self.start_time
+
+        level = self.level
+        self.level = 'Debug'
+
+        try:
+            for metric_name, value in summary.items():
+                self.log_one_metric(module_name, metric_name, value)
+
+            # Metrics accumulated over the course of the job
+            for metric_name, value in self.metrics.summary():
+                self.log_one_metric(module_name, metric_name, value)
+        finally:
+            self.level = level
+
+        return summary
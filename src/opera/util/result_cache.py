@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021, by the California Institute of Technology.
+# ALL RIGHTS RESERVED.
+# United States Government sponsorship acknowledged.
+# Any commercial use must be negotiated with the Office of Technology Transfer
+# at the California Institute of Technology.
+# This software may be subject to U.S. export control laws and regulations.
+# By accepting this document, the user agrees to comply with all applicable
+# U.S. export laws and regulations. User has the responsibility to obtain
+# export licenses, or other export authority as may be required, before
+# exporting such information to foreign countries or providing access to
+# foreign persons.
+#
+
+"""
+===============
+result_cache.py
+===============
+
+Content-addressed cache of SAS results for use with OPERA PGEs.
+
+Each cache entry holds the output files produced by a single SAS execution,
+keyed by a hash of everything that determines those outputs: the contents of
+the input files, the isolated SAS RunConfig, and the identity of the SAS
+program itself. When a PGE is re-run with an identical key, the cached outputs
+may be restored in place of re-running the SAS.
+
+"""
+
+import hashlib
+import importlib.metadata
+import importlib.util
+import json
+import os
+import shutil
+import time
+from os.path import exists, getsize, isdir, isfile, join, relpath
+
+HASH_CHUNK_SIZE = 1024 * 1024
+"""Number of bytes read at a time when hashing the contents of a file"""
+
+DEFAULT_MAX_CACHE_SIZE_BYTES = 10 * 1024 ** 3
+"""Default size budget of a result cache, in bytes"""
+
+MANIFEST_FILENAME = 'manifest.json'
+"""Name of the file within each cache entry listing the cached output files"""
+
+
+def _hash_file(digest, filename):
+    """Updates the provided hash object with the contents of a file."""
+    with open(filename, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+
+
+def _walk_files(path):
+    """
+    Returns the sorted list of files at or below the provided path, relative
+    to that path. A path to a single file yields a list containing only that
+    file's basename.
+    """
+    if isfile(path):
+        return [os.path.basename(path)]
+
+    filenames = []
+
+    for dirpath, _, files in os.walk(path):
+        filenames.extend(relpath(join(dirpath, filename), path) for filename in files)
+
+    return sorted(filenames)
+
+
+def _hash_program_file(digest, program_path):
+    """
+    Updates the provided hash object with the contents of the file backing a
+    SAS program which is an executable (on the PATH or otherwise). Returns
+    False if the program does not resolve to an executable file.
+    """
+    executable = shutil.which(program_path)
+
+    if not executable:
+        return False
+
+    _hash_file(digest, executable)
+
+    return True
+
+
+def _hash_program_package(digest, program_path):
+    """
+    Updates the provided hash object with the identity of the Python package
+    containing a SAS program which is a Python module, so that a change to any
+    module of the package, and not only its entry point, results in a
+    different key.
+
+    For a package installed from a distribution, the name and version of the
+    distribution are used, along with its RECORD, which lists the hash of
+    every installed file. Otherwise, such as for a package run from a source
+    checkout, the contents of every file of the package are used, excluding
+    compiled bytecode.
+    """
+    top_level_name = program_path.split('.')[0]
+
+    try:
+        spec = importlib.util.find_spec(top_level_name)
+    except (ImportError, ValueError):
+        spec = None
+
+    if not spec:
+        return
+
+    distribution_names = importlib.metadata.packages_distributions().get(top_level_name, [])
+
+    for distribution_name in sorted(set(distribution_names)):
+        distribution = importlib.metadata.distribution(distribution_name)
+        record = distribution.read_text('RECORD') or ''
+
+        digest.update(f'sas_distribution:{distribution_name}:{distribution.version}\n'.encode('utf-8'))
+        digest.update(record.encode('utf-8'))
+
+    if distribution_names:
+        return
+
+    if spec.submodule_search_locations:
+        for location in sorted(spec.submodule_search_locations):
+            for filename in _walk_files(location):
+                if '__pycache__' in filename.split(os.sep) or filename.endswith('.pyc'):
+                    continue
+
+                digest.update(f'sas_package_file:{filename}\n'.encode('utf-8'))
+                _hash_file(digest, join(location, filename))
+    elif spec.origin and isfile(spec.origin):
+        _hash_file(digest, spec.origin)
+
+
+def snapshot_directory(path):
+    """
+    Records the size and modification time of every file below a directory,
+    for use with changed_files() to determine the files written by a SAS.
+
+    Parameters
+    ----------
+    path : str
+        Path to the directory to snapshot.
+
+    Returns
+    -------
+    snapshot : dict
+        Mapping of each file path, relative to the directory, to its size and
+        modification time. An empty dictionary is returned for a directory
+        that does not exist.
+
+    """
+    snapshot = {}
+
+    if isdir(path):
+        for filename in _walk_files(path):
+            stat = os.stat(join(path, filename))
+            snapshot[filename] = (stat.st_size, stat.st_mtime_ns)
+
+    return snapshot
+
+
+def changed_files(path, snapshot):
+    """
+    Determines the files below a directory which have been created or
+    modified since the provided snapshot was taken.
+
+    Parameters
+    ----------
+    path : str
+        Path to the directory that was snapshot.
+    snapshot : dict
+        The snapshot returned by snapshot_directory() for the same directory.
+
+    Returns
+    -------
+    filenames : list of str
+        Paths, relative to the directory, of the new or modified files.
+
+    """
+    current = snapshot_directory(path)
+
+    return [filename for filename, stat in current.items() if snapshot.get(filename) != stat]
+
+
+class SasResultCache:
+    """
+    Local, content-addressed cache of SAS output files, with least-recently
+    used eviction under a size budget.
+
+    Entries are stored as individual directories named by their key beneath
+    the cache directory. Entries are written to a temporary location and
+    renamed into place once complete, so that concurrent PGE jobs sharing a
+    cache never observe a partially written entry.
+
+    """
+
+    def __init__(self, cache_dir, max_size_bytes=DEFAULT_MAX_CACHE_SIZE_BYTES):
+        """
+        Creates a new instance of SasResultCache
+
+        Parameters
+        ----------
+        cache_dir : str
+            Path to the directory to store cache entries in. The directory is
+            created if it does not already exist.
+        max_size_bytes : int, optional
+            Maximum combined size of all cache entries, in bytes. The least
+            recently used entries are evicted once this budget is exceeded.
+
+        """
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_size_bytes = max_size_bytes
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def compute_key(input_paths, sas_runconfig_path, sas_program_path, sas_program_options=None):
+        """
+        Computes the cache key for a SAS execution.
+
+        Parameters
+        ----------
+        input_paths : list of str
+            Paths to the input files and/or directories of the SAS. The
+            contents of every file, along with its path relative to the
+            provided input path, contribute to the key. Any input paths which
+            do not exist contribute only their path.
+        sas_runconfig_path : str
+            Path to the isolated SAS RunConfig provided to the SAS.
+        sas_program_path : str
+            Path or name of the SAS program. If this resolves to an executable
+            file, the contents of that file also contribute to the key.
+            Otherwise, if it names a Python module, the identity of the
+            package containing the module contributes to the key: the version
+            and RECORD of its installed distribution, or the contents of the
+            package files when it is not installed from one. Either way, a
+            change in SAS version results in a different key.
+        sas_program_options : list of str, optional
+            Any options provided to the SAS program.
+
+        Returns
+        -------
+        key : str
+            Hexadecimal digest identifying the SAS execution.
+
+        """
+        digest = hashlib.sha256()
+
+        for input_path in sorted(input_paths):
+            if not exists(input_path):
+                digest.update(f'missing_input:{input_path}\n'.encode('utf-8'))
+                continue
+
+            for filename in _walk_files(input_path):
+                full_path = input_path if isfile(input_path) else join(input_path, filename)
+
+                digest.update(f'input:{filename}:{getsize(full_path)}\n'.encode('utf-8'))
+                _hash_file(digest, full_path)
+
+        digest.update(b'sas_runconfig\n')
+        _hash_file(digest, sas_runconfig_path)
+
+        digest.update(f'sas_program:{sas_program_path}:{sas_program_options or []}\n'.encode('utf-8'))
+
+        if not _hash_program_file(digest, sas_program_path):
+            _hash_program_package(digest, sas_program_path)
+
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        """Returns the path to the cache entry for the provided key."""
+        return join(self.cache_dir, key)
+
+    def contains(self, key):
+        """Returns True if the cache holds a complete entry for the provided key."""
+        return exists(join(self._entry_path(key), MANIFEST_FILENAME))
+
+    def restore(self, key, output_dir):
+        """
+        Restores the output files of a cache entry into the provided directory,
+        and marks the entry as most recently used.
+
+        Parameters
+        ----------
+        key : str
+            Key of the cache entry to restore.
+        output_dir : str
+            Directory to restore the cached output files into.
+
+        Returns
+        -------
+        filenames : list of str or None
+            Paths, relative to the output directory, of the restored files,
+            or None if the cache holds no entry for the key.
+
+        """
+        entry_path = self._entry_path(key)
+
+        try:
+            with open(join(entry_path, MANIFEST_FILENAME), 'r', encoding='utf-8') as infile:
+                manifest = json.load(infile)
+        except FileNotFoundError:
+            return None
+
+        for filename in manifest['files']:
+            destination = join(output_dir, filename)
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            shutil.copy2(join(entry_path, 'files', filename), destination)
+
+        now = time.time()
+        os.utime(entry_path, (now, now))
+
+        return manifest['files']
+
+    def store(self, key, output_dir, filenames):
+        """
+        Stores the provided output files as the cache entry for a key, then
+        evicts the least recently used entries as needed to remain within the
+        size budget of the cache.
+
+        Files whose combined size alone exceeds the size budget are not
+        stored, as the entry would be evicted as soon as it was written.
+
+        Parameters
+        ----------
+        key : str
+            Key of the cache entry to create.
+        output_dir : str
+            Directory containing the output files to cache.
+        filenames : list of str
+            Paths, relative to the output directory, of the files to cache.
+
+        Returns
+        -------
+        size_bytes : int or None
+            The combined size of the cached files, in bytes, or None if the
+            files were not stored as they exceed the size budget.
+
+        """
+        if sum(getsize(join(output_dir, filename)) for filename in filenames) > self.max_size_bytes:
+            return None
+
+        entry_path = self._entry_path(key)
+        staging_path = f'{entry_path}.{os.getpid()}.tmp'
+
+        shutil.rmtree(staging_path, ignore_errors=True)
+
+        size_bytes = 0
+
+        try:
+            for filename in filenames:
+                destination = join(staging_path, 'files', filename)
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                shutil.copy2(join(output_dir, filename), destination)
+                size_bytes += getsize(destination)
+
+            os.makedirs(staging_path, exist_ok=True)
+
+            with open(join(staging_path, MANIFEST_FILENAME), 'w', encoding='utf-8') as outfile:
+                json.dump({'key': key, 'files': sorted(filenames), 'size_bytes': size_bytes}, outfile)
+
+            try:
+                os.rename(staging_path, entry_path)
+            except OSError:
+                # Another job has already stored an entry for the same key
+                if not self.contains(key):
+                    raise
+        finally:
+            shutil.rmtree(staging_path, ignore_errors=True)
+
+        self.evict()
+
+        return size_bytes
+
+    def evict(self):
+        """
+        Removes the least recently used cache entries until the combined size
+        of the remaining entries is within the size budget of the cache.
+
+        Returns
+        -------
+        evicted_keys : list of str
+            Keys of the removed entries.
+
+        """
+        entries = []
+
+        for key in os.listdir(self.cache_dir):
+            # Skip entries still being staged by this or a concurrent job
+            if key.endswith('.tmp'):
+                continue
+
+            entry_path = self._entry_path(key)
+
+            try:
+                with open(join(entry_path, MANIFEST_FILENAME), 'r', encoding='utf-8') as infile:
+                    size_bytes = json.load(infile)['size_bytes']
+
+                entries.append((os.stat(entry_path).st_mtime, key, size_bytes))
+            except (OSError, ValueError, KeyError):
+                # Entry was removed by a concurrent job
+                continue
+
+        total_size = sum(size_bytes for _, _, size_bytes in entries)
+        evicted_keys = []
+
+        for _, key, size_bytes in sorted(entries):
+            if total_size <= self.max_size_bytes:
+                break
+
+            shutil.rmtree(self._entry_path(key), ignore_errors=True)
+            total_size -= size_bytes
+            evicted_keys.append(key)
+
+        return evicted_keys
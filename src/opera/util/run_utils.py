@@ -23,16 +23,36 @@ subsystem.
 
 """
 
+import asyncio
+import codecs
 import os
 import shutil
+import signal
 import subprocess
+import threading
 import time
-from io import StringIO
-import sys
 
-from os.path import abspath
+from os.path import abspath, splitext
 
 from .error_codes import ErrorCode
+from .usage_metrics import ProcessTreeSampler
+from .warm_worker import PYTHON_MODULE_COMMAND
+from .warm_worker import WAIT_POLL_INTERVAL
+from .warm_worker import ForkedModuleProcess
+from .warm_worker import can_fork_safely
+
+OUTPUT_CHUNK_SIZE = 64 * 1024
+"""Maximum number of bytes read from the SAS output pipe at a time"""
+
+DEFAULT_TERMINATION_GRACE_PERIOD = 30.0
+"""Default time, in seconds, between SIGTERM and SIGKILL when terminating a SAS"""
+
+OUTPUT_DRAIN_TIMEOUT = 10.0
+"""Time, in seconds, allowed for the remaining output of an exited SAS to be read before it is abandoned"""
+
+THREAD_COUNT_ENV_VARS = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                         'NUMEXPR_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS', 'GDAL_NUM_THREADS']
+"""Environment variables used by common threading runtimes to size their thread pools"""
 
 
 def create_sas_command_line(sas_program_path, sas_runconfig_path,
@@ -77,13 +97,12 @@ def create_sas_command_line(sas_program_path, sas_runconfig_path,
         executable_path = abspath(sas_program_path)
 
         # Check if the executable exists, but does not have execute permissions on it
-        if (os.access(executable_path, mode=os.F_OK)
-                and not os.access(executable_path, mode=os.X_OK)):
+        if os.access(executable_path, mode=os.F_OK) and not os.access(executable_path, mode=os.X_OK):
             raise OSError(f"Requested SAS program path {sas_program_path} exists, "
                           f"but does not have execute permissions.")
         # Otherwise, sas_program_path might be a python module path
         else:
-            command_line = ['python3', '-m', sas_program_path]
+            command_line = PYTHON_MODULE_COMMAND + [sas_program_path]
 
     # Add any provided arguments
     if sas_program_options:
@@ -95,11 +114,334 @@ def create_sas_command_line(sas_program_path, sas_runconfig_path,
     return command_line
 
 
-def time_and_execute(command_line, logger, execute_via_shell=False):
+def create_sas_environment(num_threads=None):
+    """
+    Creates the set of environment variables to execute a SAS with.
+
+    Parameters
+    ----------
+    num_threads : int, optional
+        If provided, the number of threads the SAS should use. This value is
+        assigned to each of the variables in THREAD_COUNT_ENV_VARS, which are
+        respected by OpenMP, OpenBLAS, MKL, numexpr and GDAL. Otherwise,
+        the thread counts are left as defined by the current environment.
+
+    Returns
+    -------
+    env : dict
+        Copy of the current environment, updated with the requested settings.
+
+    """
+    env = os.environ.copy()
+
+    if num_threads:
+        for env_var in THREAD_COUNT_ENV_VARS:
+            env[env_var] = str(num_threads)
+
+    return env
+
+
+def stream_output_to_logger(pipe, logger, chunk_size=OUTPUT_CHUNK_SIZE, abandoned=None):
+    """
+    Incrementally copies the contents of a binary output pipe into the
+    provided logger.
+
+    The pipe is read in bounded chunks, each of which is decoded and appended
+    to the log before the next chunk is read, so the amount of memory used
+    does not depend on the total amount of output produced by the process
+    writing to the pipe. Multibyte characters split across chunk boundaries
+    are handled by an incremental decoder.
+
+    Parameters
+    ----------
+    pipe : io.RawIOBase or io.BufferedIOBase
+        The binary stream to read from, typically the stdout of a subprocess.
+    logger : PgeLogger
+        The logger to append the decoded output to.
+    chunk_size : int, optional
+        Maximum number of bytes to read from the pipe at a time.
+    abandoned : threading.Event, optional
+        If provided, an event set by another thread once it has given up on
+        waiting for the remainder of the output. Any output read after the
+        event is set is discarded.
+
+    Returns
+    -------
+    num_bytes : int
+        The total number of bytes read from the pipe.
+
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    num_bytes = 0
+
+    while True:
+        try:
+            chunk = pipe.read(chunk_size)
+        except (OSError, ValueError):
+            if abandoned is not None and abandoned.is_set():
+                return num_bytes
+
+            raise
+
+        if abandoned is not None and abandoned.is_set():
+            return num_bytes
+
+        if not chunk:
+            break
+
+        num_bytes += len(chunk)
+
+        text = decoder.decode(chunk)
+
+        if text:
+            logger.append_text(text)
+
+    # Flush out anything still held by the decoder, such as a truncated
+    # multibyte sequence at the very end of the output
+    text = decoder.decode(b'', final=True)
+
+    if text:
+        logger.append_text(text)
+
+    logger.metrics.counter('sas.output_bytes').increment(num_bytes)
+
+    return num_bytes
+
+
+def log_resource_samples(sampler, logger):
+    """
+    Logs the summary metrics collected by a ProcessTreeSampler, and writes
+    the full series of samples to a CSV file alongside the log file.
+
+    Parameters
+    ----------
+    sampler : ProcessTreeSampler
+        The sampler to log the results of.
+    logger : PgeLogger
+        The logger to write the summary metrics to.
+
+    """
+    module_name = f'log_resource_samples::{os.path.basename(__file__)}'
+
+    for metric_name, value in sampler.get_summary_metrics().items():
+        logger.log_one_metric(module_name, metric_name, value)
+
+    series_filename = f'{splitext(logger.get_file_name())[0]}_sas_resources.csv'
+
+    try:
+        sampler.write_series(series_filename)
+        logger.info(module_name, ErrorCode.RESOURCE_SAMPLES_WRITTEN,
+                    f'SAS resource usage samples written to {series_filename}')
+    except OSError as err:
+        logger.warning(module_name, ErrorCode.RESOURCE_SAMPLES_NOT_WRITTEN,
+                       f'Failed to write SAS resource usage samples to '
+                       f'{series_filename}, reason: {str(err)}')
+
+
+def terminate_process_group(process, grace_period=DEFAULT_TERMINATION_GRACE_PERIOD):
+    """
+    Terminates all processes within the process group led by the provided
+    process.
+
+    SIGTERM is sent to the process group first, giving its members a chance to
+    clean up. If the group leader has not exited once the grace period
+    elapses, SIGKILL is sent instead. SIGKILL is always sent to the group once
+    the leader has exited, to reap any descendants which ignored SIGTERM.
+
+    Parameters
+    ----------
+    process : subprocess.Popen or ForkedModuleProcess
+        The process to terminate. Must have been started as the leader of its
+        own process group (via start_new_session=True).
+    grace_period : float, optional
+        Time, in seconds, to wait after sending SIGTERM before sending SIGKILL.
+
+    Returns
+    -------
+    returncode : int
+        The return code of the terminated process.
+
+    """
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+
+    try:
+        process.wait(timeout=grace_period)
+    except subprocess.TimeoutExpired:
+        pass
+
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+    return process.wait()
+
+
+def _warn_output_abandoned(logger, module_name):
+    """
+    Logs that the output of a SAS was abandoned before reaching end-of-file.
+
+    Parameters
+    ----------
+    logger : PgeLogger
+        The logger to write the warning to.
+    module_name : str
+        Name of the module to attribute the warning to.
+
+    """
+    logger.warning(module_name, ErrorCode.SAS_OUTPUT_INCOMPLETE,
+                   f'Output of the SAS did not reach end-of-file within {OUTPUT_DRAIN_TIMEOUT} '
+                   f'second(s) of the SAS exiting, likely because a descendant which left its '
+                   f'process group still holds the output pipe open. Some output may have been lost.')
+
+
+def _apply_cpu_affinity(process, cpu_affinity):
+    """
+    Restricts a newly spawned process to the provided set of CPUs.
+
+    The affinity is applied from the parent immediately after the process is
+    spawned, rather than within the child prior to exec (via preexec_fn),
+    which is unsafe while the parent has other threads running. Threads and
+    processes subsequently started by the child inherit the affinity, which is
+    applied before the child could plausibly have started any of its own.
+
+    Parameters
+    ----------
+    process : subprocess.Popen or asyncio.subprocess.Process
+        The process to restrict. If the affinity cannot be applied, the
+        process is killed before the error is raised.
+    cpu_affinity : Iterable[int] or None
+        The set of CPUs to restrict the process to. Nothing is done if not
+        provided.
+
+    Raises
+    ------
+    OSError
+        If the affinity could not be applied to the process.
+
+    """
+    if not cpu_affinity:
+        return
+
+    try:
+        os.sched_setaffinity(process.pid, cpu_affinity)
+    except ProcessLookupError:
+        # The process has already exited, so there is nothing to restrict
+        pass
+    except OSError:
+        process.kill()
+        raise
+
+
+def _trace_execution(trace, command_str, pid, start_time, returncode,
+                     sampler=None, timed_out=False):
+    """
+    Records the lifetime of an executed command line as a span of the
+    provided trace, along with any resource usage samples as counter tracks.
+
+    Parameters
+    ----------
+    trace : TraceRecorder
+        The trace to record to.
+    command_str : str
+        The executed command line, as a single string.
+    pid : int
+        The ID of the process which executed the command line.
+    start_time : float
+        Monotonic time at which execution started.
+    returncode : int
+        The exit code of the executed command.
+    sampler : ProcessTreeSampler, optional
+        Sampler used to collect resource usage during execution, if any.
+    timed_out : bool, optional
+        Whether the command was terminated due to exceeding its timeout.
+
+    """
+    trace.add_complete_event(
+        'sas_subprocess', start_time, time.monotonic(), category='sas',
+        args={'command': command_str, 'pid': pid, 'returncode': returncode,
+              'timed_out': timed_out}
+    )
+
+    if sampler:
+        trace.add_resource_samples(sampler)
+
+
+def _report_execution_result(logger, module_name, command_str, returncode,
+                             start_time, sampler=None, timed_out=False,
+                             timeout=None):
+    """
+    Logs the outcome of executing a command line, raising a critical error
+    if the command timed out or returned a non-zero exit code.
+
+    Parameters
+    ----------
+    logger : PgeLogger
+        The logger to report the outcome to.
+    module_name : str
+        Name of the module to attribute logged messages to.
+    command_str : str
+        The executed command line, as a single string.
+    returncode : int
+        The exit code of the executed command.
+    start_time : float
+        Monotonic time at which execution started.
+    sampler : ProcessTreeSampler, optional
+        Sampler used to collect resource usage during execution, if any.
+    timed_out : bool, optional
+        Whether the command was terminated due to exceeding its timeout.
+    timeout : float, optional
+        The timeout applied to the command.
+
+    Raises
+    ------
+    RuntimeError
+        If the command timed out or returned a non-zero exit code.
+
+    """
+    if sampler:
+        log_resource_samples(sampler, logger)
+
+    if timed_out:
+        logger.log_one_metric(module_name, 'sas.elapsed_seconds',
+                              time.monotonic() - start_time)
+
+        error_msg = (f'Command "{command_str}" exceeded timeout of {timeout} '
+                     f'second(s) and was terminated (exit code {returncode})')
+
+        logger.critical(module_name, ErrorCode.SAS_PROGRAM_TIMED_OUT, error_msg)
+
+    if returncode:
+        error_msg = (f'Command "{command_str}" failed with exit '
+                     f'code {returncode}')
+
+        logger.critical(module_name, ErrorCode.SAS_PROGRAM_FAILED, error_msg)
+
+
+def _stream_output_and_close(pipe, logger, abandoned):
+    """
+    Reader thread of time_and_execute(), which streams the output pipe into
+    the logger until the end of the output, then closes the pipe.
+    """
+    with pipe:
+        stream_output_to_logger(pipe, logger, OUTPUT_CHUNK_SIZE, abandoned)
+
+
+def time_and_execute(command_line, logger, execute_via_shell=False,
+                     sample_interval=None, timeout=None,
+                     grace_period=DEFAULT_TERMINATION_GRACE_PERIOD,
+                     warm_worker=False, env=None, cpu_affinity=None, trace=None):
     """
     Executes the provided command line via subprocess while collecting the
     runtime of the execution.
 
+    Any output written to stdout/stderr by the subprocess is streamed into the
+    provided logger as it is produced, rather than being buffered in memory
+    until the subprocess completes.
+
     Parameters
     ----------
     command_line : Iterable[str]
@@ -111,6 +453,47 @@ def time_and_execute(command_line, logger, execute_via_shell=False):
         If true, instruct subprocess.run to execute the command-line via system
         shell. Useful for running test commands but should generally not be used
         for production.
+    sample_interval : float, optional
+        If provided and greater than zero, the resource usage of the process
+        tree spawned by the command line is sampled at this interval (in
+        seconds) for the duration of execution. A summary of the samples
+        (see ProcessTreeSampler.get_summary_metrics()) is logged once
+        execution completes, and the full series of samples is written to a
+        CSV file alongside the log file.
+    timeout : float, optional
+        If provided and greater than zero, the maximum wall-clock time, in
+        seconds, the command line is allowed to run for. Once exceeded, the
+        entire process group of the command is terminated (see
+        terminate_process_group()), any metrics collected so far are logged,
+        and a critical error is raised. Once the command has exited, its
+        remaining output is read for at most OUTPUT_DRAIN_TIMEOUT seconds,
+        after which the output is abandoned and a warning logged, so that a
+        descendant which escaped the process group cannot block completion.
+        The output pipe is then left to the reading thread, which closes it
+        once the descendant closes its end.
+    grace_period : float, optional
+        Time, in seconds, allowed between SIGTERM and SIGKILL when terminating
+        a command which has exceeded its timeout.
+    warm_worker : bool, optional
+        If true, and the command line invokes a Python module (as returned by
+        create_sas_command_line() when no executable is found), the module is
+        run within a child process forked from the current process, rather
+        than a freshly started interpreter. This avoids repeated start-up and
+        import costs when the current process is a long-lived host which has
+        already imported the module and its dependencies (see
+        warm_worker.preload_sas_modules()). Ignored when execute_via_shell is true, and
+        when other threads are running within the current process (see
+        can_fork_safely()), in which case the module is run via subprocess.
+    env : dict, optional
+        Environment variables to execute the command line with. Defaults to
+        a copy of the current environment (see create_sas_environment()).
+    cpu_affinity : Iterable[int], optional
+        If provided, the set of CPUs to restrict the command line (and any
+        processes it spawns) to.
+    trace : TraceRecorder, optional
+        If provided, the lifetime of the process executing the command line
+        is recorded as a span of the trace, along with any resource usage
+        samples as counter tracks.
 
     Returns
     -------
@@ -126,20 +509,328 @@ def time_and_execute(command_line, logger, execute_via_shell=False):
     # string. Otherwise only the first token (the executable) would be invoked.
     if execute_via_shell:
         command_line = " ".join(command_line)
+        command_str = command_line
+    else:
+        command_str = " ".join(command_line)
 
-    # TODO: support for timeout argument?
-    run_result = subprocess.run(command_line, env=os.environ.copy(), check=False,
-                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                                shell=execute_via_shell)
+    if env is None:
+        env = create_sas_environment()
 
-    # Append the stdout/stderr captured by the subprocess to our log
-    logger.append(run_result.stdout.decode())
+    is_python_module = command_line[:len(PYTHON_MODULE_COMMAND)] == PYTHON_MODULE_COMMAND
 
-    if run_result.returncode:
-        error_msg = (f'Command "{" ".join(command_line)}" failed with exit '
-                     f'code {run_result.returncode}')
+    if warm_worker and not execute_via_shell and is_python_module and not can_fork_safely():
+        logger.debug(module_name, ErrorCode.PROCESSING_DETAILS,
+                     f'{threading.active_count()} threads are running, SAS will be '
+                     f'run via subprocess rather than forked as a warm worker')
+        warm_worker = False
 
-        logger.critical(module_name, ErrorCode.SAS_PROGRAM_FAILED, error_msg)
+    # When a timeout is requested, the command is started as the leader of a
+    # new process group, so it can be terminated along with all of its
+    # descendants
+    if warm_worker and not execute_via_shell and is_python_module:
+        sas_module_name, *sas_module_args = command_line[len(PYTHON_MODULE_COMMAND):]
+
+        process = ForkedModuleProcess(sas_module_name, sas_module_args, env=env,
+                                      start_new_session=bool(timeout),
+                                      cpu_affinity=cpu_affinity)
+    else:
+        process = subprocess.Popen(command_line, env=env, bufsize=0,
+                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   shell=execute_via_shell,
+                                   start_new_session=bool(timeout))
+
+        try:
+            _apply_cpu_affinity(process, cpu_affinity)
+        except OSError:
+            process.stdout.close()
+            process.wait()
+            raise
+
+    timed_out = False
+
+    with process:
+        sampler = None
+
+        if sample_interval:
+            sampler = ProcessTreeSampler(process.pid, sample_interval)
+            sampler.start()
+
+        # Append the stdout/stderr captured from the subprocess to our log
+        # as it is produced
+        if timeout:
+            # Reading must occur in a separate thread so the timeout can be
+            # enforced while the output pipe remains open
+            abandoned = threading.Event()
+
+            # The pipe is owned by the reader thread, rather than closed
+            # along with the process, since the thread may still be reading
+            # from it after the output is abandoned. Closing the pipe under a
+            # live reader would free its descriptor for reuse by an unrelated
+            # file, which the reader would then read from instead.
+            pipe, process.stdout = process.stdout, None
+
+            reader = threading.Thread(
+                target=_stream_output_and_close,
+                args=(pipe, logger, abandoned),
+                name=f'time_and_execute-{process.pid}', daemon=True
+            )
+            reader.start()
+
+            try:
+                returncode = process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                timed_out = True
+                returncode = terminate_process_group(process, grace_period)
+
+            reader.join(timeout=OUTPUT_DRAIN_TIMEOUT)
+
+            if reader.is_alive():
+                abandoned.set()
+                _warn_output_abandoned(logger, module_name)
+        else:
+            stream_output_to_logger(process.stdout, logger)
+
+            returncode = process.wait()
+
+        if sampler:
+            sampler.stop()
+
+    if trace:
+        _trace_execution(trace, command_str, process.pid, start_time, returncode,
+                         sampler, timed_out)
+
+    _report_execution_result(logger, module_name, command_str, returncode,
+                             start_time, sampler, timed_out, timeout)
+
+    stop_time = time.monotonic()
+
+    elapsed_time = stop_time - start_time
+
+    return elapsed_time
+
+
+async def stream_output_to_logger_async(reader, logger, chunk_size=OUTPUT_CHUNK_SIZE):
+    """
+    Coroutine version of stream_output_to_logger(), which incrementally copies
+    the contents of an asyncio stream into the provided logger.
+
+    Parameters
+    ----------
+    reader : asyncio.StreamReader
+        The stream to read from, typically the stdout of an asyncio subprocess.
+    logger : PgeLogger
+        The logger to append the decoded output to.
+    chunk_size : int, optional
+        Maximum number of bytes to read from the stream at a time.
+
+    Returns
+    -------
+    num_bytes : int
+        The total number of bytes read from the stream.
+
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    num_bytes = 0
+
+    while True:
+        chunk = await reader.read(chunk_size)
+
+        if not chunk:
+            break
+
+        num_bytes += len(chunk)
+
+        text = decoder.decode(chunk)
+
+        if text:
+            logger.append_text(text)
+
+    text = decoder.decode(b'', final=True)
+
+    if text:
+        logger.append_text(text)
+
+    logger.metrics.counter('sas.output_bytes').increment(num_bytes)
+
+    return num_bytes
+
+
+async def terminate_process_group_async(process, grace_period=DEFAULT_TERMINATION_GRACE_PERIOD):
+    """
+    Coroutine version of terminate_process_group().
+
+    Parameters
+    ----------
+    process : asyncio.subprocess.Process
+        The process to terminate. Must have been started as the leader of its
+        own process group (via start_new_session=True).
+    grace_period : float, optional
+        Time, in seconds, to wait after sending SIGTERM before sending SIGKILL.
+
+    Returns
+    -------
+    returncode : int
+        The return code of the terminated process.
+
+    """
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+
+    await _wait_for_exit_async(process, grace_period)
+
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+    return await _wait_for_exit_async(process)
+
+
+async def _wait_for_exit_async(process, timeout=None):
+    """
+    Waits for an asyncio subprocess to exit.
+
+    Unlike Process.wait(), which does not complete until the output pipes of
+    the process have been closed as well, this returns as soon as the process
+    itself has exited, even if a descendant still holds its output pipe open.
+
+    Parameters
+    ----------
+    process : asyncio.subprocess.Process
+        The process to wait for.
+    timeout : float, optional
+        Maximum time, in seconds, to wait for.
+
+    Returns
+    -------
+    returncode : int or None
+        The return code of the process, or None if it has not exited once the
+        timeout elapses.
+
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    while process.returncode is None:
+        if deadline is not None and time.monotonic() >= deadline:
+            return None
+
+        await asyncio.sleep(WAIT_POLL_INTERVAL)
+
+    return process.returncode
+
+
+async def time_and_execute_async(command_line, logger, execute_via_shell=False,
+                                 sample_interval=None, timeout=None,
+                                 grace_period=DEFAULT_TERMINATION_GRACE_PERIOD,
+                                 env=None, cpu_affinity=None, trace=None):
+    """
+    Coroutine version of time_and_execute(), which executes the provided
+    command line via an asyncio subprocess.
+
+    Output of the subprocess is read, and the timeout enforced, from the
+    running event loop, so no threads are dedicated to the execution (aside
+    from the resource sampler, when requested). This allows a single event
+    loop to drive many concurrent executions. Warm-worker mode is not
+    supported by this function.
+
+    Parameters
+    ----------
+    command_line : Iterable[str]
+        The command line program, including options/arguments, to execute.
+    logger : PgeLogger
+        A logger object used to capture any error status returned from execution.
+    execute_via_shell : bool, optional
+        If true, execute the command-line via system shell.
+    sample_interval : float, optional
+        Interval, in seconds, at which to sample the resource usage of the
+        process tree spawned by the command line. See time_and_execute().
+    timeout : float, optional
+        Maximum wall-clock time, in seconds, the command line is allowed to
+        run for. See time_and_execute().
+    grace_period : float, optional
+        Time, in seconds, allowed between SIGTERM and SIGKILL when terminating
+        a command which has exceeded its timeout.
+    env : dict, optional
+        Environment variables to execute the command line with. Defaults to
+        a copy of the current environment.
+    cpu_affinity : Iterable[int], optional
+        If provided, the set of CPUs to restrict the command line to.
+    trace : TraceRecorder, optional
+        Trace to record the execution to. See time_and_execute().
+
+    Returns
+    -------
+    elapsed_time : float
+        The time elapsed during execution, in seconds.
+
+    """
+    module_name = f'time_and_execute_async::{os.path.basename(__file__)}'
+
+    start_time = time.monotonic()
+
+    if env is None:
+        env = create_sas_environment()
+
+    subprocess_kwargs = {
+        'stdout': asyncio.subprocess.PIPE,
+        'stderr': asyncio.subprocess.STDOUT,
+        'env': env,
+        'start_new_session': bool(timeout)
+    }
+
+    command_str = " ".join(command_line)
+
+    if execute_via_shell:
+        process = await asyncio.create_subprocess_shell(command_str, **subprocess_kwargs)
+    else:
+        process = await asyncio.create_subprocess_exec(*command_line, **subprocess_kwargs)
+
+    try:
+        _apply_cpu_affinity(process, cpu_affinity)
+    except OSError:
+        await process.wait()
+        raise
+
+    sampler = None
+
+    if sample_interval:
+        sampler = ProcessTreeSampler(process.pid, sample_interval)
+        sampler.start()
+
+    reader = asyncio.ensure_future(stream_output_to_logger_async(process.stdout, logger))
+
+    timed_out = False
+
+    if timeout:
+        returncode = await _wait_for_exit_async(process, timeout)
+
+        if returncode is None:
+            timed_out = True
+            returncode = await terminate_process_group_async(process, grace_period)
+
+        try:
+            await asyncio.wait_for(reader, OUTPUT_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            # The reader has been cancelled, so the pipe may be closed
+            # without anything further being appended to the log
+            process._transport.get_pipe_transport(1).close()  # pylint: disable=protected-access
+            _warn_output_abandoned(logger, module_name)
+    else:
+        returncode = await process.wait()
+
+        await reader
+
+    if sampler:
+        sampler.stop()
+
+    if trace:
+        _trace_execution(trace, command_str, process.pid, start_time, returncode,
+                         sampler, timed_out)
+
+    _report_execution_result(logger, module_name, command_str, returncode,
+                             start_time, sampler, timed_out, timeout)
 
     stop_time = time.monotonic()
 
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021, by the California Institute of Technology.
+# ALL RIGHTS RESERVED.
+# United States Government sponsorship acknowledged.
+# Any commercial use must be negotiated with the Office of Technology Transfer
+# at the California Institute of Technology.
+# This software may be subject to U.S. export control laws and regulations.
+# By accepting this document, the user agrees to comply with all applicable
+# U.S. export laws and regulations. User has the responsibility to obtain
+# export licenses, or other export authority as may be required, before
+# exporting such information to foreign countries or providing access to
+# foreign persons.
+#
+
+"""
+===============
+schema_cache.py
+===============
+
+Caching of the compiled Yamale schemas, and the validators generated from
+them, used to validate RunConfigs.
+
+Compiling a schema parses its YAML file(s) and builds a tree of validator
+objects, which is comparatively expensive, yet the schemas themselves rarely
+change. Compiled schemas are therefore cached at two levels:
+
+    1. In memory, for the lifetime of the process, keyed by the path,
+       modification time and size of each schema file.
+    2. Optionally, on disk, as pickled schemas keyed by a hash of the contents
+       of each schema file, so separate processes (such as the workers of a
+       batch, or successive runs on the same node) each avoid compilation.
+
+Validators generated from compiled schemas (see opera.util.schema_compiler)
+are cached in the same way, with the on-disk cache holding the source of each
+generated validator module.
+
+The on-disk cache is enabled by setting the OPERA_SCHEMA_CACHE_DIR environment
+variable to the directory to hold it.
+
+Loading an entry of the on-disk cache unpickles, or executes, its contents, so
+the cache directory must be writable only by the user running the PGE. Entries
+are ignored unless both the directory and the entry are owned by the current
+user and are neither group nor world writable, and the directory is created
+accessible only by the current user.
+
+"""
+
+import hashlib
+import os
+import pickle
+import stat
+import sys
+import tempfile
+import threading
+from os.path import abspath, join
+
+import yamale
+
+from .schema_compiler import GENERATED_VALIDATOR_VERSION
+from .schema_compiler import generate_validator_source
+from .schema_compiler import load_validator
+
+SCHEMA_CACHE_DIR_ENV = 'OPERA_SCHEMA_CACHE_DIR'
+"""Environment variable defining the directory of the on-disk schema cache, if any"""
+
+SCHEMA_CACHE_EXTENSION = '.schema.pickle'
+"""File extension of the compiled schemas within the on-disk schema cache"""
+
+VALIDATOR_CACHE_EXTENSION = f'.validator_v{GENERATED_VALIDATOR_VERSION}.py'
+"""File extension of the generated validator modules within the on-disk schema cache"""
+
+_schema_cache = {}
+"""Process-wide cache of compiled schemas, keyed by the identity of their schema files"""
+
+_validator_cache = {}
+"""Process-wide cache of generated validators, keyed by the identity of their schema files"""
+
+_schema_cache_lock = threading.Lock()
+
+
+def _schema_file_key(path):
+    """Returns the in-memory cache key of a schema file: its path, modification time and size."""
+    path_stat = os.stat(path)
+
+    return abspath(path), path_stat.st_mtime_ns, path_stat.st_size
+
+
+def _schema_content_digest(pge_schema_file, sas_schema_file):
+    """
+    Returns the on-disk cache key of a combination of schema files: a hash of
+    their contents, along with the versions of Python and Yamale, which
+    determine the layout of a pickled schema.
+    """
+    digest = hashlib.sha256(f'{sys.version}:{yamale.__version__}\n'.encode('utf-8'))
+
+    for schema_file in (pge_schema_file, sas_schema_file):
+        if schema_file:
+            with open(schema_file, 'rb') as infile:
+                digest.update(infile.read())
+
+        digest.update(b'\n---schema---\n')
+
+    return digest.hexdigest()
+
+
+def compile_schema(pge_schema_file, sas_schema_file=None):
+    """
+    Compiles the Yamale schema of the PGE portion of a RunConfig, linking in
+    the schema of the SAS portion, if provided, as the "sas_configuration"
+    include referenced by the PGE schema.
+
+    Parameters
+    ----------
+    pge_schema_file : str
+        Path to the Yamale schema for the PGE portion of the RunConfig.
+    sas_schema_file : str, optional
+        Path to the Yamale schema for the SAS portion of the RunConfig.
+
+    Returns
+    -------
+    schema : yamale.schema.Schema
+        The compiled schema.
+
+    """
+    pge_schema = yamale.make_schema(pge_schema_file)
+
+    if sas_schema_file:
+        # Note that the key name "sas_configuration" must match the include
+        # reference in the base PGE schema.
+        pge_schema.includes['sas_configuration'] = yamale.make_schema(sas_schema_file)
+
+    return pge_schema
+
+
+def _is_trusted(path):
+    """
+    Returns True if the provided path is owned by the current user, and is
+    neither group nor world writable, so that its contents could only have been
+    written by the current user.
+    """
+    try:
+        path_stat = os.lstat(path)
+    except OSError:
+        return False
+
+    is_owned = path_stat.st_uid == os.geteuid()
+    is_writable_by_others = bool(path_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH))
+
+    return is_owned and not is_writable_by_others
+
+
+def _is_trusted_entry(cache_dir, filename):
+    """Returns True if both the on-disk cache directory and an entry within it are trusted."""
+    return _is_trusted(cache_dir) and _is_trusted(join(cache_dir, filename))
+
+
+def _load_from_disk(cache_dir, digest):
+    """
+    Returns the compiled schema held by the on-disk cache, or None if it is
+    absent, unreadable or untrusted.
+    """
+    filename = digest + SCHEMA_CACHE_EXTENSION
+
+    if not _is_trusted_entry(cache_dir, filename):
+        return None
+
+    try:
+        with open(join(cache_dir, filename), 'rb') as infile:
+            return pickle.load(infile)
+    except (OSError, pickle.UnpicklingError, AttributeError, EOFError, ImportError):
+        return None
+
+
+def _load_validator_from_disk(cache_dir, digest):
+    """
+    Returns the generated validator held by the on-disk cache, or None if it is
+    absent, unreadable or untrusted.
+    """
+    filename = digest + VALIDATOR_CACHE_EXTENSION
+    validator_filename = join(cache_dir, filename)
+
+    if not _is_trusted_entry(cache_dir, filename):
+        return None
+
+    try:
+        with open(validator_filename, 'r', encoding='utf-8') as infile:
+            return load_validator(infile.read(), validator_filename)
+    except (OSError, SyntaxError, NameError, KeyError):
+        return None
+
+
+def _write_to_disk(cache_dir, filename, contents):
+    """
+    Writes a file to the on-disk cache, ignoring any failure to do so. Nothing
+    is written to an untrusted cache directory, as it would never be loaded.
+    """
+    try:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+
+        if not _is_trusted(cache_dir):
+            return
+
+        # Write to a temporary file which is renamed into place once complete,
+        # so concurrent processes never read a partially written file
+        with tempfile.NamedTemporaryFile('wb', dir=cache_dir, suffix='.tmp', delete=False) as outfile:
+            outfile.write(contents)
+
+        os.replace(outfile.name, join(cache_dir, filename))
+    except OSError:
+        pass
+
+
+def _store_to_disk(cache_dir, digest, schema):
+    """Stores a compiled schema in the on-disk cache, ignoring any failure to do so."""
+    try:
+        contents = pickle.dumps(schema, protocol=pickle.HIGHEST_PROTOCOL)
+    except pickle.PicklingError:
+        return
+
+    _write_to_disk(cache_dir, digest + SCHEMA_CACHE_EXTENSION, contents)
+
+
+def get_schema(pge_schema_file, sas_schema_file=None, cache_dir=None):
+    """
+    Returns the compiled schema for a combination of PGE and SAS schema files,
+    compiling it only if it is not already cached.
+
+    Compiled schemas are shared, and must not be modified by the caller.
+
+    Parameters
+    ----------
+    pge_schema_file : str
+        Path to the Yamale schema for the PGE portion of the RunConfig.
+    sas_schema_file : str, optional
+        Path to the Yamale schema for the SAS portion of the RunConfig.
+    cache_dir : str, optional
+        Directory of the on-disk schema cache. Defaults to the value of the
+        OPERA_SCHEMA_CACHE_DIR environment variable, if set, otherwise only
+        the in-memory cache is used.
+
+    Returns
+    -------
+    schema : yamale.schema.Schema
+        The compiled schema. See compile_schema().
+
+    """
+    key = (_schema_file_key(pge_schema_file),
+           _schema_file_key(sas_schema_file) if sas_schema_file else None)
+
+    schema = _schema_cache.get(key)
+
+    if schema is not None:
+        return schema
+
+    cache_dir = cache_dir or os.environ.get(SCHEMA_CACHE_DIR_ENV)
+    digest = None
+
+    if cache_dir:
+        digest = _schema_content_digest(pge_schema_file, sas_schema_file)
+        schema = _load_from_disk(cache_dir, digest)
+
+    if schema is None:
+        schema = compile_schema(pge_schema_file, sas_schema_file)
+
+        if cache_dir:
+            _store_to_disk(cache_dir, digest, schema)
+
+    with _schema_cache_lock:
+        return _schema_cache.setdefault(key, schema)
+
+
+def get_validator(pge_schema_file, sas_schema_file=None, cache_dir=None):
+    """
+    Returns the generated validator for a combination of PGE and SAS schema
+    files, generating it only if it is not already cached.
+
+    Parameters
+    ----------
+    pge_schema_file : str
+        Path to the Yamale schema for the PGE portion of the RunConfig.
+    sas_schema_file : str, optional
+        Path to the Yamale schema for the SAS portion of the RunConfig.
+    cache_dir : str, optional
+        Directory of the on-disk schema cache. Defaults to the value of the
+        OPERA_SCHEMA_CACHE_DIR environment variable, if set, otherwise only
+        the in-memory cache is used.
+
+    Returns
+    -------
+    validate : callable or None
+        The validate(data, strict=True) function of the generated validator,
+        which returns the list of errors found within a parsed RunConfig,
+        exactly as reported by Yamale. None if the schema uses features not
+        supported by the schema compiler, in which case Yamale should be used.
+
+    """
+    key = (_schema_file_key(pge_schema_file),
+           _schema_file_key(sas_schema_file) if sas_schema_file else None)
+
+    if key in _validator_cache:
+        return _validator_cache[key]
+
+    cache_dir = cache_dir or os.environ.get(SCHEMA_CACHE_DIR_ENV)
+    digest = None
+    validator = None
+
+    if cache_dir:
+        digest = _schema_content_digest(pge_schema_file, sas_schema_file)
+        validator = _load_validator_from_disk(cache_dir, digest)
+
+    if validator is None:
+        try:
+            source = generate_validator_source(get_schema(pge_schema_file, sas_schema_file, cache_dir))
+        except NotImplementedError:
+            source = None
+
+        if source is not None:
+            validator = load_validator(source)
+
+            if cache_dir:
+                _write_to_disk(cache_dir, digest + VALIDATOR_CACHE_EXTENSION, source.encode('utf-8'))
+
+    with _schema_cache_lock:
+        return _validator_cache.setdefault(key, validator)
+
+
+def clear_schema_cache():
+    """
+    Clears the in-memory caches of schemas and validators. The on-disk cache,
+    if any, is unaffected.
+    """
+    with _schema_cache_lock:
+        _schema_cache.clear()
+        _validator_cache.clear()
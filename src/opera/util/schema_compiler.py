@@ -0,0 +1,547 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021, by the California Institute of Technology.
+# ALL RIGHTS RESERVED.
+# United States Government sponsorship acknowledged.
+# Any commercial use must be negotiated with the Office of Technology Transfer
+# at the California Institute of Technology.
+# This software may be subject to U.S. export control laws and regulations.
+# By accepting this document, the user agrees to comply with all applicable
+# U.S. export laws and regulations. User has the responsibility to obtain
+# export licenses, or other export authority as may be required, before
+# exporting such information to foreign countries or providing access to
+# foreign persons.
+#
+
+"""
+==================
+schema_compiler.py
+==================
+
+Code generation of fast validators from compiled Yamale schemas.
+
+Yamale validates a document by interpreting its schema: each node of the
+document is dispatched on the type of its validator, and each constraint of
+the validator is evaluated through its own object. The compiler here instead
+walks a compiled schema once, and generates the source of a Python module
+whose validate() function performs the equivalent type, constraint and
+required-field checks as straight-line code.
+
+The generated validator reports exactly the same errors, in the same order,
+as Yamale would for the same schema, so Yamale remains the reference
+implementation. Schemas using validators or constraints the compiler does not
+support raise a NotImplementedError at compile time, in which case Yamale
+should be used to validate documents against the schema.
+
+"""
+
+import itertools
+
+from yamale import validators as val
+from yamale.validators import constraints as con
+
+GENERATED_VALIDATOR_VERSION = 1
+"""Version of the generated validator code, incremented whenever the generated code changes"""
+
+_MAX_INLINE_DEPTH = 8
+"""Depth of nested schema nodes beyond which a node is validated by a separate generated function"""
+
+_TYPE_CHECKS = {
+    val.String: 'isinstance({value}, str)',
+    val.Number: 'isinstance({value}, (int, float)) and not isinstance({value}, bool)',
+    val.Integer: 'isinstance({value}, int) and not isinstance({value}, bool)',
+    val.Boolean: 'isinstance({value}, bool)',
+    val.Enum: '{value} in {enums}',
+    val.Null: '{value} is None',
+    val.Map: 'isinstance({value}, Mapping)',
+    val.List: 'isinstance({value}, Sequence) and not isinstance({value}, str)',
+    val.Include: None,
+    val.Any: None
+}
+"""Generated type check of each supported validator class, None for those accepting any value"""
+
+_ENUM_TYPES = (str, int, float, bool, type(None))
+"""Types of the enumerated values of an enum validator supported by the compiler"""
+
+_MODULE_HEADER = '''\
+"""
+Validator generated by opera.util.schema_compiler from the Yamale schema
+{schema_name}
+
+Do not edit, this module is regenerated whenever the schema changes.
+"""
+from collections.abc import Mapping, Sequence
+
+_MISSING = object()
+
+
+class _FatalValidationError(Exception):
+    def __init__(self, error):
+        super().__init__(error)
+        self.error = error
+
+
+def _join(path, key):
+    return f'{{path}}.{{key}}' if path else str(key)
+'''
+
+
+def _escape(text):
+    """Returns text escaped for use within a %-format string."""
+    return text.replace('%', '%%')
+
+
+def _indent(lines, levels=1):
+    """Returns the provided lines of code, indented by the requested number of levels."""
+    prefix = '    ' * levels
+
+    return [prefix + line if line else line for line in lines]
+
+
+class _SchemaCompiler:
+    """
+    Generates the source of a validator module from a compiled Yamale schema.
+
+    Each emitter method returns the lines of code, without indentation,
+    which append the errors of validating a value against a node of the
+    schema to a list. Paths to values within the document are tracked as
+    (is_constant, text) pairs, where text is the path itself for constant
+    paths, otherwise the expression evaluating to the path.
+
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.constants = []
+        self.functions = []
+        self._function_names = {}
+        self._counter = itertools.count()
+
+    def _new_name(self, prefix):
+        """Returns a new, unique variable name."""
+        return f'{prefix}_{next(self._counter)}'
+
+    def _add_constant(self, prefix, source):
+        """Defines a module-level constant from its source, returning its name."""
+        name = self._new_name(prefix).upper()
+        self.constants.append(f'{name} = {source}')
+        return name
+
+    @staticmethod
+    def _path_expr(path):
+        """Returns the expression evaluating to a path."""
+        is_constant, text = path
+        return repr(text) if is_constant else text
+
+    def _child_path(self, path, key):
+        """Returns the path to a (constant) key within the value at path."""
+        is_constant, text = path
+
+        if is_constant:
+            return True, f'{text}.{key}' if text else str(key)
+
+        return False, f'_join({text}, {key!r})'
+
+    def _bind_path(self, path, lines):
+        """
+        Returns a path which may be evaluated repeatedly, assigning it to a
+        variable first if it is an expression rather than a constant or a name.
+        """
+        is_constant, text = path
+
+        if is_constant or text.isidentifier():
+            return path
+
+        name = self._new_name('path')
+        lines.append(f'{name} = {text}')
+
+        return False, name
+
+    def compile(self):
+        """Returns the source of the validator module for the schema."""
+        body = self._emit_node(self.schema, self.schema._schema, 'data', (True, ''),
+                               'errors', 'strict', depth=0)
+
+        lines = _MODULE_HEADER.format(schema_name=self.schema.name).splitlines()
+
+        if self.constants:
+            lines += ['', ''] + self.constants
+
+        for function in self.functions:
+            lines += ['', ''] + function
+
+        lines += ['', '',
+                  'def validate(data, strict=True):',
+                  '    """Returns the list of errors of validating the data, empty if valid."""',
+                  '    errors = []',
+                  '',
+                  '    try:']
+        lines += _indent(body or ['pass'], 2)
+        lines += ['    except _FatalValidationError as error:',
+                  '        return [error.error]',
+                  '',
+                  '    return errors',
+                  '']
+
+        return '\n'.join(lines)
+
+    def _function_for(self, schema, node):
+        """
+        Returns the name of the generated function validating a node of a
+        schema, generating the function on first use.
+        """
+        key = (id(schema), id(node))
+
+        if key not in self._function_names:
+            name = self._new_name('_validate')
+            self._function_names[key] = name
+
+            body = self._emit_node(schema, node, 'data', (False, 'path'), 'errors',
+                                   'strict', depth=0)
+
+            function = [f'def {name}(data, path, strict):', '    errors = []']
+            function.extend(_indent(body))
+            function.append('    return errors')
+
+            self.functions.append(function)
+
+        return self._function_names[key]
+
+    def _emit_node(self, schema, node, value, path, errors, strict, depth):
+        """Emits the validation of a value against any node of a schema."""
+        if depth > _MAX_INLINE_DEPTH:
+            function_name = self._function_for(schema, node)
+            return [f'{errors}.extend({function_name}({value}, {self._path_expr(path)}, {strict}))']
+
+        if isinstance(node, dict):
+            return self._emit_static_map(schema, node, value, path, errors, strict, depth)
+
+        if isinstance(node, list):
+            return self._emit_static_list(schema, node, value, path, errors, strict, depth)
+
+        if isinstance(node, val.Validator):
+            return self._emit_validator(schema, node, value, path, errors, strict, depth)
+
+        raise NotImplementedError(f'Unsupported schema node {node!r}')
+
+    def _emit_static_map(self, schema, node, value, path, errors, strict, depth):
+        """Emits the validation of a value against a static map of a schema."""
+        for key in node:
+            if not isinstance(key, (str, int)):
+                raise NotImplementedError(f'Unsupported schema key {key!r}')
+
+        lines = [f'if not isinstance({value}, Mapping):',
+                 f'    {errors}.append("%s : \'%s\' is not a map" % ({self._path_expr(path)}, {value}))',
+                 'else:']
+
+        body = []
+        path = self._bind_path(path, body)
+
+        # Keys are listed in schema order, so the generated source is reproducible
+        keys = self._add_constant('keys', f'frozenset({tuple(node)!r})')
+        key_name = self._new_name('key')
+
+        body += [f'if {strict}:',
+                 f'    for {key_name} in set({value}.keys()) - {keys}:',
+                 f'        {errors}.append("%s: Unexpected element" % '
+                 f'_join({self._path_expr(path)}, {key_name}))']
+
+        for key, sub_node in node.items():
+            item = self._new_name('value')
+            item_path = self._child_path(path, key)
+
+            item_checks = self._emit_node(schema, sub_node, item, item_path, errors,
+                                          strict, depth + 1)
+
+            body.append(f'{item} = {value}.get({key!r}, _MISSING)')
+
+            if self._is_optional(sub_node):
+                if item_checks:
+                    body += [f'if {item} is not _MISSING:'] + _indent(item_checks)
+            else:
+                body += [f'if {item} is _MISSING:',
+                         f'    {self._missing_error(item_path, errors)}']
+
+                if item_checks:
+                    body += ['else:'] + _indent(item_checks)
+
+        return lines + _indent(body)
+
+    def _emit_static_list(self, schema, node, value, path, errors, strict, depth):
+        """Emits the validation of a value against a static list of a schema."""
+        lines = [f'if not (isinstance({value}, Sequence) and not isinstance({value}, str)):',
+                 f'    {errors}.append("%s : \'%s\' is not a list" % ({self._path_expr(path)}, {value}))',
+                 'else:']
+
+        body = []
+        path = self._bind_path(path, body)
+
+        keys = self._add_constant('keys', f'frozenset(range({len(node)}))')
+        key_name = self._new_name('key')
+
+        body += [f'if {strict}:',
+                 f'    for {key_name} in set(range(len({value}))) - {keys}:',
+                 f'        {errors}.append("%s: Unexpected element" % '
+                 f'_join({self._path_expr(path)}, {key_name}))']
+
+        for index, sub_node in enumerate(node):
+            item = self._new_name('value')
+            item_path = self._child_path(path, index)
+
+            item_checks = self._emit_node(schema, sub_node, item, item_path, errors,
+                                          strict, depth + 1)
+
+            if self._is_optional(sub_node):
+                if item_checks:
+                    body += [f'if len({value}) > {index}:',
+                             f'    {item} = {value}[{index}]'] + _indent(item_checks)
+            else:
+                body += [f'if len({value}) <= {index}:',
+                         f'    {self._missing_error(item_path, errors)}']
+
+                if item_checks:
+                    body += ['else:', f'    {item} = {value}[{index}]'] + _indent(item_checks)
+
+        return lines + _indent(body)
+
+    @staticmethod
+    def _is_optional(node):
+        """Returns True if a node of a schema may be absent from the validated value."""
+        return isinstance(node, val.Validator) and node.is_optional
+
+    def _missing_error(self, path, errors):
+        """Emits the reporting of a required node of a schema absent from the validated value."""
+        return f'{errors}.append("%s: Required field missing" % {self._path_expr(path)})'
+
+    def _emit_primitive(self, validator, value, path, prefix, errors, nested=()):
+        """
+        Emits the type and constraint checks of a validator, the equivalent of
+        Validator.validate(), followed by any nested checks, which are only
+        performed once the type and constraint checks have succeeded.
+
+        The message of each error is prefixed by the provided format string,
+        which receives the path.
+        """
+        validator_class = type(validator)
+
+        if validator_class not in _TYPE_CHECKS:
+            raise NotImplementedError(f'Unsupported validator {validator!r}')
+
+        type_check = _TYPE_CHECKS[validator_class]
+        fail_format = None
+
+        if validator_class is val.Enum:
+            if not all(isinstance(enum, _ENUM_TYPES) for enum in validator.enums):
+                raise NotImplementedError(f'Unsupported enum values {validator.enums!r}')
+
+            enums = self._add_constant('enums', repr(tuple(validator.enums)))
+            type_check = type_check.format(value=value, enums=enums)
+            fail_format = f"'%s' not in {_escape(str(validator.enums))}"
+        elif type_check:
+            type_check = type_check.format(value=value)
+            fail_format = f"'%s' is not a {_escape(str(validator.get_name()))}."
+
+        body = self._emit_constraints(validator, value, path, prefix, errors)
+
+        if nested and body:
+            num_errors = self._new_name('num_errors')
+            body = [f'{num_errors} = len({errors})', *body,
+                    f'if len({errors}) == {num_errors}:', *_indent(nested)]
+        else:
+            body += nested
+
+        if not type_check:
+            return body
+
+        lines = [f'if not ({type_check}):',
+                 f'    {errors}.append({prefix + fail_format!r} % ({self._path_expr(path)}, {value}))']
+
+        if body:
+            lines.append('else:')
+            lines.extend(_indent(body))
+
+        return lines
+
+    def _emit_constraints(self, validator, value, path, prefix, errors):
+        """Emits the checks of the (active) constraints of a validator."""
+        lines = []
+        path_expr = self._path_expr(path)
+
+        for constraint in validator._constraints_inst:
+            if not constraint.is_active:
+                continue
+
+            constraint_class = type(constraint)
+
+            if constraint_class is con.Min:
+                check, bound, fail = f'{constraint.min!r} <= {value}', constraint.min, '%s is less than '
+            elif constraint_class is con.Max:
+                check, bound, fail = f'{constraint.max!r} >= {value}', constraint.max, '%s is greater than '
+            elif constraint_class is con.LengthMin:
+                check, bound, fail = f'{constraint.min!r} <= len({value})', constraint.min, 'Length of %s is less than '
+            elif constraint_class is con.LengthMax:
+                check, bound = f'{constraint.max!r} >= len({value})', constraint.max
+                fail = 'Length of %s is greater than '
+            elif constraint_class is con.Key:
+                key_name = self._new_name('key')
+                key_checks = self._emit_primitive(constraint.key, key_name, path,
+                                                  prefix + 'Key error - ', errors)
+
+                if key_checks:
+                    lines += [f'for {key_name} in {value}.keys():'] + _indent(key_checks)
+
+                continue
+            else:
+                raise NotImplementedError(f'Unsupported constraint {constraint_class.__name__} '
+                                          f'of validator {validator!r}')
+
+            # Bounds of other types (such as dates) have no suitable literal
+            if type(bound) not in (int, float):
+                raise NotImplementedError(f'Unsupported constraint bound {bound!r}')
+
+            fail_format = prefix + fail + _escape(str(bound))
+
+            lines += [f'if not ({check}):',
+                      f'    {errors}.append({fail_format!r} % ({path_expr}, {value}))']
+
+        return lines
+
+    def _emit_validator(self, schema, validator, value, path, errors, strict, depth):
+        """Emits the validation of a value against a validator, the equivalent of Schema._validate()."""
+        # The path is only bound to a variable if it is used by nested checks,
+        # otherwise it is only evaluated when reporting an error
+        path_lines = []
+        bound_path = self._bind_path(path, path_lines)
+
+        validator_class = type(validator)
+        nested = []
+
+        if validator_class is val.Include:
+            nested = self._emit_include(schema, validator, value, bound_path, errors, strict)
+        elif validator_class in (val.Map, val.List):
+            nested = self._emit_map_list(schema, validator, value, bound_path, errors, strict, depth)
+        elif validator_class is val.Any:
+            nested = self._emit_any(schema, validator, value, bound_path, errors, strict, depth)
+
+        if nested:
+            path = bound_path
+        else:
+            path_lines = []
+
+        lines = self._emit_primitive(validator, value, path, '%s: ', errors, nested)
+
+        if lines and validator.is_optional and validator.can_be_none:
+            lines = [f'if {value} is not None:'] + _indent(lines)
+
+        return path_lines + lines
+
+    def _emit_include(self, schema, validator, value, path, errors, strict):
+        """Emits the validation of a value against the schema referenced by an include."""
+        include_schema = schema.includes.get(validator.include_name)
+
+        if not include_schema:
+            message = f"Include '{validator.include_name}' has not been defined."
+            return [f'raise _FatalValidationError({message!r})']
+
+        strict = strict if validator.strict is None else repr(bool(validator.strict))
+        function_name = self._function_for(include_schema, include_schema._schema)
+
+        return [f'{errors}.extend({function_name}({value}, {self._path_expr(path)}, {strict}))']
+
+    def _emit_alternatives(self, schema, validators, value, path, errors, strict, depth):
+        """
+        Emits the validation of a value against several validators, where
+        errors are only reported if the value fails every validator.
+        """
+        if len(validators) == 1:
+            return self._emit_node(schema, validators[0], value, path, errors, strict, depth + 1)
+
+        lines = []
+        path = self._bind_path(path, lines)
+        sub_errors = []
+
+        for validator in validators:
+            sub_errors.append(self._new_name('sub_errors'))
+            lines.append(f'{sub_errors[-1]} = []')
+            lines += self._emit_node(schema, validator, value, path, sub_errors[-1],
+                                     strict, depth + 1)
+
+        lines.append(f'if {" and ".join(sub_errors)}:')
+        lines += _indent([f'{errors}.extend({name})' for name in sub_errors])
+
+        return lines
+
+    def _emit_map_list(self, schema, validator, value, path, errors, strict, depth):
+        """Emits the validation of each item of a map or list against the validators of the map or list."""
+        if not validator.validators:
+            return []
+
+        key_name = self._new_name('key')
+        item = self._new_name('value')
+        items = f'{value}.items()' if isinstance(validator, val.Map) else f'enumerate({value})'
+
+        body = self._emit_alternatives(schema, validator.validators, item,
+                                       (False, f'_join({self._path_expr(path)}, {key_name})'),
+                                       errors, strict, depth)
+
+        return [f'for {key_name}, {item} in {items}:'] + _indent(body or ['pass'])
+
+    def _emit_any(self, schema, validator, value, path, errors, strict, depth):
+        """Emits the validation of a value against the validators of an any validator."""
+        if not validator.validators:
+            return []
+
+        return self._emit_alternatives(schema, validator.validators, value, path,
+                                       errors, strict, depth)
+
+
+def generate_validator_source(schema):
+    """
+    Generates the source of a Python module which validates documents
+    against a compiled Yamale schema.
+
+    The module defines a single public function, validate(data, strict=True),
+    which returns the list of errors found within the provided document,
+    exactly as Yamale would report them via Schema.validate().
+
+    Parameters
+    ----------
+    schema : yamale.schema.Schema
+        The compiled schema, including any schemas linked in as includes.
+
+    Returns
+    -------
+    source : str
+        The source of the generated module.
+
+    Raises
+    ------
+    NotImplementedError
+        If the schema uses a validator or constraint not supported by the
+        compiler.
+
+    """
+    return _SchemaCompiler(schema).compile()
+
+
+def load_validator(source, filename='<generated validator>'):
+    """
+    Loads the validate() function of a generated validator module.
+
+    Parameters
+    ----------
+    source : str
+        The source of the module, as returned by generate_validator_source().
+    filename : str, optional
+        File name to associate with the module, as shown by tracebacks.
+
+    Returns
+    -------
+    validate : callable
+        The validate(data, strict=True) function of the module.
+
+    """
+    namespace = {'__name__': 'opera.util.generated_validator'}
+    exec(compile(source, filename, 'exec'), namespace)
+
+    return namespace['validate']
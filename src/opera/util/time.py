@@ -26,9 +26,21 @@ Adapted By: Scott Collins
 
 """
 
+import functools
+import time
 from datetime import datetime
 
 
+@functools.lru_cache(maxsize=1)
+def _format_iso_second(seconds):
+    """
+    Formats the date/time prefix of an ISO-format time-tag for the provided
+    whole second since the epoch. Only the most recently formatted second is
+    cached.
+    """
+    return datetime.fromtimestamp(seconds).isoformat(sep='T', timespec='seconds')
+
+
 def get_current_iso_time():
     """
     Returns current time in ISO format, including trailing "Z" to indicate
@@ -45,6 +57,50 @@ def get_current_iso_time():
     return time_in_iso
 
 
+def get_iso_time_from_ns(time_ns):
+    """
+    Converts the provided time, in nanoseconds since the epoch, to an ISO-format
+    time-tag equivalent to that returned by get_iso_time().
+
+    The formatted date/time prefix of the most recently converted second is
+    cached, such that only the microseconds need be formatted for subsequent
+    times within the same second.
+
+    Parameters
+    ----------
+    time_ns : int
+        Time to convert, in nanoseconds since the epoch, such as returned by
+        time.time_ns().
+
+    Returns
+    -------
+    time_in_iso : str
+        Provided time in ISO format: YYYY-MM-DDTHH:MM:SS.mmmmmmZ
+
+    """
+    seconds, nanoseconds = divmod(time_ns, 1_000_000_000)
+
+    return f'{_format_iso_second(seconds)}.{nanoseconds // 1000:06d}Z'
+
+
+def get_current_iso_time_cached():
+    """
+    Returns current time in ISO format, including trailing "Z" to indicate
+    Zulu (GMT) time.
+
+    This function is equivalent to get_current_iso_time(), but reuses the
+    formatted date/time prefix of the current second, making it suitable for
+    time-tagging bursts of log messages.
+
+    Returns
+    -------
+    time_in_iso : str
+        Current time in ISO format: YYYY-MM-DDTHH:MM:SS.mmmmmmZ
+
+    """
+    return get_iso_time_from_ns(time.time_ns())
+
+
 def get_iso_time(dt):
     """
     Converts the provided datetime object to an ISO-format time-tag.
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021, by the California Institute of Technology.
+# ALL RIGHTS RESERVED.
+# United States Government sponsorship acknowledged.
+# Any commercial use must be negotiated with the Office of Technology Transfer
+# at the California Institute of Technology.
+# This software may be subject to U.S. export control laws and regulations.
+# By accepting this document, the user agrees to comply with all applicable
+# U.S. export laws and regulations. User has the responsibility to obtain
+# export licenses, or other export authority as may be required, before
+# exporting such information to foreign countries or providing access to
+# foreign persons.
+#
+
+"""
+========
+trace.py
+========
+
+Recording of the timeline of a PGE run as Chrome trace events.
+
+The written trace files use the JSON object format of the Trace Event Format,
+and may be opened with chrome://tracing or https://ui.perfetto.dev to view
+the spans of each PGE phase and step, the lifetime of the SAS subprocess, and
+the resource usage of the SAS over time.
+
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+TRACE_SAMPLE_FIELDS = ('rss_kb', 'cpu_seconds', 'num_processes', 'num_threads',
+                       'read_bytes', 'write_bytes')
+"""Fields of the samples of a ProcessTreeSampler which are recorded as counter tracks"""
+
+
+def _to_trace_time(monotonic_time):
+    """Converts a time.monotonic() value, in seconds, to a trace timestamp, in microseconds"""
+    return round(monotonic_time * 1e6, 3)
+
+
+class TraceRecorder:
+    """
+    Thread-safe recorder of trace events.
+
+    Timestamps are taken from time.monotonic(), which is shared by all
+    processes on a node, so the events recorded by several processes may be
+    merged into a single, consistent timeline (see add_events()).
+
+    """
+
+    def __init__(self, pid=None, process_name=None):
+        """
+        Creates a new instance of TraceRecorder
+
+        Parameters
+        ----------
+        pid : int, optional
+            Process ID to record events under, which determines the track the
+            events are grouped within when viewed. Defaults to the ID of the
+            current process.
+        process_name : str, optional
+            Name to label the track of the process with.
+
+        """
+        self.pid = pid if pid is not None else os.getpid()
+        self.events = []
+        self._thread_ids = set()
+        self._lock = threading.Lock()
+
+        if process_name:
+            self._add_event({'name': 'process_name', 'ph': 'M', 'pid': self.pid,
+                             'args': {'name': process_name}})
+
+    def _add_event(self, event):
+        """Records an event, along with the name of the current thread on first use."""
+        with self._lock:
+            if 'tid' in event and event['tid'] not in self._thread_ids:
+                self._thread_ids.add(event['tid'])
+                self.events.append({'name': 'thread_name', 'ph': 'M', 'pid': self.pid,
+                                    'tid': event['tid'],
+                                    'args': {'name': threading.current_thread().name}})
+
+            self.events.append(event)
+
+    def add_complete_event(self, name, start_time, end_time, category='pge', args=None):
+        """
+        Records a span of time on the track of the current thread.
+
+        Parameters
+        ----------
+        name : str
+            Name of the span.
+        start_time : float
+            Start of the span, as returned by time.monotonic().
+        end_time : float
+            End of the span, as returned by time.monotonic().
+        category : str, optional
+            Category of the span.
+        args : dict, optional
+            Any additional information to attach to the span.
+
+        """
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': _to_trace_time(start_time),
+            'dur': _to_trace_time(end_time - start_time),
+            'pid': self.pid,
+            'tid': threading.get_native_id()
+        }
+
+        if args:
+            event['args'] = args
+
+        self._add_event(event)
+
+    @contextlib.contextmanager
+    def span(self, name, category='pge', **args):
+        """
+        Context manager which records its body as a span, whether or not the
+        body completes successfully, e.g.:
+
+            with trace.span('run_preprocessor'):
+                ...
+
+        Parameters
+        ----------
+        name : str
+            Name of the span.
+        category : str, optional
+            Category of the span.
+        args : dict
+            Any additional information to attach to the span. The dictionary
+            may be updated within the body of the span.
+
+        """
+        start_time = time.monotonic()
+
+        try:
+            yield args
+        finally:
+            self.add_complete_event(name, start_time, time.monotonic(), category, args)
+
+    def add_counter_event(self, name, timestamp, values):
+        """
+        Records the values of a counter track at a point in time.
+
+        Parameters
+        ----------
+        name : str
+            Name of the counter track.
+        timestamp : float
+            Time of the values, as returned by time.monotonic().
+        values : dict
+            Values of each series of the counter track, keyed by series name.
+
+        """
+        self._add_event({'name': name, 'ph': 'C', 'ts': _to_trace_time(timestamp),
+                         'pid': self.pid, 'args': values})
+
+    def add_resource_samples(self, sampler, prefix='sas'):
+        """
+        Records the samples taken by a ProcessTreeSampler as counter tracks,
+        one per sampled quantity.
+
+        Parameters
+        ----------
+        sampler : ProcessTreeSampler
+            The sampler to record the samples of.
+        prefix : str, optional
+            Prefix of the names of the counter tracks.
+
+        """
+        for sample in sampler.samples:
+            timestamp = sampler.start_time + sample['elapsed_seconds']
+
+            for field in TRACE_SAMPLE_FIELDS:
+                self.add_counter_event(f'{prefix}.{field}', timestamp, {field: sample[field]})
+
+    def add_events(self, events):
+        """
+        Merges events recorded elsewhere, such as by another process, into
+        this recorder.
+
+        Parameters
+        ----------
+        events : list of dict
+            The events to merge, as held by the events attribute of another
+            TraceRecorder.
+
+        """
+        with self._lock:
+            self.events.extend(events)
+
+    def write(self, filename):
+        """
+        Writes the recorded events to a trace file.
+
+        Parameters
+        ----------
+        filename : str
+            Path to the trace file to write.
+
+        """
+        with self._lock:
+            events = list(self.events)
+
+        with open(filename, 'w', encoding='utf-8') as outfile:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, outfile)
+
+
+def trace_span(trace, name, category='pge', **args):
+    """
+    Returns a context manager recording a span with the provided recorder, or
+    a context manager which does nothing if no recorder is provided.
+
+    Parameters
+    ----------
+    trace : TraceRecorder or None
+        The recorder to record the span with, if any.
+    name : str
+        Name of the span.
+    category : str, optional
+        Category of the span.
+    args : dict
+        Any additional information to attach to the span.
+
+    """
+    if trace is None:
+        return contextlib.nullcontext(args)
+
+    return trace.span(name, category, **args)
@@ -26,8 +26,29 @@ Adapted By: Scott Collins
 
 """
 
+import csv
 import os
 import resource
+import threading
+import time
+
+_CLOCK_TICKS_PER_SECOND = os.sysconf('SC_CLK_TCK')
+"""Number of clock ticks per second used by the CPU times in /proc/<pid>/stat"""
+
+_PAGE_SIZE_KB = resource.getpagesize() // 1024
+"""Size of a memory page, in kilobytes"""
+
+RESOURCE_SAMPLE_FIELDS = ['elapsed_seconds', 'num_processes', 'rss_kb',
+                          'cpu_seconds', 'num_threads', 'read_bytes', 'write_bytes']
+"""Fields recorded for each sample taken by ProcessTreeSampler"""
+
+RESOURCE_SAMPLE_GAUGES = ['num_processes', 'rss_kb', 'num_threads']
+"""Sampled fields which measure the current state of the process tree"""
+
+RESOURCE_SAMPLE_COUNTERS = {'cpu_seconds': 'cpu_utilization',
+                            'read_bytes': 'read_bytes_per_second',
+                            'write_bytes': 'write_bytes_per_second'}
+"""Sampled fields which accumulate over the life of the process tree, mapped to the name of their rate"""
 
 
 def get_os_metrics():
@@ -103,7 +124,7 @@ def get_self_peak_vmm_kb():
     if not os.path.exists(status_file) or not os.path.isfile(status_file):
         return 'file_not_found: {}'.format(status_file)
 
-    with open(status_file, 'r') as infile:
+    with open(status_file, 'r', encoding='utf-8') as infile:
         for line in infile.readlines():
             if line.startswith('VmPeak:'):
                 vm_peak_str = line.replace('VmPeak:', '').replace('kB', '')
@@ -111,3 +132,384 @@ def get_self_peak_vmm_kb():
                 break
 
     return vm_peak_kb
+
+
+def _read_proc_stat(pid):
+    """
+    Reads the fields of interest from /proc/<pid>/stat for the provided
+    process ID.
+
+    Parameters
+    ----------
+    pid : int
+        ID of the process to read the stat file of.
+
+    Returns
+    -------
+    stat : dict or None
+        Dictionary containing the process name, state, parent process ID, CPU
+        time (in seconds), thread count and resident set size (in kilobytes)
+        of the process, or None if the stat file could not be read (typically
+        because the process has already exited).
+
+    """
+    try:
+        with open(os.path.join(os.sep, 'proc', str(pid), 'stat'), 'r', encoding='utf-8') as infile:
+            contents = infile.read()
+    except OSError:
+        return None
+
+    # The process name is enclosed in parentheses and may itself contain
+    # spaces or parentheses, so split the remaining fields after the last one
+    name_start = contents.find('(')
+    name_end = contents.rfind(')')
+    fields = contents[name_end + 2:].split()
+
+    return {
+        'name': contents[name_start + 1:name_end],
+        'state': fields[0],
+        'ppid': int(fields[1]),
+        'cpu_seconds': (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS_PER_SECOND,
+        'num_threads': int(fields[17]),
+        'rss_kb': int(fields[21]) * _PAGE_SIZE_KB
+    }
+
+
+def _read_proc_io(pid):
+    """
+    Reads the storage I/O byte counts from /proc/<pid>/io for the provided
+    process ID.
+
+    Parameters
+    ----------
+    pid : int
+        ID of the process to read the I/O statistics of.
+
+    Returns
+    -------
+    read_bytes, write_bytes : tuple of int
+        Number of bytes the process caused to be read from and written to
+        storage. Both values are 0 if the statistics are not available.
+
+    """
+    read_bytes = write_bytes = 0
+
+    try:
+        with open(os.path.join(os.sep, 'proc', str(pid), 'io'), 'r', encoding='utf-8') as infile:
+            for line in infile:
+                if line.startswith('read_bytes:'):
+                    read_bytes = int(line.split()[1])
+                elif line.startswith('write_bytes:'):
+                    write_bytes = int(line.split()[1])
+    except OSError:
+        pass
+
+    return read_bytes, write_bytes
+
+
+def _read_proc_children(pid):
+    """
+    Reads the IDs of the child processes of the provided process ID from
+    /proc/<pid>/task/<tid>/children, across all threads of the process.
+
+    Parameters
+    ----------
+    pid : int
+        ID of the process to read the children of.
+
+    Returns
+    -------
+    children : list of int or None
+        IDs of the child processes, or None if the children files are not
+        provided by the kernel (they require CONFIG_PROC_CHILDREN). An empty
+        list is returned if the process has already exited.
+
+    """
+    task_dir = os.path.join(os.sep, 'proc', str(pid), 'task')
+    children = []
+
+    try:
+        task_ids = os.listdir(task_dir)
+    except OSError:
+        return children
+
+    for task_id in task_ids:
+        try:
+            with open(os.path.join(task_dir, task_id, 'children'), 'r', encoding='utf-8') as infile:
+                children.extend(int(child_pid) for child_pid in infile.read().split())
+        except FileNotFoundError:
+            # The task may have exited since the directory was listed, but if
+            # the children file of a live task is missing, it is unsupported
+            if os.path.isdir(os.path.join(task_dir, task_id)):
+                return None
+        except OSError:
+            pass
+
+    return children
+
+
+def _scan_process_tree(root_pid):
+    """
+    Returns the process tree rooted at the provided process ID by reading the
+    stat file of every process on the system. Used by get_process_tree() when
+    the kernel does not provide the children of each process directly.
+    """
+    all_stats = {}
+
+    for entry in os.listdir(os.path.join(os.sep, 'proc')):
+        if entry.isdigit():
+            stat = _read_proc_stat(int(entry))
+
+            if stat is not None:
+                all_stats[int(entry)] = stat
+
+    children_by_ppid = {}
+
+    for pid, stat in all_stats.items():
+        children_by_ppid.setdefault(stat['ppid'], []).append(pid)
+
+    process_tree = {}
+    pending = [root_pid]
+
+    while pending:
+        pid = pending.pop()
+
+        if pid in all_stats and pid not in process_tree:
+            process_tree[pid] = all_stats[pid]
+            pending.extend(children_by_ppid.get(pid, []))
+
+    return process_tree
+
+
+def get_process_tree(root_pid):
+    """
+    Returns the IDs of the provided process and all of its descendants.
+
+    The tree is walked downwards from the root process via the children
+    files of /proc/<pid>/task/<tid>, so only the processes within the tree
+    are read. On kernels which do not provide these files, the stat file of
+    every process on the system is read instead.
+
+    Parameters
+    ----------
+    root_pid : int
+        ID of the process at the root of the tree.
+
+    Returns
+    -------
+    process_tree : dict
+        Mapping of process ID to the stat fields returned by _read_proc_stat()
+        for each live process within the tree.
+
+    """
+    process_tree = {}
+    pending = [root_pid]
+
+    while pending:
+        pid = pending.pop()
+
+        if pid in process_tree:
+            continue
+
+        stat = _read_proc_stat(pid)
+
+        if stat is None:
+            continue
+
+        children = _read_proc_children(pid)
+
+        if children is None:
+            return _scan_process_tree(root_pid)
+
+        process_tree[pid] = stat
+        pending.extend(children)
+
+    return process_tree
+
+
+class ProcessTreeSampler:
+    """
+    Periodically samples the resource usage of a process and all of its
+    descendants from a background thread.
+
+    Each sample records the totals across all live processes within the tree
+    at the time of sampling. Note that CPU time and I/O bytes of descendants
+    that exit between samples are not retained once they exit.
+
+    """
+
+    def __init__(self, pid, interval=1.0):
+        """
+        Creates a new sampler for the process tree rooted at the provided
+        process ID. Sampling does not begin until start() is called.
+
+        Parameters
+        ----------
+        pid : int
+            ID of the process at the root of the tree to sample.
+        interval : float, optional
+            Time, in seconds, between samples.
+
+        """
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self.peak_rss_by_process = {}
+
+        self._start_time = None
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name=f'ProcessTreeSampler-{pid}', daemon=True
+        )
+
+    @property
+    def start_time(self):
+        """Monotonic time at which sampling began, or None if not yet started."""
+        return self._start_time
+
+    def start(self):
+        """
+        Begins sampling within the background thread.
+
+        The first sample is taken before this method returns, so a sample is
+        recorded even for short-lived processes, provided they have yet to
+        exit by the time sampling begins.
+
+        """
+        self._start_time = time.monotonic()
+        self.sample()
+        self._thread.start()
+
+    def stop(self):
+        """Stops sampling and waits for the background thread to exit."""
+        self._stop_event.set()
+
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        """Sampling loop executed by the background thread."""
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        """
+        Takes a single sample of the resource usage of the process tree.
+
+        Returns
+        -------
+        sample : dict or None
+            The recorded sample, keyed by the names in RESOURCE_SAMPLE_FIELDS,
+            or None if no process within the tree is alive.
+
+        """
+        # Zombies have exited and released their resources, they just have
+        # yet to be reaped by their parent
+        process_tree = {pid: stat for pid, stat in get_process_tree(self.pid).items()
+                        if stat['state'] != 'Z'}
+
+        if not process_tree:
+            return None
+
+        sample = dict.fromkeys(RESOURCE_SAMPLE_FIELDS, 0)
+        sample['elapsed_seconds'] = time.monotonic() - self._start_time
+        sample['num_processes'] = len(process_tree)
+
+        for pid, stat in process_tree.items():
+            sample['rss_kb'] += stat['rss_kb']
+            sample['cpu_seconds'] += stat['cpu_seconds']
+            sample['num_threads'] += stat['num_threads']
+
+            read_bytes, write_bytes = _read_proc_io(pid)
+            sample['read_bytes'] += read_bytes
+            sample['write_bytes'] += write_bytes
+
+            if stat['rss_kb'] >= self.peak_rss_by_process.get(pid, (None, 0))[1]:
+                self.peak_rss_by_process[pid] = (stat['name'], stat['rss_kb'])
+
+        self.samples.append(sample)
+
+        return sample
+
+    def get_summary_metrics(self):
+        """
+        Summarizes the samples taken so far.
+
+        The resident set size, thread count and process count of the tree are
+        gauges, summarized by their peak and mean values. CPU time and storage
+        I/O bytes are cumulative counters, summarized by their total over the
+        sampled period, along with the mean and peak rates between samples.
+        The CPU utilization is reported as the CPU seconds consumed per
+        elapsed second, so a value of 2.0 corresponds to two busy cores.
+
+        Returns
+        -------
+        metrics : dict
+            Dictionary containing the summarized quantities, keyed as
+            sas.process_tree.<gauge>.<peak|mean>, sas.process_tree.<counter>.total
+            and sas.process_tree.<rate>.<peak|mean>, along with the number of
+            samples taken and the process with the largest resident set size
+            observed. Rates are omitted if fewer than two samples were taken.
+            Empty if no samples were taken.
+
+        """
+        metrics = {}
+
+        if not self.samples:
+            return metrics
+
+        metrics['sas.process_tree.num_samples'] = len(self.samples)
+
+        for field in RESOURCE_SAMPLE_GAUGES:
+            values = [sample[field] for sample in self.samples]
+
+            metrics[f'sas.process_tree.{field}.peak'] = max(values)
+            metrics[f'sas.process_tree.{field}.mean'] = sum(values) / len(values)
+
+        for field, rate_name in RESOURCE_SAMPLE_COUNTERS.items():
+            # Counters drop when a descendant exits and its usage is no longer
+            # visible, so only the increments between samples are accumulated
+            total = self.samples[0][field]
+            peak_rate = None
+
+            for previous, current in zip(self.samples, self.samples[1:]):
+                increment = max(current[field] - previous[field], 0)
+                interval = current['elapsed_seconds'] - previous['elapsed_seconds']
+
+                total += increment
+
+                if interval > 0:
+                    peak_rate = max(peak_rate or 0, increment / interval)
+
+            metrics[f'sas.process_tree.{field}.total'] = total
+
+            sampled_seconds = self.samples[-1]['elapsed_seconds'] - self.samples[0]['elapsed_seconds']
+
+            if peak_rate is not None and sampled_seconds > 0:
+                metrics[f'sas.process_tree.{rate_name}.peak'] = peak_rate
+                metrics[f'sas.process_tree.{rate_name}.mean'] = \
+                    (total - self.samples[0][field]) / sampled_seconds
+
+        largest_pid, (largest_name, largest_rss_kb) = max(
+            self.peak_rss_by_process.items(), key=lambda item: item[1][1]
+        )
+
+        metrics['sas.process_tree.largest_process'] = \
+            f'{largest_name} (pid {largest_pid}, {largest_rss_kb} kB)'
+
+        return metrics
+
+    def write_series(self, filename):
+        """
+        Writes the full time series of samples to a CSV file.
+
+        Parameters
+        ----------
+        filename : str
+            Path to the CSV file to write.
+
+        """
+        with open(filename, 'w', newline='', encoding='utf-8') as outfile:
+            writer = csv.DictWriter(outfile, fieldnames=RESOURCE_SAMPLE_FIELDS)
+            writer.writeheader()
+            writer.writerows(self.samples)
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021, by the California Institute of Technology.
+# ALL RIGHTS RESERVED.
+# United States Government sponsorship acknowledged.
+# Any commercial use must be negotiated with the Office of Technology Transfer
+# at the California Institute of Technology.
+# This software may be subject to U.S. export control laws and regulations.
+# By accepting this document, the user agrees to comply with all applicable
+# U.S. export laws and regulations. User has the responsibility to obtain
+# export licenses, or other export authority as may be required, before
+# exporting such information to foreign countries or providing access to
+# foreign persons.
+#
+
+"""
+==============
+warm_worker.py
+==============
+
+Utilities for running SAS programs which are Python modules as "warm workers",
+forked from a long-lived process which has already imported them, rather than
+within a freshly started Python interpreter.
+
+"""
+
+import importlib
+import os
+import runpy
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+PYTHON_MODULE_COMMAND = ['python3', '-m']
+"""Command line prefix used to invoke a SAS program which is a Python module"""
+
+WAIT_POLL_INTERVAL = 0.05
+"""Time, in seconds, between checks on the status of a forked SAS process"""
+
+_STDOUT_FILENO = 1
+"""File descriptor of the standard output of a process"""
+
+_STDERR_FILENO = 2
+"""File descriptor of the standard error of a process"""
+
+
+def preload_sas_modules(module_names):
+    """
+    Imports the provided Python modules into the current process, so that
+    SAS programs run via warm-worker mode (see run_utils.time_and_execute())
+    do not need to pay the cost of importing them for each job.
+
+    This function is suitable for use as the initializer of a worker process
+    pool, making each worker a long-lived, pre-imported host for SAS jobs.
+
+    Parameters
+    ----------
+    module_names : Iterable[str]
+        Names of the modules to import, such as the SAS program modules
+        themselves or heavy scientific dependencies (numpy, osgeo.gdal).
+        Modules which cannot be imported are reported to the standard error
+        file descriptor and skipped. The report is written to the descriptor
+        directly, since this function runs before any logger is available,
+        within processes whose sys.stderr may have been replaced.
+
+    """
+    for module_name in module_names or []:
+        try:
+            importlib.import_module(module_name)
+        except Exception as err:
+            message = f'Failed to preload module {module_name}, reason: {str(err)}\n'
+            os.write(_STDERR_FILENO, message.encode('utf-8', errors='replace'))
+
+
+class ForkedModuleProcess:
+    """
+    Runs a Python module as __main__ within a child process forked from the
+    current process.
+
+    Since the child inherits the already imported modules of the current
+    process, it avoids the interpreter start-up and import costs of invoking
+    the module via "python3 -m". Instances provide the subset of the
+    subprocess.Popen interface used by run_utils.time_and_execute().
+
+    Only the calling thread exists within the forked child, so any lock held
+    by another thread at the time of the fork would remain held forever
+    within the child. This class must therefore only be used while the
+    current process is single-threaded (see can_fork_safely()).
+
+    """
+
+    def __init__(self, module_name, args, env=None, start_new_session=False,
+                 cpu_affinity=None):
+        """
+        Forks a new child process to run the provided module.
+
+        Parameters
+        ----------
+        module_name : str
+            Name of the Python module to run.
+        args : list of str
+            Command line arguments to provide to the module via sys.argv.
+        env : dict, optional
+            Environment variables to assign to the child process. Defaults to
+            the environment of the current process.
+        start_new_session : bool, optional
+            If true, the child process is made the leader of a new session
+            (and process group).
+        cpu_affinity : Iterable[int], optional
+            If provided, the set of CPUs to restrict the child process to.
+
+        """
+        self.args = PYTHON_MODULE_COMMAND + [module_name] + list(args)
+        self.returncode = None
+
+        # Flush anything buffered for our own stdout/stderr, otherwise the
+        # child would inherit (and eventually write out) a copy of it
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        read_fd, write_fd = os.pipe()
+
+        self.pid = os.fork()
+
+        if self.pid == 0:
+            os.close(read_fd)
+            self._run_child(module_name, args, env, start_new_session, cpu_affinity, write_fd)
+
+        os.close(write_fd)
+
+        self.stdout = os.fdopen(read_fd, 'rb', buffering=0)
+
+    @staticmethod
+    def _run_child(module_name, args, env, start_new_session, cpu_affinity, write_fd):
+        """
+        Runs the module within the forked child process. Never returns.
+        """
+        exit_code = 1
+
+        try:
+            if start_new_session:
+                os.setsid()
+
+            if cpu_affinity:
+                os.sched_setaffinity(0, cpu_affinity)
+
+            # Redirect the standard output descriptors themselves, then
+            # replace sys.stdout/sys.stderr, which may have been swapped out
+            # for objects not backed by those descriptors
+            os.dup2(write_fd, _STDOUT_FILENO)
+            os.dup2(write_fd, _STDERR_FILENO)
+            os.close(write_fd)
+
+            sys.stdout = os.fdopen(_STDOUT_FILENO, 'w', encoding='utf-8', closefd=False)
+            sys.stderr = os.fdopen(_STDERR_FILENO, 'w', encoding='utf-8', errors='backslashreplace',
+                                   closefd=False)
+
+            if env is not None:
+                os.environ.clear()
+                os.environ.update(env)
+
+            sys.argv = [module_name] + list(args)
+
+            runpy.run_module(module_name, run_name='__main__', alter_sys=True)
+
+            exit_code = 0
+        except SystemExit as err:
+            if err.code is None:
+                exit_code = 0
+            elif isinstance(err.code, int):
+                exit_code = err.code
+            else:
+                print(err.code, file=sys.stderr)
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(exit_code)
+
+    def poll(self):
+        """
+        Checks if the child process has exited without blocking.
+
+        Returns
+        -------
+        returncode : int or None
+            The return code of the child process, or None if it is still
+            running. As with subprocess.Popen, a negative value -N indicates
+            the child was terminated by signal N.
+
+        """
+        if self.returncode is None:
+            pid, status = os.waitpid(self.pid, os.WNOHANG)
+
+            if pid == self.pid:
+                if os.WIFSIGNALED(status):
+                    self.returncode = -os.WTERMSIG(status)
+                else:
+                    self.returncode = os.WEXITSTATUS(status)
+
+        return self.returncode
+
+    def wait(self, timeout=None):
+        """
+        Waits for the child process to exit.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Maximum time, in seconds, to wait for.
+
+        Returns
+        -------
+        returncode : int
+            The return code of the child process.
+
+        Raises
+        ------
+        subprocess.TimeoutExpired
+            If the child process has not exited once the timeout elapses.
+
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while self.poll() is None:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise subprocess.TimeoutExpired(self.args, timeout)
+
+            time.sleep(WAIT_POLL_INTERVAL)
+
+        return self.returncode
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if self.stdout:
+            self.stdout.close()
+
+        self.wait()
+
+
+def can_fork_safely():
+    """
+    Returns whether the current process may be forked without the risk of the
+    child inheriting a lock held by another thread, such as those of the
+    write-behind journal, log forwarding or resource sampling threads.
+
+    Returns
+    -------
+    can_fork : bool
+        True if the calling thread is the only thread of the current process.
+
+    """
+    return threading.active_count() == 1